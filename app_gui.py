@@ -2,23 +2,42 @@ import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
 import threading
 import logging
-from config_service import load_config, update_bind_key, update_pause_key, update_speed, set_fishing_active, update_exit_key
+from config_service import get_config_store, update_bind_key, update_pause_key, set_fishing_active, update_exit_key
 from fishing_service import FishingManager
+from metrics import get_metrics
+from logger import BatchingSink, add_handler
 from tkinter import simpledialog
 logger = logging.getLogger("GUI")
 
+# Окно логов обновляется пачками: раз в LOG_FLUSH_MS, не больше LOG_LINES_PER_SECOND строк в секунду
+LOG_FLUSH_MS = 200
+LOG_LINES_PER_SECOND = 50
+LOG_MAX_LINES = 1000
+# Поле окна для каждого отображаемого ключа конфига
+CONFIG_FIELDS = {"bind_key": "key_var", "pause_key": "pause_var", "exit_key": "exit_var", "speed": "speed_var"}
+# Сколько окно ждёт штатной остановки сессии после клавиши выхода, мс
+EXIT_TIMEOUT_MS = 15000
+
 
 class FishingApp:
     def __init__(self, root):
         self.root = root
         self.root.title("GTA V Fishing Bot")
-        self.root.geometry("600x500")
+        self.root.geometry("600x700")
         self.root.resizable(True, True)
 
+        self.config = get_config_store()
         self.fishing_manager = FishingManager()
+        # Клавиша выхода останавливает сессию; окно закрывается, когда она завершит очистку
+        self.fishing_manager.on_exit = lambda: self.root.after(0, self.shutdown)
         self.create_widgets()
         self.setup_logging_gui()
         self.update_ui()
+        self.refresh_metrics()
+        # Изменения, сделанные не из этого окна (другой код, replay), тоже отражаются в полях —
+        # обновляется только поле изменённого ключа, несохранённый ввод в остальных не затирается
+        self.config.subscribe(lambda key, value: self.root.after(0, self.update_field, key, value),
+                              keys=tuple(CONFIG_FIELDS))
         logger.info("GUI initialized")
 
     def create_widgets(self):
@@ -69,6 +88,18 @@ class FishingApp:
                                      variable=self.speed_var, command=lambda e: self.save_speed())
         self.speed_scale.grid(row=2, column=1, columnspan=2, sticky="ew", pady=(10, 0))
 
+        metrics_frame = ttk.LabelFrame(main_frame, text="Metrics", padding=10)
+        metrics_frame.pack(fill=tk.X, pady=5)
+
+        columns = ("count", "mean", "p50", "p99")
+        self.metrics_tree = ttk.Treeview(metrics_frame, columns=columns, height=7)
+        self.metrics_tree.heading("#0", text="Stage")
+        self.metrics_tree.column("#0", width=200)
+        for column in columns:
+            self.metrics_tree.heading(column, text=column if column == "count" else f"{column}, ms")
+            self.metrics_tree.column(column, width=80, anchor=tk.E)
+        self.metrics_tree.pack(fill=tk.X)
+
         log_frame = ttk.LabelFrame(main_frame, text="Logs", padding=10)
         log_frame.pack(fill=tk.BOTH, expand=True, pady=5)
 
@@ -80,29 +111,28 @@ class FishingApp:
         status_bar.pack(side=tk.BOTTOM, fill=tk.X)
 
     def setup_logging_gui(self):
-        class TextHandler(logging.Handler):
-            def __init__(self, text_widget):
-                super().__init__()
-                self.text_widget = text_widget
-                self.setFormatter(logging.Formatter(
-                    "%(asctime)s - %(name)s - %(levelname)s - %(message)s", datefmt="%H:%M:%S"))
-                self.setLevel(logging.INFO)
-
-            def emit(self, record):
-                msg = self.format(record)
-                def append():
-                    self.text_widget.configure(state='normal')
-                    if int(self.text_widget.index('end-1c').split('.')[0]) > 1000:
-                        self.text_widget.delete(1.0, 100.0)
-                    self.text_widget.insert(tk.END, msg + "\n")
-                    self.text_widget.see(tk.END)
-                    self.text_widget.configure(state='disabled')
-                self.text_widget.after(0, append)
-
-        logging.getLogger().addHandler(TextHandler(self.log_text))
+        # Приёмник только копит записи; виджет обновляется из цикла Tk одной вставкой на пачку
+        self.log_sink = BatchingSink(logging.INFO)
+        add_handler(self.log_sink)
+        self.flush_logs()
+
+    def flush_logs(self):
+        lines = self.log_sink.drain(max(1, LOG_LINES_PER_SECOND * LOG_FLUSH_MS // 1000))
+        if lines:
+            self.log_text.configure(state='normal')
+            self.log_text.insert(tk.END, "\n".join(lines) + "\n")
+            excess = int(self.log_text.index('end-1c').split('.')[0]) - LOG_MAX_LINES
+            if excess > 0:
+                self.log_text.delete(1.0, f"{excess + 1}.0")
+            self.log_text.see(tk.END)
+            self.log_text.configure(state='disabled')
+        self.root.after(LOG_FLUSH_MS, self.flush_logs)
+
+    def update_field(self, key, value):
+        getattr(self, CONFIG_FIELDS[key]).set(value)
 
     def update_ui(self):
-        config = load_config()
+        config = self.config
         self.key_var.set(config.get('bind_key', 'e'))
         self.pause_var.set(config.get('pause_key', 'p'))
         self.speed_var.set(config.get('speed', 5))
@@ -115,6 +145,24 @@ class FishingApp:
             self.start_btn.config(state=tk.NORMAL)
             self.status_var.set("Status: Ready")
 
+    def refresh_metrics(self):
+        """Раз в секунду переносит снимок метрик в таблицу (строки обновляются на месте)"""
+        try:
+            snapshot = get_metrics().snapshot()
+            rows = {name: (s["count"], f"{s['mean_ms']:.2f}", f"{s['p50_ms']:.2f}", f"{s['p99_ms']:.2f}")
+                    for name, s in snapshot["timings"].items() if s["count"]}
+            rows.update({name: (value, "", "", "") for name, value in snapshot["counters"].items()})
+            for name, values in rows.items():
+                if self.metrics_tree.exists(name):
+                    self.metrics_tree.item(name, values=values)
+                else:
+                    self.metrics_tree.insert("", tk.END, iid=name, text=name, values=values)
+        except Exception as e:
+            logger.error(f"Metrics refresh error: {e}")
+        finally:
+            # Одна неудачная попытка не должна останавливать обновление таблицы
+            self.root.after(1000, self.refresh_metrics)
+
     def start_fishing(self):
         # Запрос выбора режима движения
         choice = messagebox.askquestion(
@@ -151,6 +199,15 @@ class FishingApp:
         else:
             logger.warning("Fishing already running")
             messagebox.showwarning("Warning", "Fishing is already running")
+
+    def shutdown(self, waited=0):
+        """Закрывает окно после штатной остановки сессии (не дольше EXIT_TIMEOUT_MS)"""
+        if not self.fishing_manager.wait_stopped(0) and waited < EXIT_TIMEOUT_MS:
+            self.root.after(100, self.shutdown, waited + 100)
+            return
+        logger.info("Closing GUI")
+        self.root.destroy()
+
     def save_key(self):
         key = self.key_var.get().strip().lower()
         if key and len(key) == 1:
@@ -168,8 +225,9 @@ class FishingApp:
             messagebox.showerror("Error", "Invalid pause key")
 
     def save_speed(self):
-        update_speed(self.speed_var.get())
-        logger.info(f"Speed updated: {self.speed_var.get()}")
+        # Ползунок шлёт событие на каждое движение: в память сразу, на диск — одной отложенной записью
+        if self.config.set('speed', self.speed_var.get()):
+            logger.info(f"Speed updated: {self.speed_var.get()}")
 
     def save_exit_key(self):
         key = self.exit_var.get().strip().lower()
@@ -0,0 +1,351 @@
+"""
+Офлайн-бенчмарк детекторов: прогоняет размеченные кадры из "ai dev" (и любые папки
+с записанными кадрами, например debug_screenshots/<сессия>) через детекторы без дисплея.
+
+Отчёт: перцентили задержки, FPS и доля кадров с детекцией по каждому детектору;
+для детекторов круга (LABELED) — ещё precision / recall / IoU по VOC-разметке (класс "circle"). JSON-вывод — для отслеживания регрессий между версиями.
+
+    python benchmark.py --split val --split train --json bench.json
+    python benchmark.py --source debug_screenshots/20250530_231500 --repeats 3
+    python benchmark.py --source debug_screenshots/20250530_231500/session.gfs
+    python benchmark.py --split val --scaling 1 2 4 8     # масштабирование пула процессов
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from datetime import datetime
+import numpy as np
+
+import cv2
+from capture_service import FrameSource, FileBackend
+from dataset import iter_split
+from frame_context import context_for
+from session_recorder import read_session
+from template_store import TEMPLATES_DIR
+from vision_service import find_splash, find_target_circle, match_template
+from circle_detector import load_model, MODEL_FILE
+
+logger = logging.getLogger("Benchmark")
+
+DETECTORS = ("calibration_circle", "learned_circle", "vision_splash", "target_circle", "splashes")
+# Детекторы, которые ищут размеченный класс "circle"; всплески в разметке не отмечены
+LABELED = ("calibration_circle", "learned_circle", "target_circle")
+PERCENTILES = (50, 90, 99)
+# Детекция засчитывается, если IoU с рамкой разметки не меньше порога (для точечных — центр внутри рамки)
+IOU_THRESHOLD = 0.3
+
+
+def iou(a, b):
+    ix = max(0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def build_detectors(manager, config):
+    """Каждый детектор: FrameContext кадра -> список рамок (xmin, ymin, xmax, ymax) или точек (x, y)"""
+
+    def calibration_circle(frame):
+        circles, radius = manager.find_calibration_circle(frame)
+        r = int(radius)
+        return [(x - r, y - r, x + r, y + r) for x, y in circles]
+
+    model = load_model(config.get("circle_model_path", MODEL_FILE))
+
+    def learned_circle(frame):
+        if model is None:
+            return []
+        detections = model.detect(frame.image, min_width=config.get("circle_min_width", 16),
+                                  max_width=config.get("circle_max_width", 80),
+                                  threshold=config.get("circle_model_threshold", 0.0))
+        return [(int(x - w / 2), int(y - h / 2), int(x + w / 2), int(y + h / 2)) for x, y, w, h, _ in detections]
+
+    def vision_splash(frame):
+        center = find_splash(frame, config["splash_color_range"], config.get("splash_open_iterations", 2))
+        return [center] if center is not None else []
+
+    def target_circle(frame):
+        circle = find_target_circle(frame, config["circle_params"])
+        if circle is None:
+            return []
+        x, y, r = (int(v) for v in circle)
+        return [(x - r, y - r, x + r, y + r)]
+
+    def splashes(frame):
+        points, w, h = manager.find_splashes(frame)
+        return [(x - w // 2, y - h // 2, x + w // 2, y + h // 2) for x, y in points]
+
+    return {
+        "calibration_circle": calibration_circle,
+        "learned_circle": learned_circle,
+        "vision_splash": vision_splash,
+        "target_circle": target_circle,
+        "splashes": splashes,
+    }
+
+
+class _StaticBackend:
+    """Один заранее загруженный кадр (разметка привязана к конкретному изображению)"""
+
+    def __init__(self, image):
+        self.image = image
+
+    def size(self):
+        return self.image.shape[1], self.image.shape[0]
+
+    def grab(self, region=None):
+        return self.image
+
+    def close(self):
+        pass
+
+
+def score_frame(detections, boxes, stats):
+    """Жадное сопоставление детекций с разметкой одного кадра"""
+    stats["detections"] += len(detections)
+    stats["ground_truth"] += len(boxes)
+    unmatched = list(boxes)
+    for det in detections:
+        best, best_iou = None, 0.0
+        for box in unmatched:
+            if len(det) == 2:
+                hit = box[0] <= det[0] <= box[2] and box[1] <= det[1] <= box[3]
+                value = 1.0 if hit else 0.0
+            else:
+                value = iou(det, box)
+            if value > best_iou:
+                best, best_iou = box, value
+        if best is not None and best_iou >= IOU_THRESHOLD:
+            unmatched.remove(best)
+            stats["true_positives"] += 1
+            if len(det) == 4:
+                stats["iou"].append(best_iou)
+
+
+def summarize(timings, stats, annotated):
+    timings = np.array(timings)
+    result = {
+        "frames": int(len(timings)),
+        "mean_ms": float(timings.mean()) if len(timings) else None,
+        "fps": float(1000.0 / timings.mean()) if len(timings) and timings.mean() > 0 else None,
+        "hit_rate": stats["hit_frames"] / stats["frames"] if stats["frames"] else None,
+    }
+    for p in PERCENTILES:
+        result[f"p{p}_ms"] = float(np.percentile(timings, p)) if len(timings) else None
+    if annotated:
+        tp = stats["true_positives"]
+        result["precision"] = tp / stats["detections"] if stats["detections"] else None
+        result["recall"] = tp / stats["ground_truth"] if stats["ground_truth"] else None
+        result["mean_iou"] = float(np.mean(stats["iou"])) if stats["iou"] else None
+        result["detections"] = stats["detections"]
+        result["ground_truth"] = stats["ground_truth"]
+    return result
+
+
+def run_source(name, frames, detectors, repeats):
+    """
+    frames — список (Frame, рамки или None для неразмеченных записей). Точность по разметке —
+    только для LABELED; остальным — задержка и доля кадров с детекцией.
+    """
+    has_boxes = any(boxes is not None for _, boxes in frames)
+    report = {}
+    for det_name, detector in detectors.items():
+        annotated = has_boxes and det_name in LABELED
+        timings = []
+        stats = {"detections": 0, "ground_truth": 0, "true_positives": 0, "iou": [], "frames": 0, "hit_frames": 0}
+        for frame, boxes in frames:
+            for _ in range(repeats):
+                # Каждый замер — с пустым контекстом кадра: детектор сам платит за серое / HSV
+                context = context_for(frame).reset(frame)
+                start = time.perf_counter()
+                detections = detector(context)
+                timings.append((time.perf_counter() - start) * 1000)
+            stats["frames"] += 1
+            stats["hit_frames"] += bool(detections)
+            if annotated and boxes is not None:
+                score_frame(detections, boxes, stats)
+        report[det_name] = summarize(timings, stats, annotated)
+        logger.info(f"{name}/{det_name}: {report[det_name]}")
+    return report
+
+
+def load_split(split):
+    frames = []
+    for _, image, boxes in iter_split(split):
+        source = FrameSource(_StaticBackend(image), ring_size=1)
+        frames.append((source.grab(), boxes))
+    return frames
+
+
+def load_session(path, max_frames=None):
+    """Кадры записанной сессии (session.gfs); max_frames — равномерная выборка из записи"""
+    recorded, _ = read_session(path)
+    if max_frames and len(recorded) > max_frames:
+        recorded = [recorded[i] for i in np.linspace(0, len(recorded) - 1, max_frames).astype(int)]
+    frames = []
+    for item in recorded:
+        image = item.decode()
+        if image is not None:
+            frames.append((FrameSource(_StaticBackend(image), ring_size=1).grab(), None))
+    return frames
+
+
+def load_directory(path):
+    backend = FileBackend(path, loop=False)
+    # Отдельный буфер на каждый кадр: прогон повторяется по всем детекторам
+    source = FrameSource(backend, ring_size=max(1, len(backend)))
+    frames = []
+    while True:
+        frame = source.grab()
+        if frame is None:
+            break
+        frames.append((frame, None))
+    return frames
+
+
+def load_benchmark_template(frames):
+    """templates/splash.png, а если его нет — вырезка по первой размеченной рамке"""
+    path = os.path.join(TEMPLATES_DIR, "splash.png")
+    if os.path.exists(path):
+        return cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    for frame, boxes in frames:
+        if boxes:
+            xmin, ymin, xmax, ymax = boxes[0]
+            return cv2.cvtColor(frame.image[ymin:ymax, xmin:xmax], cv2.COLOR_BGR2GRAY)
+    return cv2.cvtColor(frames[0][0].image[:40, :40], cv2.COLOR_BGR2GRAY)
+
+
+def _time_per_frame(images, fn, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for image in images:
+            fn(image)
+    return (time.perf_counter() - start) * 1000 / (repeats * len(images))
+
+
+def run_scaling(frames, worker_counts, config, repeats):
+    """
+    Масштабирование пула процессов от 1 до N воркеров:
+    tiled_template — matchTemplate по полосам кадра, multi_detector — HoughCircles и
+    цветовой детектор параллельно на одном кадре. База — те же детекторы в текущем процессе.
+    """
+    from parallel_detection import ParallelDetector
+
+    images = [frame.image for frame, _ in frames]
+    template = load_benchmark_template(frames)
+    threshold = config.get("match_threshold", 0.75)
+    jobs = [("target_circle", config["circle_params"]), ("splash_color", config["splash_color_range"])]
+
+    def serial_template(image):
+        match_template(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), template, threshold)
+
+    def serial_multi(image):
+        find_target_circle(image, config["circle_params"])
+        find_splash(image, config["splash_color_range"])
+
+    baseline = {
+        "tiled_template_ms": _time_per_frame(images, serial_template, repeats),
+        "multi_detector_ms": _time_per_frame(images, serial_multi, repeats),
+    }
+    result = {"serial": baseline, "workers": {}}
+    for count in worker_counts:
+        detector = ParallelDetector(count)
+        try:
+            detector.warmup()
+            tiled = _time_per_frame(images, lambda img: detector.match_template_tiled(img, template, threshold),
+                                    repeats)
+            multi = _time_per_frame(images, lambda img: detector.detect(img, jobs), repeats)
+        finally:
+            detector.close()
+        result["workers"][count] = {
+            "tiled_template_ms": tiled,
+            "tiled_template_speedup": baseline["tiled_template_ms"] / tiled,
+            "multi_detector_ms": multi,
+            "multi_detector_speedup": baseline["multi_detector_ms"] / multi,
+        }
+    return result
+
+
+def print_scaling(name, scaling):
+    base = scaling["serial"]
+    print(f"\n== {name}: process pool scaling ==")
+    print(f"{'serial':>8}: template {base['tiled_template_ms']:7.2f} ms   multi {base['multi_detector_ms']:7.2f} ms")
+    for count, r in scaling["workers"].items():
+        print(f"{count:>8}: template {r['tiled_template_ms']:7.2f} ms (x{r['tiled_template_speedup']:.2f})   "
+              f"multi {r['multi_detector_ms']:7.2f} ms (x{r['multi_detector_speedup']:.2f})")
+
+
+def print_report(report):
+    for source, detectors in report["sources"].items():
+        print(f"\n== {source} ==")
+        for name, r in detectors.items():
+            line = (f"{name:>20}: mean {r['mean_ms']:7.2f} ms  p50 {r['p50_ms']:7.2f}  "
+                    f"p90 {r['p90_ms']:7.2f}  p99 {r['p99_ms']:7.2f}  {r['fps']:7.1f} fps")
+            fmt = lambda v: "  n/a" if v is None else f"{v:5.2f}"
+            line += f"  hit {fmt(r['hit_rate'])}"
+            if "recall" in r:
+                line += f"  P {fmt(r['precision'])}  R {fmt(r['recall'])}  IoU {fmt(r['mean_iou'])}"
+            print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline detector benchmark over annotated / recorded frames")
+    parser.add_argument("--split", action="append", choices=("train", "val"),
+                        help="размеченная выборка из 'ai dev' (можно несколько раз)")
+    parser.add_argument("--source", action="append", default=[],
+                        help="папка/видео/session.gfs с записанными кадрами без разметки (можно несколько раз)")
+    parser.add_argument("--detectors", nargs="+", choices=DETECTORS, default=list(DETECTORS))
+    parser.add_argument("--repeats", type=int, default=1, help="повторов каждого детектора на кадр")
+    parser.add_argument("--scaling", type=int, nargs="+", metavar="N",
+                        help="вместо детекторов замерить пул процессов на N воркерах")
+    parser.add_argument("--json", help="сохранить отчёт в JSON")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    splits = args.split or ([] if args.source else ["val"])
+    sources = [(f"dataset/{split}", lambda s=split: load_split(s)) for split in splits]
+    sources += [(path, lambda p=path: load_session(p) if p.endswith(".gfs") else load_directory(p))
+                for path in args.source]
+
+    from fishing_service import FishingManager
+    manager = FishingManager()
+    detectors = build_detectors(manager, manager.config)
+    detectors = {name: detectors[name] for name in args.detectors}
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "repeats": args.repeats,
+        "config": {key: manager.config.get(key) for key in ("match_mode", "pyramid_scale", "match_threshold")},
+        "sources": {},
+    }
+    for name, loader in sources:
+        frames = loader()
+        if not frames:
+            logger.warning(f"No frames in {name}")
+            continue
+        if args.scaling:
+            report.setdefault("scaling", {})[name] = run_scaling(frames, args.scaling, manager.config, args.repeats)
+            print_scaling(name, report["scaling"][name])
+            continue
+        # find_splashes масштабирует шаблоны под размер экрана источника
+        manager.frame_source = FrameSource(_StaticBackend(frames[0][0].image), ring_size=1)
+        report["sources"][name] = run_source(name, frames, detectors, args.repeats)
+    manager.close()
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=4)
+        print(f"\nReport saved: {args.json}")
+    return report
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
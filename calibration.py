@@ -0,0 +1,185 @@
+# calibration.py
+import os
+import json
+import math
+import logging
+import tempfile
+from datetime import datetime
+import numpy as np
+
+logger = logging.getLogger("Calibration")
+
+CALIBRATION_FILE = "calibration.json"
+
+
+class OnlineCalibration:
+    """
+    Потоковая оценка диапазона, скорости и стартовой позиции круга по его детекциям.
+    Все статистики экспоненциально забывают прошлое с периодом полураспада half_life секунд,
+    так что оценка следует за изменениями (другое место рыбалки, другая наживка).
+
+    Диапазон Y — квантили [low_quantile, high_quantile] взвешенной гистограммы по корзинам
+    bin_size пикселей плюс margin; скорость — взвешенное среднее |dy/dt| между соседними
+    детекциями одного трека; старт — взвешенное среднее Y первой детекции трека.
+    """
+
+    def __init__(self, screen_height, half_life=60.0, bin_size=8, margin=50, low_quantile=0.05,
+                 high_quantile=0.95, min_samples=10, max_gap=0.5):
+        self.screen_height = screen_height
+        self.half_life = half_life
+        self.bin_size = bin_size
+        self.margin = margin
+        self.low_quantile = low_quantile
+        self.high_quantile = high_quantile
+        self.min_samples = min_samples
+        self.max_gap = max_gap
+        self.histogram = np.zeros(int(math.ceil(screen_height / bin_size)), dtype=np.float64)
+        self.speed_sum = 0.0
+        self.speed_weight = 0.0
+        self.start_sum = 0.0
+        self.start_weight = 0.0
+        self.samples = 0
+        self._last_time = None
+        self._last_position = None
+        self._last_decay = None
+
+    @classmethod
+    def from_config(cls, screen_height, config):
+        return cls(screen_height, half_life=config.get("calibration_half_life", 60.0))
+
+    def _decay(self, timestamp):
+        if self._last_decay is not None and self.half_life > 0:
+            dt = timestamp - self._last_decay
+            if dt > 0:
+                factor = 0.5 ** (dt / self.half_life)
+                self.histogram *= factor
+                self.speed_sum *= factor
+                self.speed_weight *= factor
+                self.start_sum *= factor
+                self.start_weight *= factor
+        self._last_decay = timestamp
+
+    def update(self, position, timestamp, new_track=False):
+        """Одна детекция круга (координаты экрана) в момент timestamp"""
+        self._decay(timestamp)
+        y = position[1]
+        index = min(max(0, int(y // self.bin_size)), len(self.histogram) - 1)
+        self.histogram[index] += 1.0
+        self.samples += 1
+
+        if new_track or self._last_time is None:
+            self.start_sum += y
+            self.start_weight += 1.0
+        else:
+            dt = timestamp - self._last_time
+            if 0 < dt <= self.max_gap:
+                self.speed_sum += abs(y - self._last_position[1]) / dt
+                self.speed_weight += 1.0
+        self._last_time = timestamp
+        self._last_position = position
+
+    def end_track(self):
+        """Трек круга потерян — следующая детекция начнёт новый (и даст стартовую позицию)"""
+        self._last_time = None
+        self._last_position = None
+
+    @property
+    def weight(self):
+        return float(self.histogram.sum())
+
+    @property
+    def ready(self):
+        # Эффективное число образцов с учётом забывания
+        return self.weight >= self.min_samples
+
+    def range(self):
+        total = self.weight
+        if total <= 0:
+            return None
+        cumulative = np.cumsum(self.histogram) / total
+        low = int(np.searchsorted(cumulative, self.low_quantile)) * self.bin_size
+        high = (int(np.searchsorted(cumulative, self.high_quantile)) + 1) * self.bin_size
+        return max(0, low - self.margin), min(self.screen_height, high + self.margin)
+
+    def speed(self, default=100):
+        return self.speed_sum / self.speed_weight if self.speed_weight > 0 else default
+
+    def start_y(self):
+        if self.start_weight > 0:
+            return int(self.start_sum / self.start_weight)
+        bounds = self.range()
+        return (bounds[0] + bounds[1]) // 2 if bounds else self.screen_height // 2
+
+    # --- Сохранение между сессиями ---
+
+    def to_dict(self):
+        return {
+            "bin_size": self.bin_size,
+            "histogram": [round(float(v), 4) for v in self.histogram],
+            "speed": [self.speed_sum, self.speed_weight],
+            "start": [self.start_sum, self.start_weight],
+            "samples": self.samples,
+            "updated": datetime.now().isoformat(timespec="seconds"),
+        }
+
+    def load_dict(self, data):
+        """Восстанавливает статистики; несовместимый профиль (другой размер корзин) пропускается"""
+        histogram = np.asarray(data.get("histogram", []), dtype=np.float64)
+        if data.get("bin_size") != self.bin_size or len(histogram) != len(self.histogram):
+            logger.warning("Saved calibration profile does not match the screen, ignoring it")
+            return False
+        self.histogram = histogram
+        self.speed_sum, self.speed_weight = data.get("speed", (0.0, 0.0))
+        self.start_sum, self.start_weight = data.get("start", (0.0, 0.0))
+        self.samples = data.get("samples", 0)
+        return True
+
+
+def _profile_key(screen_size):
+    return f"{screen_size[0]}x{screen_size[1]}"
+
+
+def load_profile(calibration, screen_size, path=CALIBRATION_FILE):
+    """Подгружает в calibration сохранённый профиль для разрешения. True — профиль найден и подошёл"""
+    if not path or not os.path.exists(path):
+        return False
+    try:
+        with open(path, "r") as f:
+            profiles = json.load(f)
+    except Exception as e:
+        logger.error(f"Error loading calibration profiles: {e}")
+        return False
+    data = profiles.get(_profile_key(screen_size))
+    if data is None:
+        return False
+    if calibration.load_dict(data):
+        logger.info(f"Loaded calibration profile for {_profile_key(screen_size)} (saved {data.get('updated')})")
+        return True
+    return False
+
+
+def save_profile(calibration, screen_size, path=CALIBRATION_FILE):
+    """Атомарно сохраняет профиль разрешения, не трогая профили других разрешений"""
+    if not path:
+        return False
+    profiles = {}
+    if os.path.exists(path):
+        try:
+            with open(path, "r") as f:
+                profiles = json.load(f)
+        except Exception as e:
+            logger.warning(f"Calibration profiles unreadable, rewriting: {e}")
+    profiles[_profile_key(screen_size)] = calibration.to_dict()
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".calibration_", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(profiles, f, indent=2)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        logger.error(f"Error saving calibration profile: {e}")
+        return False
+    logger.info(f"Calibration profile saved for {_profile_key(screen_size)}")
+    return True
@@ -0,0 +1,337 @@
+# capture_service.py
+import os
+import glob
+import time
+import threading
+import logging
+import cv2
+import numpy as np
+
+from metrics import timed, inc
+
+logger = logging.getLogger("CaptureService")
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mkv", ".mov")
+
+
+class Frame:
+    """
+    Один захваченный кадр. image — BGR-представление над буфером из кольца FrameSource,
+    поэтому кадр действителен, пока источник не сделал ещё ring_size захватов.
+    offset — координаты левого верхнего угла кадра на мониторе (для захвата области).
+    Кадр, который нужно удержать дольше (другой поток), закрепляется через FrameSource.pin().
+    """
+    __slots__ = ("image", "timestamp", "index", "offset", "slot")
+
+    def __init__(self, image, timestamp, index, offset=(0, 0), slot=None):
+        self.image = image
+        self.timestamp = timestamp
+        self.index = index
+        self.offset = offset
+        self.slot = slot
+
+    @property
+    def shape(self):
+        return self.image.shape
+
+    def copy(self):
+        return Frame(self.image.copy(), self.timestamp, self.index, self.offset)
+
+
+class MssBackend:
+    """
+    Постоянный граббер mss. Дескрипторы GDI в mss привязаны к потоку, поэтому контекст
+    свой у каждого потока, который обращается к бэкенду (поток рыбалки снимает раскладку,
+    поток захвата конвейера грабит кадры); создаётся лениво и живёт до close().
+    Кадр возвращается как представление над сырым BGRA-буфером без копирования.
+    """
+
+    def __init__(self, monitor_index=1):
+        self.monitor_index = monitor_index
+        self.monitor = None
+        self._local = threading.local()
+        self._contexts = []
+        self._lock = threading.Lock()
+
+    def _ensure_open(self):
+        sct = getattr(self._local, "sct", None)
+        if sct is None:
+            import mss
+            sct = self._local.sct = mss.mss()
+            with self._lock:
+                self._contexts.append(sct)
+                if self.monitor is None:
+                    monitors = sct.monitors
+                    if not 0 <= self.monitor_index < len(monitors):
+                        logger.warning(f"Monitor {self.monitor_index} not found ({len(monitors) - 1} available), "
+                                       f"using primary monitor")
+                        self.monitor_index = 1 if len(monitors) > 1 else 0
+                    self.monitor = monitors[self.monitor_index]
+            logger.info(f"Persistent mss grabber opened for monitor {self.monitor_index} "
+                        f"in thread {threading.current_thread().name}: {self.monitor}")
+        return sct
+
+    def size(self):
+        self._ensure_open()
+        return self.monitor["width"], self.monitor["height"]
+
+    def origin(self):
+        """Левый верхний угол монитора на виртуальном рабочем столе"""
+        self._ensure_open()
+        return self.monitor["left"], self.monitor["top"]
+
+    def grab(self, region=None):
+        sct = self._ensure_open()
+        area = self.monitor
+        if region:
+            # region = (left, top, width, height) относительно монитора
+            area = {
+                "left": self.monitor["left"] + region[0],
+                "top": self.monitor["top"] + region[1],
+                "width": region[2],
+                "height": region[3],
+                "mon": self.monitor_index
+            }
+        shot = sct.grab(area)
+        return np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+
+    def close(self):
+        with self._lock:
+            contexts, self._contexts = self._contexts, []
+        for sct in contexts:
+            sct.close()
+        # Потоки, открывшие контекст, при следующем захвате откроют новый
+        self._local = threading.local()
+
+
+class FileBackend:
+    """
+    Подмена экрана для headless-прогонов: папка с изображениями, одно изображение или видео.
+    Изображения декодируются один раз и по кругу отдаются как кадры.
+    """
+
+    def __init__(self, path, loop=True):
+        self.path = path
+        self.loop = loop
+        self._images = []
+        self._position = 0
+        self._video = None
+        self.current_name = None
+
+        if os.path.isdir(path):
+            files = sorted(
+                f for f in glob.glob(os.path.join(path, "*"))
+                if f.lower().endswith(IMAGE_EXTENSIONS)
+            )
+            self._load_images(files)
+        elif path.lower().endswith(VIDEO_EXTENSIONS):
+            self._video = cv2.VideoCapture(path)
+            if not self._video.isOpened():
+                raise ValueError(f"Cannot open video: {path}")
+        else:
+            self._load_images([path])
+
+        if self._video is None and not self._images:
+            raise ValueError(f"No frames found at {path}")
+        logger.info(f"File capture backend ready: {path}")
+
+    def _load_images(self, files):
+        for file in files:
+            img = cv2.imread(file, cv2.IMREAD_COLOR)
+            if img is None:
+                logger.warning(f"Skipping unreadable frame: {file}")
+                continue
+            self._images.append((os.path.basename(file), img))
+
+    def __len__(self):
+        if self._video is not None:
+            return int(self._video.get(cv2.CAP_PROP_FRAME_COUNT))
+        return len(self._images)
+
+    def size(self):
+        if self._video is not None:
+            return (int(self._video.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                    int(self._video.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        img = self._images[0][1]
+        return img.shape[1], img.shape[0]
+
+    def _next_image(self):
+        if self._video is not None:
+            ok, img = self._video.read()
+            if not ok and self.loop:
+                self._video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                ok, img = self._video.read()
+            self.current_name = f"frame_{self._position}"
+            self._position += 1
+            return img if ok else None
+
+        if self._position >= len(self._images):
+            if not self.loop:
+                return None
+            self._position = 0
+        self.current_name, img = self._images[self._position]
+        self._position += 1
+        return img
+
+    def grab(self, region=None):
+        img = self._next_image()
+        if img is None:
+            return None
+        if region:
+            left, top, width, height = region
+            img = img[top:top + height, left:left + width]
+        return img
+
+    def close(self):
+        if self._video is not None:
+            self._video.release()
+            self._video = None
+
+
+class FrameSource:
+    """
+    Долгоживущий источник кадров: один граббер на всё время работы и кольцо
+    заранее выделенных BGR-буферов. Один захват за итерацию цикла, кадр делится
+    между всеми потребителями.
+    """
+
+    def __init__(self, backend=None, ring_size=4, clock=time.perf_counter):
+        self.backend = backend if backend is not None else MssBackend()
+        self.ring_size = ring_size
+        self.clock = clock
+        self._ring = [None] * ring_size
+        self._pins = [0] * ring_size
+        self._next_slot = 0
+        self._counter = 0
+        self._lock = threading.Lock()
+        self.latest = None
+
+    def size(self):
+        return self.backend.size()
+
+    def origin(self):
+        # Файлы и записи сессий не привязаны к рабочему столу — начало координат (0, 0)
+        origin = getattr(self.backend, "origin", None)
+        return tuple(origin()) if origin is not None else (0, 0)
+
+    def _slot_view(self, slot, height, width):
+        # Плоский буфер под максимальный размер: кадры меньшего размера (области) получают
+        # непрерывное представление над тем же буфером без новых выделений памяти
+        needed = height * width * 3
+        buf = self._ring[slot]
+        if buf is None or buf.size < needed:
+            buf = np.empty(needed, dtype=np.uint8)
+            self._ring[slot] = buf
+        return buf[:needed].reshape(height, width, 3)
+
+    def pin(self, frame):
+        """Закрепляет буфер кадра: пока он закреплён, захват не будет в него писать"""
+        if frame is not None and frame.slot is not None:
+            with self._lock:
+                self._pins[frame.slot] += 1
+
+    def release(self, frame):
+        if frame is not None and frame.slot is not None:
+            with self._lock:
+                self._pins[frame.slot] = max(0, self._pins[frame.slot] - 1)
+
+    def _take_slot(self):
+        # Следующий незакреплённый буфер кольца; если закреплены все — None (временный буфер)
+        for _ in range(self.ring_size):
+            slot = self._next_slot
+            self._next_slot = (slot + 1) % self.ring_size
+            if not self._pins[slot]:
+                return slot
+        return None
+
+    @timed("capture.grab")
+    def grab(self, region=None):
+        try:
+            raw = self.backend.grab(region)
+        except Exception as e:
+            logger.error(f"Screen capture error: {e}")
+            inc("capture.errors")
+            return None
+        if raw is None:
+            return None
+
+        timestamp = self.clock()
+        with self._lock:
+            index = self._counter
+            self._counter += 1
+            slot = self._take_slot()
+
+        height, width = raw.shape[:2]
+        if slot is None:
+            logger.debug("All ring buffers are pinned, using a temporary frame buffer")
+            inc("capture.ring_exhausted")
+            image = np.empty((height, width, 3), dtype=np.uint8)
+        else:
+            image = self._slot_view(slot, height, width)
+        if raw.ndim == 3 and raw.shape[2] == 4:
+            cv2.cvtColor(raw, cv2.COLOR_BGRA2BGR, dst=image)
+        else:
+            np.copyto(image, raw)
+
+        offset = (region[0], region[1]) if region else (0, 0)
+        frame = Frame(image, timestamp, index, offset, slot)
+        self.latest = frame
+        return frame
+
+    def close(self):
+        self.backend.close()
+        logger.info(f"Frame source closed after {self._counter} frames")
+
+
+class AdaptiveBand:
+    """
+    Область интереса — горизонтальная полоса по калиброванному диапазону Y круга плюс запас.
+    Если в полосе ничего не находится widen_after кадров подряд, полоса расширяется на widen_step,
+    после первой удачной находки возвращается к исходному размеру.
+    """
+
+    def __init__(self, margin=60, widen_after=5, widen_step=120, enabled=True):
+        self.margin = margin
+        self.widen_after = widen_after
+        self.widen_step = widen_step
+        self.enabled = enabled
+        self.y_range = None
+        self.extra = 0
+        self.misses = 0
+
+    def set_range(self, min_y, max_y):
+        self.y_range = (int(min_y), int(max_y))
+        self.extra = 0
+        self.misses = 0
+        logger.info(f"ROI band set to Y={min_y}-{max_y} (margin={self.margin})")
+
+    def bounds(self, screen_height):
+        """(top, bottom) захватываемой полосы — диапазон Y с запасом и расширением — или None без ROI"""
+        if not self.enabled or self.y_range is None:
+            return None
+        pad = self.margin + self.extra
+        return max(0, self.y_range[0] - pad), min(screen_height, self.y_range[1] + pad)
+
+    def region(self, screen_width, screen_height):
+        """Возвращает (left, top, width, height) для захвата или None, если нужен весь экран"""
+        bounds = self.bounds(screen_height)
+        if bounds is None:
+            return None
+        top, bottom = bounds
+        if top == 0 and bottom == screen_height:
+            return None
+        return 0, top, screen_width, bottom - top
+
+    def report(self, found):
+        if found:
+            if self.extra:
+                logger.debug("ROI band restored after successful detection")
+            self.misses = 0
+            self.extra = 0
+            return
+        self.misses += 1
+        if self.misses >= self.widen_after:
+            self.misses = 0
+            self.extra += self.widen_step
+            logger.debug(f"Nothing found in ROI band, widening by {self.widen_step}px (extra={self.extra})")
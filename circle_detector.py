@@ -0,0 +1,513 @@
+"""
+Обучаемый детектор круга калибровки: HOG + яркость/насыщенность по ячейкам, каскад из линейной
+модели (L2-SVM) по скользящему окну на пирамиде масштабов и маленького перцептрона, который
+переоценивает лучшие окна. Только CPU и numpy/OpenCV — без HSV-порогов
+под конкретное освещение. Обучается на VOC-разметке из "ai dev" (класс "circle"):
+
+    python circle_detector.py train                      # -> models/circle_hog.npz
+    python circle_detector.py eval --split val
+
+Признаки окна считаются один раз на весь кадр (карты ячеек), оценка окна — свёртка карты
+с весами линейной ступени, поэтому стоимость определяется площадью кадра и числом масштабов:
+окно трека 160x160 — около 10 мс, полоса ROI с узким диапазоном ширины круга — 15-20 мс,
+весь кадр 1080p на всех масштабах — сотни миллисекунд (одно ядро).
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+import functools
+from datetime import datetime
+import numpy as np
+import cv2
+
+from dataset import iter_split
+
+logger = logging.getLogger("CircleDetector")
+
+MODEL_FILE = os.path.join("models", "circle_hog.npz")
+
+# Ячейка 4x4 px, 9 направлений градиента (без знака), блоки 2x2 ячейки
+CELL = 4
+BINS = 9
+# Окно 7x5 ячеек (28x20 px) с кругом 16x8 px в центре — остальное контекст вокруг
+WINDOW_CELLS = (7, 5)
+BOX = (16, 8)
+WINDOW = (WINDOW_CELLS[0] * CELL, WINDOW_CELLS[1] * CELL)
+# Каналы ячейки помимо HOG: log-энергия градиента (гладкость), насыщенность, яркость
+CHANNELS = 3
+
+_BLOCKS = (WINDOW_CELLS[0] - 1, WINDOW_CELLS[1] - 1)
+_HOG_SIZE = _BLOCKS[0] * _BLOCKS[1] * 4 * BINS
+_CHANNEL_SIZE = WINDOW_CELLS[0] * WINDOW_CELLS[1] * CHANNELS
+FEATURE_SIZE = _HOG_SIZE + _CHANNEL_SIZE + CHANNELS
+
+
+@functools.lru_cache(maxsize=16)
+def _cell_bins(cells_y, cells_x):
+    """Индекс первой корзины ячейки для каждого пикселя (для np.bincount), по размеру карты"""
+    rows = np.arange(cells_y * CELL) // CELL
+    cols = np.arange(cells_x * CELL) // CELL
+    return ((rows[:, None] * cells_x + cols[None, :]) * BINS).ravel()
+
+
+def feature_maps(image):
+    """
+    Карты признаков кадра BGR: блоки HOG (cy-1, cx-1, 4*BINS), нормированные L2-Hys,
+    и каналы ячеек (cy, cx, CHANNELS).
+    """
+    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+    value = hsv[:, :, 2].astype(np.float32)
+    gx = cv2.Sobel(value, cv2.CV_32F, 1, 0, ksize=1)
+    gy = cv2.Sobel(value, cv2.CV_32F, 0, 1, ksize=1)
+    magnitude, angle = cv2.cartToPolar(gx, gy, angleInDegrees=True)
+
+    cells_y, cells_x = value.shape[0] // CELL, value.shape[1] // CELL
+    magnitude = magnitude[:cells_y * CELL, :cells_x * CELL].ravel()
+    position = angle[:cells_y * CELL, :cells_x * CELL].ravel() * (BINS / 180.0)
+    # Голос пикселя делится между двумя соседними корзинами направления
+    low = position.astype(np.int64)
+    fraction = position - low
+    low %= BINS
+    base = _cell_bins(cells_y, cells_x)
+    size = cells_y * cells_x * BINS
+    hist = (np.bincount(base + low, magnitude * (1 - fraction), size)
+            + np.bincount(base + (low + 1) % BINS, magnitude * fraction, size))
+    cells = hist.reshape(cells_y, cells_x, BINS).astype(np.float32)
+
+    blocks = np.concatenate((cells[:-1, :-1], cells[:-1, 1:], cells[1:, :-1], cells[1:, 1:]), axis=2)
+    blocks /= np.sqrt((blocks * blocks).sum(axis=2, keepdims=True) + 1e-2)
+    np.minimum(blocks, 0.2, out=blocks)
+    blocks /= np.sqrt((blocks * blocks).sum(axis=2, keepdims=True) + 1e-2)
+
+    energy = np.log1p(cells.sum(axis=2) / (CELL * CELL)) / 5.0
+    color = cv2.resize(hsv[:cells_y * CELL, :cells_x * CELL, 1:], (cells_x, cells_y),
+                       interpolation=cv2.INTER_AREA).astype(np.float32) / 255.0
+    channels = np.concatenate((energy[:, :, None], color), axis=2)
+    return blocks, channels
+
+
+def window_feature(blocks, channels, y, x):
+    """Вектор признаков окна с левой верхней ячейкой (y, x); каналы — относительно среднего по окну"""
+    cells = channels[y:y + WINDOW_CELLS[1], x:x + WINDOW_CELLS[0]]
+    mean = cells.mean(axis=(0, 1))
+    return np.concatenate((blocks[y:y + _BLOCKS[1], x:x + _BLOCKS[0]].ravel(), (cells - mean).ravel(), mean))
+
+
+def window_features(blocks, channels, ys, xs):
+    """window_feature для массивов координат окон одним индексированием: (n, FEATURE_SIZE)"""
+    ys, xs = np.asarray(ys)[:, None, None], np.asarray(xs)[:, None, None]
+    rows, cols = np.arange(WINDOW_CELLS[1])[None, :, None], np.arange(WINDOW_CELLS[0])[None, None, :]
+    hog = blocks[ys + rows[:, :-1], xs + cols[:, :, :-1]].reshape(len(ys), -1)
+    cells = channels[ys + rows, xs + cols]
+    mean = cells.mean(axis=(1, 2))
+    return np.concatenate((hog, (cells - mean[:, None, None]).reshape(len(ys), -1), mean), axis=1)
+
+
+def scale_pyramid(min_width, max_width, step):
+    """Коэффициенты уменьшения кадра, при которых круг шириной min_width..max_width занимает BOX"""
+    scales = []
+    width = float(min_width)
+    while width <= max_width * 1.001:
+        scales.append(min(1.0, BOX[0] / width))
+        width *= step
+    return sorted(set(scales), reverse=True)
+
+
+def box_iou(a, b):
+    ix = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def suppress_boxes(boxes, scores, iou_threshold=0.2, top_k=5):
+    """Жадное подавление немаксимумов по IoU рамок (x0, y0, x1, y1); индексы оставшихся"""
+    keep = []
+    for i in np.argsort(-scores, kind="stable"):
+        if all(box_iou(boxes[i], boxes[j]) < iou_threshold for j in keep):
+            keep.append(i)
+            if len(keep) >= top_k:
+                break
+    return keep
+
+
+def _window_boxes(ys, xs, scale):
+    """Рамки круга (x0, y0, x1, y1) в координатах кадра для окон (ys, xs) уровня scale"""
+    cx = (xs * CELL + WINDOW[0] / 2) / scale
+    cy = (ys * CELL + WINDOW[1] / 2) / scale
+    half_w, half_h = BOX[0] / scale / 2, BOX[1] / scale / 2
+    return np.stack((cx - half_w, cy - half_h, cx + half_w, cy + half_h), axis=1)
+
+
+def _best_windows(scores, threshold, limit):
+    """Координаты и оценки не более limit лучших окон карты выше порога"""
+    ys, xs = np.nonzero(scores > threshold)
+    values = scores[ys, xs]
+    if len(values) > limit:
+        best = np.argpartition(-values, limit)[:limit]
+        ys, xs, values = ys[best], xs[best], values[best]
+    return ys, xs, values
+
+
+class CircleModel:
+    """
+    Каскад из двух ступеней. Линейная: score = w·feature + bias по всем окнам — отбирает
+    кандидатов; вторая (необязательная) — маленький перцептрон с одним скрытым слоем ReLU
+    переоценивает только кандидатов. Круг — окна с итоговой оценкой > threshold.
+    """
+
+    STAGE_KEYS = ("mean", "scale", "hidden_weights", "hidden_bias", "output_weights", "output_bias")
+
+    def __init__(self, weights, bias, threshold=0.0, info=None, stage=None):
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = float(bias)
+        self.threshold = float(threshold)
+        self.info = info or {}
+        self.stage = {key: np.asarray(value, dtype=np.float32) for key, value in stage.items()} if stage else None
+        if self.weights.shape != (FEATURE_SIZE,):
+            raise ValueError(f"Model has {self.weights.size} weights, expected {FEATURE_SIZE}")
+        hog_end = _HOG_SIZE + _CHANNEL_SIZE
+        self._hog = self.weights[:_HOG_SIZE].reshape(_BLOCKS[1], _BLOCKS[0], 4 * BINS)
+        channel_weights = self.weights[_HOG_SIZE:hog_end].reshape(WINDOW_CELLS[1], WINDOW_CELLS[0], CHANNELS)
+        # Вычитание среднего по окну линейно — переносим его в веса: w_k - sum(w)/n + w_mean/n
+        correction = (self.weights[hog_end:] - channel_weights.reshape(-1, CHANNELS).sum(axis=0)) \
+            / (WINDOW_CELLS[0] * WINDOW_CELLS[1])
+        self._channels = channel_weights + correction
+
+    @classmethod
+    def load(cls, path=MODEL_FILE):
+        with np.load(path) as data:
+            stage = {key: data["stage_" + key] for key in cls.STAGE_KEYS if "stage_" + key in data.files}
+            info = {key: data[key].item() for key in data.files
+                    if key not in ("weights", "bias", "threshold") and not key.startswith("stage_")}
+            return cls(data["weights"], data["bias"], data["threshold"], info, stage or None)
+
+    def save(self, path=MODEL_FILE):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        stage = {"stage_" + key: value for key, value in (self.stage or {}).items()}
+        np.savez(path, weights=self.weights, bias=self.bias, threshold=self.threshold, **stage, **self.info)
+        logger.info(f"Circle model saved: {path}")
+
+    def score_window(self, feature):
+        return float(feature @ self.weights + self.bias)
+
+    def rescore(self, features):
+        """Оценки второй ступени для векторов признаков (n, FEATURE_SIZE); без неё — линейные"""
+        features = np.asarray(features, dtype=np.float32)
+        if self.stage is None:
+            return features @ self.weights + self.bias
+        s = self.stage
+        hidden = np.maximum(((features - s["mean"]) / s["scale"]) @ s["hidden_weights"] + s["hidden_bias"], 0)
+        return hidden @ s["output_weights"] + s["output_bias"]
+
+    def score_map(self, blocks, channels):
+        """Оценки всех окон карты (шаг — одна ячейка) как сумма сдвинутых произведений карты и весов"""
+        height = channels.shape[0] - WINDOW_CELLS[1] + 1
+        width = channels.shape[1] - WINDOW_CELLS[0] + 1
+        if height <= 0 or width <= 0:
+            return np.empty((0, 0), dtype=np.float32)
+        scores = np.full((height, width), self.bias, dtype=np.float32)
+        for dy in range(_BLOCKS[1]):
+            for dx in range(_BLOCKS[0]):
+                scores += blocks[dy:dy + height, dx:dx + width] @ self._hog[dy, dx]
+        for dy in range(WINDOW_CELLS[1]):
+            for dx in range(WINDOW_CELLS[0]):
+                scores += channels[dy:dy + height, dx:dx + width] @ self._channels[dy, dx]
+        return scores
+
+    def detect(self, image, min_width=16, max_width=80, scale_step=1.25, threshold=None, top_k=5,
+               candidates=100):
+        """
+        Круги в кадре BGR: [(x, y, width, height, score)] по убыванию оценки, координаты кадра.
+        Кадр уменьшается так, чтобы круг шириной min_width..max_width занял окно модели;
+        вторая ступень переоценивает candidates лучших окон линейной ступени.
+        """
+        threshold = self.threshold if threshold is None else threshold
+        # Без второй ступени порог отсекает окна сразу, с ней — после переоценки
+        linear_threshold = -np.inf if self.stage is not None else threshold
+        maps, boxes, scores, windows = [], [], [], []
+        for level, scale in enumerate(scale_pyramid(min_width, max_width, scale_step)):
+            scaled = image if scale >= 1.0 else cv2.resize(image, None, fx=scale, fy=scale,
+                                                           interpolation=cv2.INTER_AREA)
+            maps.append(feature_maps(scaled))
+            ys, xs, values = _best_windows(self.score_map(*maps[-1]), linear_threshold, candidates)
+            boxes.append(_window_boxes(ys, xs, scale))
+            scores.append(values)
+            windows.append(np.stack((np.full(len(ys), level), ys, xs), axis=1))
+        if not boxes:
+            return []
+        boxes = np.concatenate(boxes)
+        scores = np.concatenate(scores)
+        if self.stage is not None and len(scores):
+            best = np.argsort(-scores, kind="stable")[:candidates]
+            boxes, windows = boxes[best], np.concatenate(windows)[best]
+            scores = np.empty(len(best), dtype=np.float32)
+            for level in np.unique(windows[:, 0]):
+                rows = windows[:, 0] == level
+                scores[rows] = self.rescore(window_features(*maps[level], windows[rows, 1], windows[rows, 2]))
+            passed = scores > threshold
+            boxes, scores = boxes[passed], scores[passed]
+        return [((boxes[i, 0] + boxes[i, 2]) / 2, (boxes[i, 1] + boxes[i, 3]) / 2,
+                 boxes[i, 2] - boxes[i, 0], boxes[i, 3] - boxes[i, 1], float(scores[i]))
+                for i in suppress_boxes(boxes, scores, top_k=top_k)]
+
+
+@functools.lru_cache(maxsize=2)
+def load_model(path=MODEL_FILE):
+    """Модель с диска с кэшем по пути; None, если файла нет"""
+    if not path or not os.path.exists(path):
+        logger.warning(f"Circle model not found: {path}")
+        return None
+    return CircleModel.load(path)
+
+
+# --- Обучение ---
+
+def patch_feature(image, box, shift=(0.0, 0.0), scale=1.0, flip=False, gain=1.0):
+    """
+    Признаки окна вокруг рамки: фрагмент масштабируется так, чтобы рамка заняла BOX,
+    с запасом в одну ячейку по краям (градиенты на границе окна как в целом кадре).
+    shift — сдвиг в пикселях окна, scale — множитель размера рамки, gain — множитель яркости.
+    """
+    x0, y0, x1, y1 = box
+    sx = BOX[0] / ((x1 - x0) * scale)
+    sy = BOX[1] / ((y1 - y0) * scale)
+    cx = (x0 + x1) / 2 + shift[0] / sx
+    cy = (y0 + y1) / 2 + shift[1] / sy
+    patch_w, patch_h = WINDOW[0] + 2 * CELL, WINDOW[1] + 2 * CELL
+    left, top = int(round(cx - patch_w / 2 / sx)), int(round(cy - patch_h / 2 / sy))
+    right, bottom = max(left + 1, int(round(cx + patch_w / 2 / sx))), max(top + 1, int(round(cy + patch_h / 2 / sy)))
+    height, width = image.shape[:2]
+    pad = max(0, -left, -top, right - width, bottom - height)
+    if pad:
+        image = cv2.copyMakeBorder(image, pad, pad, pad, pad, cv2.BORDER_REPLICATE)
+        left, top, right, bottom = left + pad, top + pad, right + pad, bottom + pad
+    patch = cv2.resize(image[top:bottom, left:right], (patch_w, patch_h), interpolation=cv2.INTER_AREA)
+    if flip:
+        patch = np.ascontiguousarray(patch[:, ::-1])
+    if gain != 1.0:
+        patch = cv2.convertScaleAbs(patch, alpha=gain)
+    return window_feature(*feature_maps(patch), 1, 1)
+
+
+class _Pyramid:
+    """Карты признаков кадра на всех масштабах (float16) — для многократного поиска при обучении"""
+
+    def __init__(self, image, scales):
+        self.levels = []
+        for scale in scales:
+            scaled = image if scale >= 1.0 else cv2.resize(image, None, fx=scale, fy=scale,
+                                                           interpolation=cv2.INTER_AREA)
+            blocks, channels = feature_maps(scaled)
+            self.levels.append((scale, blocks.astype(np.float16), channels.astype(np.float16)))
+
+    def windows(self, model, threshold, limit):
+        """Лучшие окна линейной ступени на всех масштабах: [(score, box, level, y, x)]"""
+        found = []
+        for level, (scale, blocks, channels) in enumerate(self.levels):
+            scores = model.score_map(blocks.astype(np.float32), channels.astype(np.float32))
+            ys, xs, values = _best_windows(scores, threshold, limit)
+            found.extend((float(value), tuple(box), level, y, x)
+                         for y, x, value, box in zip(ys, xs, values, _window_boxes(ys, xs, scale)))
+        return found
+
+    def feature(self, level, y, x):
+        _, blocks, channels = self.levels[level]
+        return window_feature(blocks.astype(np.float32), channels.astype(np.float32), y, x)
+
+
+def fit_l2svm(positives, negatives, regularization=1.0, iterations=20):
+    """
+    Линейный SVM с квадратичной функцией потерь (L2-SVM) методом Ньютона: на каждом шаге —
+    взвешенная гребневая регрессия по окнам, нарушающим отступ. Классы уравновешены весами.
+    """
+    x = np.vstack((positives, negatives)).astype(np.float64)
+    x = np.hstack((x, np.ones((len(x), 1))))
+    y = np.concatenate((np.ones(len(positives)), -np.ones(len(negatives))))
+    weight = np.where(y > 0, len(negatives) / len(positives), 1.0)
+    penalty = regularization * np.diag(np.append(np.ones(x.shape[1] - 1), 0.0))
+    active = np.ones(len(x), dtype=bool)
+    w = np.zeros(x.shape[1])
+    for _ in range(iterations):
+        xa = x[active] * weight[active, None]
+        w = np.linalg.solve(xa.T @ x[active] + penalty, xa.T @ y[active])
+        violating = y * (x @ w) < 1
+        if np.array_equal(violating, active):
+            break
+        active = violating
+    return w[:-1], w[-1]
+
+
+def fit_perceptron(positives, negatives, hidden=32, epochs=30, learning_rate=1e-3, weight_decay=1e-4,
+                   batch=256, seed=0):
+    """
+    Вторая ступень: перцептрон признаки -> ReLU(hidden) -> логит, логистическая функция потерь
+    с уравновешенными классами, Adam по мини-батчам. Признаки стандартизуются по выборке.
+    """
+    rng = np.random.default_rng(seed)
+    x = np.vstack((positives, negatives)).astype(np.float32)
+    y = np.concatenate((np.ones(len(positives)), np.zeros(len(negatives)))).astype(np.float32)
+    weight = np.where(y > 0, len(negatives) / len(positives), 1.0).astype(np.float32)
+    mean = x.mean(axis=0)
+    scale = x.std(axis=0) + 1e-3
+    x = (x - mean) / scale
+
+    params = [rng.normal(0, np.sqrt(2 / x.shape[1]), (x.shape[1], hidden)).astype(np.float32),
+              np.zeros(hidden, np.float32),
+              rng.normal(0, np.sqrt(1 / hidden), hidden).astype(np.float32),
+              np.zeros(1, np.float32)]
+    moments = [np.zeros_like(p) for p in params]
+    squares = [np.zeros_like(p) for p in params]
+    step = 0
+    for _ in range(epochs):
+        order = rng.permutation(len(x))
+        for start in range(0, len(x), batch):
+            idx = order[start:start + batch]
+            xb, wb = x[idx], weight[idx]
+            activ = np.maximum(xb @ params[0] + params[1], 0)
+            prob = 1 / (1 + np.exp(-(activ @ params[2] + params[3][0])))
+            grad = (prob - y[idx]) * wb / wb.sum()
+            grad_hidden = np.outer(grad, params[2]) * (activ > 0)
+            grads = [xb.T @ grad_hidden + weight_decay * params[0], grad_hidden.sum(axis=0),
+                     activ.T @ grad + weight_decay * params[2], np.array([grad.sum()], np.float32)]
+            step += 1
+            for p, g, m, v in zip(params, grads, moments, squares):
+                m *= 0.9
+                m += 0.1 * g
+                v *= 0.999
+                v += 0.001 * g * g
+                p -= learning_rate * (m / (1 - 0.9 ** step)) / (np.sqrt(v / (1 - 0.999 ** step)) + 1e-8)
+    return dict(zip(CircleModel.STAGE_KEYS, [mean, scale, *params]))
+
+
+def train_model(split="train", min_width=16, max_width=80, scale_step=1.25, regularization=1.0,
+                mining_rounds=5, negatives_per_level=60, mined_per_level=150, stage_per_level=400, hidden=32,
+                seed=0):
+    """
+    Обучение на выборке: сдвинутые/отражённые рамки, случайные окна фона и раунды поиска трудных
+    негативов для линейной ступени; вторая ступень учится на лучших окнах линейной (stage_per_level
+    на масштаб), т.е. ровно на том, что ей придётся различать при поиске. hidden=0 — без неё.
+    """
+    rng = np.random.default_rng(seed)
+    scales = scale_pyramid(min_width, max_width, scale_step)
+    frames = [(image, boxes, _Pyramid(image, scales)) for _, image, boxes in iter_split(split)]
+    logger.info(f"Training on {len(frames)} frames of '{split}', {len(scales)} scales")
+
+    positives, negatives = [], []
+    for image, boxes, pyramid in frames:
+        for box in boxes:
+            for scale in (0.85, 1.0, 1.15):
+                for sx in (-1.5, 0.0, 1.5):
+                    for sy in (-1.5, 0.0, 1.5):
+                        for flip in (False, True):
+                            positives.append(patch_feature(image, box, (sx, sy), scale, flip,
+                                                           gain=rng.uniform(0.85, 1.15)))
+        for level, (scale, _, channels) in enumerate(pyramid.levels):
+            rows = channels.shape[0] - WINDOW_CELLS[1] + 1
+            cols = channels.shape[1] - WINDOW_CELLS[0] + 1
+            if rows <= 0 or cols <= 0:
+                continue
+            for _ in range(negatives_per_level):
+                y, x = int(rng.integers(rows)), int(rng.integers(cols))
+                cx, cy = (x * CELL + WINDOW[0] / 2) / scale, (y * CELL + WINDOW[1] / 2) / scale
+                half_w, half_h = BOX[0] / scale / 2, BOX[1] / scale / 2
+                window = (cx - half_w, cy - half_h, cx + half_w, cy + half_h)
+                if all(box_iou(window, box) < 0.1 for box in boxes):
+                    negatives.append(pyramid.feature(level, y, x))
+    positives = np.array(positives)
+    negatives = np.array(negatives)
+
+    model = CircleModel(*fit_l2svm(positives, negatives, regularization))
+    for round_index in range(mining_rounds):
+        hard = [pyramid.feature(level, y, x)
+                for image, boxes, pyramid in frames
+                for _, window, level, y, x in pyramid.windows(model, -1.0, mined_per_level)
+                if all(box_iou(window, box) < 0.3 for box in boxes)]
+        logger.info(f"Mining round {round_index + 1}: {len(hard)} hard negatives")
+        if not hard:
+            break
+        negatives = np.vstack((negatives, np.array(hard)))
+        model = CircleModel(*fit_l2svm(positives, negatives, regularization))
+
+    if hidden:
+        proposals = np.array([pyramid.feature(level, y, x)
+                              for image, boxes, pyramid in frames
+                              for _, window, level, y, x in pyramid.windows(model, -np.inf, stage_per_level)
+                              if all(box_iou(window, box) < 0.3 for box in boxes)])
+        logger.info(f"Second stage: {len(positives)} positives, {len(proposals)} proposals")
+        model.stage = fit_perceptron(positives, proposals, hidden=hidden, seed=seed)
+
+    model.info = {
+        "trained": datetime.now().isoformat(timespec="seconds"),
+        "split": split,
+        "positives": len(positives),
+        "negatives": len(negatives),
+        "regularization": regularization,
+        "hidden": hidden,
+    }
+    return model
+
+
+def evaluate(model, split="val", top_k=3, iou_threshold=0.3, **detect_kwargs):
+    """Recall по top_k лучшим детекциям кадра, доля кадров с кругом на первом месте, время на кадр"""
+    found = first = total = 0
+    timings = []
+    for _, image, boxes in iter_split(split):
+        start = time.perf_counter()
+        detections = model.detect(image, threshold=-np.inf, top_k=top_k, **detect_kwargs)
+        timings.append((time.perf_counter() - start) * 1000)
+        total += len(boxes)
+        unmatched = list(boxes)
+        for rank, (x, y, w, h, _) in enumerate(detections):
+            window = (x - w / 2, y - h / 2, x + w / 2, y + h / 2)
+            best = max(unmatched, key=lambda box: box_iou(window, box), default=None)
+            if best is not None and box_iou(window, best) >= iou_threshold:
+                unmatched.remove(best)
+                found += 1
+                first += rank == 0
+    return {
+        "split": split,
+        "ground_truth": total,
+        f"recall_top{top_k}": found / total if total else None,
+        "top1": first / total if total else None,
+        "mean_ms": float(np.mean(timings)) if timings else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train / evaluate the learned calibration circle detector")
+    parser.add_argument("command", choices=("train", "eval"))
+    parser.add_argument("--model", default=MODEL_FILE)
+    parser.add_argument("--split", default=None, help="выборка 'ai dev' (train: train, eval: val)")
+    parser.add_argument("--regularization", type=float, default=1.0)
+    parser.add_argument("--rounds", type=int, default=5, help="раундов поиска трудных негативов")
+    parser.add_argument("--hidden", type=int, default=32, help="нейронов второй ступени (0 — только линейная)")
+    parser.add_argument("--min-width", type=int, default=16)
+    parser.add_argument("--max-width", type=int, default=80)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    sizes = {"min_width": args.min_width, "max_width": args.max_width}
+    if args.command == "train":
+        model = train_model(args.split or "train", regularization=args.regularization,
+                            mining_rounds=args.rounds, hidden=args.hidden, **sizes)
+        model.save(args.model)
+        results = [evaluate(model, split, **sizes) for split in ("train", "val")]
+    else:
+        model = CircleModel.load(args.model)
+        results = [evaluate(model, args.split or "val", **sizes)]
+    for r in results:
+        print(f"{r['split']:>5}: recall@3 {r['recall_top3']:.2f}  top-1 {r['top1']:.2f}  "
+              f"({r['ground_truth']} circles)  {r['mean_ms']:.1f} ms/frame")
+    return results
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
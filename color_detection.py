@@ -0,0 +1,198 @@
+# color_detection.py
+import os
+import json
+import math
+import logging
+from collections import OrderedDict
+import cv2
+import numpy as np
+
+from frame_context import FrameContext, ShapeCache
+
+logger = logging.getLogger("ColorDetection")
+
+SAVED_RANGES_FILE = "saved_hsv_ranges.json"
+
+_ELLIPSE_5 = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+_RECT_3 = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
+
+# Постобработка маски: шаги (операция, ядро, итерации); "blur" — размытие с ядром kernel x kernel.
+# Круг калибровки: открытие + закрытие эллипсом 5x5 и сглаживание краёв перед поиском контуров
+CIRCLE_STEPS = (("open", _ELLIPSE_5, 1), ("close", _ELLIPSE_5, 1), ("blur", 5, 1))
+
+
+def splash_steps(iterations=2):
+    """Всплеск по цвету: erode xN + dilate xN ядром 3x3 — то же, что открытие с N итерациями"""
+    return (("open", _RECT_3, iterations),) if iterations > 0 else ()
+
+
+SPLASH_STEPS = splash_steps(2)
+
+_MORPH = {"open": cv2.MORPH_OPEN, "close": cv2.MORPH_CLOSE, "erode": cv2.MORPH_ERODE, "dilate": cv2.MORPH_DILATE}
+
+
+class ColorRange:
+    """Именованный HSV-диапазон и постобработка его маски"""
+    __slots__ = ("name", "lower", "upper", "steps")
+
+    def __init__(self, name, lower, upper, steps=()):
+        self.name = name
+        self.lower = np.array(lower, dtype=np.uint8)
+        self.upper = np.array(upper, dtype=np.uint8)
+        self.steps = tuple(steps)
+
+
+class ColorMasks:
+    """
+    Результат ColorDetector.detect: HSV-кадр и маски по именам диапазонов. Массивы — буферы
+    детектора, они действительны до следующего detect с кадром того же размера.
+    """
+
+    def __init__(self, hsv, masks):
+        self.hsv = hsv
+        self.masks = masks
+
+    def __getitem__(self, name):
+        return self.masks[name]
+
+    def __contains__(self, name):
+        return name in self.masks
+
+    def __iter__(self):
+        return iter(self.masks)
+
+    def items(self):
+        return self.masks.items()
+
+
+class _Buffers:
+    __slots__ = ("shape", "hsv", "masks")
+
+    def __init__(self, shape):
+        self.shape = shape
+        self.hsv = np.empty((shape[0], shape[1], 3), dtype=np.uint8)
+        self.masks = {}
+
+    def masks_for(self, name):
+        """Пара буферов маски диапазона: постобработка перекладывает результат между ними"""
+        pair = self.masks.get(name)
+        if pair is None:
+            pair = self.masks[name] = (np.empty(self.shape, dtype=np.uint8), np.empty(self.shape, dtype=np.uint8))
+        return pair
+
+
+class ColorDetector:
+    """
+    Цветовые детекции по нескольким HSV-диапазонам за один проход преобразования:
+    кадр переводится в HSV один раз, затем для каждого диапазона — inRange и постобработка.
+    Все промежуточные массивы — заранее выделенные буферы под размер кадра (ShapeCache, до MAX_SHAPES
+    размеров), так что в установившемся режиме кадр не порождает новых полноразмерных массивов.
+    Не потокобезопасен: один экземпляр на поток.
+    """
+
+    def __init__(self, ranges=()):
+        self.ranges = OrderedDict()
+        self._buffers = ShapeCache(_Buffers)
+        for color_range in ranges:
+            self.add(color_range)
+
+    @classmethod
+    def from_config(cls, config, saved_ranges_path=None):
+        """Круг калибровки и цвет всплеска из конфига; при saved_ranges_path — и сохранённые диапазоны"""
+        circle = config.get("calibration_color_range", [[79, 87, 52], [107, 118, 56]])
+        splash = config.get("splash_color_range", [[90, 150, 50], [120, 255, 255]])
+        iterations = config.get("splash_open_iterations", 2)
+        detector = cls([ColorRange("circle", circle[0], circle[1], CIRCLE_STEPS),
+                        ColorRange("splash", splash[0], splash[1], splash_steps(iterations))])
+        if saved_ranges_path:
+            for color_range in load_saved_ranges(saved_ranges_path):
+                detector.add(color_range)
+        return detector
+
+    def add(self, color_range):
+        self.ranges[color_range.name] = color_range
+
+    def set_range(self, name, lower, upper, steps=None):
+        """Новые границы диапазона (steps=None — постобработка сохраняется) — для живого изменения конфига"""
+        current = self.ranges.get(name)
+        if steps is None:
+            steps = current.steps if current is not None else ()
+        self.ranges[name] = ColorRange(name, lower, upper, steps)
+
+    def to_hsv(self, image):
+        """HSV-представление кадра BGR (или FrameContext) в буфере детектора"""
+        if isinstance(image, FrameContext):
+            return image.hsv
+        buffers = self._buffers.get(image.shape)
+        return cv2.cvtColor(image, cv2.COLOR_BGR2HSV, dst=buffers.hsv)
+
+    def detect(self, image, names=None, hsv=None):
+        """
+        Маски диапазонов names (по умолчанию всех) для кадра BGR; hsv — уже готовое преобразование.
+        С FrameContext вместо кадра HSV берётся из контекста (общий для всех детекторов кадра).
+        """
+        if isinstance(image, FrameContext):
+            hsv = image.hsv if hsv is None else hsv
+            image = image.image
+        buffers = self._buffers.get(image.shape)
+        if hsv is None:
+            hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV, dst=buffers.hsv)
+        masks = {}
+        for name in (names if names is not None else self.ranges):
+            color_range = self.ranges[name]
+            mask, spare = buffers.masks_for(name)
+            cv2.inRange(hsv, color_range.lower, color_range.upper, dst=mask)
+            masks[name] = self._postprocess(mask, spare, color_range.steps)
+        return ColorMasks(hsv, masks)
+
+    @staticmethod
+    def _postprocess(mask, spare, steps):
+        # Каждый шаг пишет в свободный буфер пары — ни копий, ни новых массивов
+        for op, kernel, iterations in steps:
+            if op == "blur":
+                cv2.GaussianBlur(mask, (kernel, kernel), 0, dst=spare)
+            else:
+                cv2.morphologyEx(mask, _MORPH[op], kernel, dst=spare, iterations=iterations)
+            mask, spare = spare, mask
+        return mask
+
+
+def largest_blob(mask, min_area=50):
+    """Центр ограничивающей рамки самого большого контура маски или None"""
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return None
+    largest = max(contours, key=cv2.contourArea)
+    if cv2.contourArea(largest) < min_area:
+        return None
+    x, y, w, h = cv2.boundingRect(largest)
+    return x + w // 2, y + h // 2
+
+
+def round_blobs(mask, min_radius=15, max_radius=100, min_fill=0.6):
+    """Круглые пятна маски: [(x, y, radius)] — контуры, заполняющие описанную окружность на min_fill"""
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    blobs = []
+    for cnt in contours:
+        (x, y), radius = cv2.minEnclosingCircle(cnt)
+        if radius < min_radius or radius > max_radius:
+            continue
+        circle_area = math.pi * radius ** 2
+        if circle_area == 0 or cv2.contourArea(cnt) / circle_area < min_fill:
+            continue
+        blobs.append((x, y, radius))
+    return blobs
+
+
+def load_saved_ranges(path=SAVED_RANGES_FILE, steps=SPLASH_STEPS):
+    """Диапазоны, сохранённые пипеткой splash_hsv_detector.py, как saved_0, saved_1, ..."""
+    if not path or not os.path.exists(path):
+        return []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+    except Exception as e:
+        logger.error(f"Error loading saved HSV ranges: {e}")
+        return []
+    return [ColorRange(f"saved_{i}", entry["lower"], entry["upper"], steps)
+            for i, entry in enumerate(entries) if "lower" in entry and "upper" in entry]
@@ -1,71 +1,476 @@
 import json
 import os
+import atexit
 import logging
+import tempfile
+import threading
 
 logger = logging.getLogger("ConfigService")
 CONFIG_FILE = "fishing_config.json"
 
 DEFAULT_CONFIG = {
     "bind_key": "e",
+    # Ввод: "pydirectinput" или "sendinput" (WinAPI напрямую, пакетами); input_pause — пауза библиотек после вызова
+    "input_backend": "pydirectinput",
+    "input_pause": 0.0,
     "pause_key": "p",  # Добавлено
     "fishing_active": False,
     "speed": 5,
     "exit_key": "q",  # Клавиша для экстренного выхода
+    "move_mode": "splash",  # Режим движения без GUI (headless.py): "splash", "left" или "right"
     "splash_color_range": [[90, 150, 50], [120, 255, 255]],
-    "circle_params": {"dp": 1, "minDist": 100, "param1": 50, "param2": 30, "minRadius": 10, "maxRadius": 100}
+    "splash_open_iterations": 2,  # Итерации erode/dilate маски всплеска (0 — без очистки)
+    "calibration_color_range": [[79, 87, 52], [107, 118, 56]],
+    # Круг калибровки: "hsv" — порог calibration_color_range, "learned" — модель circle_detector.py
+    # (ширина круга на экране в пикселях — от circle_min_width до circle_max_width)
+    "circle_detector": "hsv",
+    "circle_model_path": "models/circle_hog.npz",
+    "circle_model_threshold": 0.0,
+    "circle_min_width": 16,
+    "circle_max_width": 80,
+    "circle_params": {"dp": 1, "minDist": 100, "param1": 50, "param2": 30, "minRadius": 10, "maxRadius": 100},
+    # Захват и поиск только в полосе калиброванного диапазона круга
+    "roi_enabled": True,
+    "roi_margin": 60,
+    "roi_widen_after": 5,
+    "roi_widen_step": 120,
+    # "exhaustive" — поиск шаблона по всему кадру, "pyramid" — грубый поиск с уточнением
+    "match_mode": "exhaustive",
+    "pyramid_scale": 2,
+    "match_threshold": 0.75,
+    "splash_min_distance": 50,
+    "splash_top_k": 10,
+    # Отладочные скриншоты: фоновая запись, выборка и бюджет диска на сессию
+    "debug_enabled": True,
+    "debug_every_n": 1,
+    "debug_events_only": False,
+    "debug_format": "png",
+    "debug_jpeg_quality": 85,
+    "debug_png_compression": 3,
+    "debug_budget_mb": 500,
+    "debug_queue_size": 8,
+    # Темп циклов: частота тиков (0 — без ограничения) и задержки вместо фиксированных sleep
+    "loop_rate_hz": 30,
+    "calibration_rate_hz": 10,
+    # Предел блокирующей калибровки (первичная и повторная серии), с; дополнительная серия — половина
+    "calibration_duration": 20,
+    "mouse_settle_delay": 0.2,
+    "target_cooldown": 0.0,
+    # "predictive" — упреждение цели на измеренную задержку от захвата кадра до ввода, "measured" — без него
+    "aim_mode": "predictive",
+    "aim_max_lead": 0.5,
+    # Замкнутый контур наведения в отдельном потоке (False — один шаг move_towards на цель)
+    "motion_controller": True,
+    "motion_rate_hz": 250,
+    "motion_kp": 0.35,
+    "motion_ki": 0.0,
+    "motion_kd": 0.1,
+    "motion_max_step": 40,
+    "motion_tolerance": 2.0,
+    "motion_substeps": 1,
+    "aim_timeout": 1.0,
+    # Монитор захвата (индекс mss, 0 — все мониторы; читается при создании общего источника кадров —
+    # смена вступает в силу после перезапуска) и масштаб координат ввода к пикселям захвата (0 — по размеру экрана ввода)
+    "capture_monitor": 1,
+    "input_scale": 0.0,
+    # Захват, детекция и ввод в отдельных потоках (False — последовательный цикл)
+    "pipeline_enabled": True,
+    # Пул процессов для поиска шаблона по полосам кадра (0 — в текущем процессе)
+    "parallel_workers": 0,
+    # Сопровождение круга и всплеска: поиск в окне вокруг прогноза, полный поиск после потери трека
+    "tracking_enabled": True,
+    "track_window": 80,
+    "track_max_misses": 5,
+    # Калибровка уточняется по кругу в своём кадре каждую calibration_every_n-ю итерацию основного цикла
+    # и сохраняется в calibration_file по разрешению — следующая сессия начинается без калибровки
+    "online_calibration": True,
+    "calibration_half_life": 60.0,
+    "calibration_every_n": 2,
+    "calibration_apply_interval": 5.0,
+    "calibration_file": "calibration.json",
+    # Метрики горячего пути: снимок в JSON раз в interval секунд, HTTP-эндпоинт на localhost (0 — выключен)
+    "metrics_enabled": True,
+    "metrics_snapshot_path": "logs/metrics.json",
+    "metrics_snapshot_interval": 5.0,
+    "metrics_http_port": 0,
+    # Запись сессии в debug_screenshots/<сессия>/session.gfs для replay.py (каждый record_every_n-й кадр).
+    # JPEG компактнее, но его артефакты сдвигают цвета: для точного повтора HSV-детекторов — "png"
+    "record_session": False,
+    "record_every_n": 1,
+    "record_format": "jpg",
+    "record_jpeg_quality": 90
 }
 
 
-def load_config():
+# --- Схема: ключ -> функция, которая приводит значение к нужному виду или бросает ValueError ---
+
+def _key(value):
+    if not isinstance(value, str) or len(value.strip()) != 1:
+        raise ValueError("expected a single character key")
+    return value.strip().lower()
+
+
+def _bool(value):
+    if not isinstance(value, bool):
+        raise ValueError("expected true/false")
+    return value
+
+
+def _number(low=None, high=None, cast=float):
+    def check(value):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError("expected a number")
+        if cast is int and value != int(value):
+            raise ValueError("expected an integer")
+        value = cast(value)
+        if (low is not None and value < low) or (high is not None and value > high):
+            raise ValueError(f"expected a value in [{low}, {high}]")
+        return value
+    return check
+
+
+def _choice(*options):
+    def check(value):
+        if value not in options:
+            raise ValueError(f"expected one of {', '.join(options)}")
+        return value
+    return check
+
+
+# Пределы каналов HSV в OpenCV (8 бит): H — 0..179, S и V — 0..255
+_HSV_LIMITS = (179, 255, 255)
+
+
+def _hsv_range(value):
+    if (not isinstance(value, (list, tuple)) or len(value) != 2
+            or any(not isinstance(bound, (list, tuple)) or len(bound) != 3 for bound in value)):
+        raise ValueError("expected [[h, s, v], [h, s, v]]")
+    bounds = []
+    for bound in value:
+        if any(isinstance(c, bool) or not isinstance(c, (int, float)) or c != int(c) for c in bound):
+            raise ValueError("expected integer channel values")
+        if any(not 0 <= c <= limit for c, limit in zip(bound, _HSV_LIMITS)):
+            raise ValueError("expected H in [0, 179], S and V in [0, 255]")
+        bounds.append([int(c) for c in bound])
+    return bounds
+
+
+def _string(value):
+    if not isinstance(value, str):
+        raise ValueError("expected a string")
+    return value
+
+
+def _dict(value):
+    if not isinstance(value, dict):
+        raise ValueError("expected an object")
+    return dict(value)
+
+
+SCHEMA = {
+    "bind_key": _key,
+    "pause_key": _key,
+    "exit_key": _key,
+    "fishing_active": _bool,
+    "move_mode": _choice("splash", "left", "right"),
+    "speed": _number(1, 10, int),
+    "calibration_duration": _number(0.5, 120),
+    "splash_color_range": _hsv_range,
+    "splash_open_iterations": _number(0, 10, int),
+    "calibration_color_range": _hsv_range,
+    "circle_detector": _choice("hsv", "learned"),
+    "circle_model_path": _string,
+    "circle_model_threshold": _number(),
+    "circle_min_width": _number(4, None, int),
+    "circle_max_width": _number(4, None, int),
+    "circle_params": _dict,
+    "roi_enabled": _bool,
+    "roi_margin": _number(0, None, int),
+    "roi_widen_after": _number(1, None, int),
+    "roi_widen_step": _number(0, None, int),
+    "match_mode": _choice("exhaustive", "pyramid"),
+    "pyramid_scale": _number(1, 16, int),
+    "match_threshold": _number(0.0, 1.0),
+    "splash_min_distance": _number(0, None, int),
+    "splash_top_k": _number(1, None, int),
+    "debug_enabled": _bool,
+    "debug_every_n": _number(1, None, int),
+    "debug_events_only": _bool,
+    "debug_format": _choice("png", "jpg", "jpeg"),
+    "debug_jpeg_quality": _number(1, 100, int),
+    "debug_png_compression": _number(0, 9, int),
+    "debug_budget_mb": _number(0, None),
+    "debug_queue_size": _number(1, None, int),
+    "loop_rate_hz": _number(0, 1000),
+    "calibration_rate_hz": _number(0, 1000),
+    "mouse_settle_delay": _number(0, 5),
+    "target_cooldown": _number(0, 60),
+    "aim_mode": _choice("predictive", "measured"),
+    "aim_max_lead": _number(0, 5),
+    "motion_controller": _bool,
+    "motion_rate_hz": _number(1, 2000),
+    "motion_kp": _number(0, 2),
+    "motion_ki": _number(0, 1),
+    "motion_kd": _number(0, 2),
+    "motion_max_step": _number(1, None),
+    "motion_tolerance": _number(0, None),
+    "motion_substeps": _number(1, 64, int),
+    "aim_timeout": _number(0, 60),
+    "input_backend": _choice("pydirectinput", "sendinput", "recording", "null"),
+    "input_pause": _number(0, 1),
+    "capture_monitor": _number(0, 16, int),
+    "input_scale": _number(0, 8),
+    "pipeline_enabled": _bool,
+    "parallel_workers": _number(0, 64, int),
+    "tracking_enabled": _bool,
+    "track_window": _number(1, None, int),
+    "track_max_misses": _number(0, None, int),
+    "online_calibration": _bool,
+    "calibration_half_life": _number(0, None),
+    "calibration_every_n": _number(1, None, int),
+    "calibration_apply_interval": _number(0, None),
+    "calibration_file": _string,
+    "metrics_enabled": _bool,
+    "metrics_snapshot_path": _string,
+    "metrics_snapshot_interval": _number(0.1, None),
+    "metrics_http_port": _number(0, 65535, int),
+    "record_session": _bool,
+    "record_every_n": _number(1, None, int),
+    "record_format": _choice("jpg", "jpeg", "png"),
+    "record_jpeg_quality": _number(1, 100, int),
+}
+
+
+def validate(key, value):
+    """Проверенное значение ключа. Ключи вне схемы принимаются как есть"""
+    check = SCHEMA.get(key)
+    if check is None:
+        return value
     try:
-        if not os.path.exists(CONFIG_FILE):
+        return check(value)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid value for '{key}': {value!r} ({e})")
+
+
+def parse_overrides(items):
+    """
+    Переопределения KEY=VALUE из командной строки. Значение читается как JSON; если разобранное
+    значение не проходит проверку ключа (input_backend=null, exit_key=1), берётся исходная строка.
+    """
+    overrides = {}
+    for item in items:
+        key, _, raw = item.partition("=")
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            value = raw
+        if value is not raw:
+            try:
+                validate(key, value)
+            except ValueError:
+                value = raw
+        overrides[key] = value
+    return overrides
+
+
+class ConfigStore:
+    """
+    Конфиг в памяти: чтение без обращения к диску, проверка значений по SCHEMA,
+    подписчики на изменения и отложенная атомарная запись (временный файл + os.replace).
+    Серия изменений за save_delay секунд (например, движение ползунка) даёт одну запись.
+    Подписчик вызывается как callback(key, value) в потоке, который изменил значение.
+    С path=None хранилище живёт только в памяти (replay, подбор параметров): initial
+    поверх DEFAULT_CONFIG, на диск ничего не пишется.
+    """
+
+    def __init__(self, path=CONFIG_FILE, save_delay=0.5, initial=None):
+        self.path = path
+        self.save_delay = save_delay
+        self._lock = threading.RLock()
+        self._subscribers = []
+        self._timer = None
+        self._dirty = False
+        self._data = self._load() if path is not None else dict(DEFAULT_CONFIG)
+        if initial:
+            self._data.update({key: validate(key, value) for key, value in initial.items()})
+
+    def _load(self):
+        data = dict(DEFAULT_CONFIG)
+        if not os.path.exists(self.path):
             logger.info("Config file not found, creating default")
-            save_config(DEFAULT_CONFIG)
-            return DEFAULT_CONFIG.copy()
+            self._write(data)
+            return data
+        try:
+            with open(self.path, 'r') as f:
+                stored = json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading config: {e}, using default")
+            return data
+
+        for key, value in stored.items():
+            try:
+                data[key] = validate(key, value)
+            except ValueError as e:
+                logger.warning(f"{e}, using default")
+        logger.info("Config loaded successfully")
+        return data
+
+    def _write(self, data):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".config_", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f, indent=4)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    # --- Чтение (словарный интерфейс, как у прежнего dict из load_config) ---
 
-        with open(CONFIG_FILE, 'r') as f:
-            config = json.load(f)
-            logger.info("Config loaded successfully")
-            return config
-    except Exception as e:
-        logger.error(f"Error loading config: {e}, using default")
-        return DEFAULT_CONFIG.copy()
+    def get(self, key, default=None):
+        return self._data.get(key, default)
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def snapshot(self):
+        with self._lock:
+            return json.loads(json.dumps(self._data))
+
+    # --- Изменение ---
+
+    def set(self, key, value):
+        """Проверяет и сохраняет значение. Возвращает True, если оно изменилось"""
+        return self.update({key: value})
+
+    def update(self, values):
+        """Проверяет все значения и только потом применяет их: при ошибке не меняется ни один ключ"""
+        values = {key: validate(key, value) for key, value in values.items()}
+        with self._lock:
+            changed = {}
+            for key, value in values.items():
+                if self._data.get(key) != value:
+                    self._data[key] = value
+                    changed[key] = value
+            if changed and self.path is not None:
+                self._dirty = True
+                self._schedule_save()
+            subscribers = list(self._subscribers)
+
+        for key, value in changed.items():
+            for keys, callback in subscribers:
+                if keys is None or key in keys:
+                    try:
+                        callback(key, value)
+                    except Exception as e:
+                        logger.error(f"Config subscriber error for '{key}': {e}")
+        return bool(changed)
+
+    def subscribe(self, callback, keys=None):
+        """Подписка на изменения (всех ключей или только keys). Возвращает функцию отписки"""
+        entry = (frozenset(keys) if keys is not None else None, callback)
+        with self._lock:
+            self._subscribers.append(entry)
+
+        def unsubscribe():
+            with self._lock:
+                if entry in self._subscribers:
+                    self._subscribers.remove(entry)
+        return unsubscribe
+
+    # --- Запись на диск ---
+
+    def _schedule_save(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(self.save_delay, self.flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def flush(self):
+        """Немедленно записывает несохранённые изменения на диск"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty:
+                return True
+            self._dirty = False
+            data = self.snapshot()
+        try:
+            self._write(data)
+            logger.info("Config saved successfully")
+            return True
+        except Exception as e:
+            logger.error(f"Error saving config: {e}")
+            with self._lock:
+                self._dirty = True
+            return False
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_config_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ConfigStore()
+            # Отложенная запись не должна потеряться при выходе
+            atexit.register(_store.flush)
+        return _store
+
+
+# --- Прежние функции: теперь работают через хранилище в памяти ---
+
+def load_config():
+    """Копия текущего конфига (без чтения с диска)"""
+    return get_config_store().snapshot()
 
 
 def save_config(config):
+    store = get_config_store()
     try:
-        with open(CONFIG_FILE, 'w') as f:
-            json.dump(config, f, indent=4)
-        logger.info("Config saved successfully")
-        return True
-    except Exception as e:
+        store.update(config)
+    except ValueError as e:
         logger.error(f"Error saving config: {e}")
         return False
+    return store.flush()
+
+
+def _set(key, value):
+    try:
+        get_config_store().set(key, value)
+        return True
+    except ValueError as e:
+        logger.error(str(e))
+        return False
 
 
 def update_bind_key(new_key):
-    config = load_config()
-    config['bind_key'] = new_key
-    return save_config(config)
+    return _set('bind_key', new_key)
 
 
 def update_pause_key(new_key):
-    config = load_config()
-    config['pause_key'] = new_key
-    return save_config(config)
+    return _set('pause_key', new_key)
 
 
 def update_speed(new_speed):
-    config = load_config()
-    config['speed'] = new_speed
-    return save_config(config)
+    return _set('speed', new_speed)
 
 
 def set_fishing_active(state):
-    config = load_config()
-    config['fishing_active'] = state
-    return save_config(config)
+    return _set('fishing_active', state)
+
+
 def update_exit_key(new_key):
-    config = load_config()
-    config['exit_key'] = new_key
-    return save_config(config)
+    return _set('exit_key', new_key)
@@ -0,0 +1,49 @@
+# dataset.py
+import os
+import glob
+import logging
+import xml.etree.ElementTree as ET
+import cv2
+
+logger = logging.getLogger("Dataset")
+
+DATASET_DIR = "ai dev"
+
+
+def load_voc_boxes(xml_path, label=None):
+    """Читает рамки из Pascal-VOC XML: список (name, xmin, ymin, xmax, ymax)"""
+    root = ET.parse(xml_path).getroot()
+    boxes = []
+    for obj in root.iter("object"):
+        name = obj.findtext("name")
+        if label is not None and name != label:
+            continue
+        box = obj.find("bndbox")
+        boxes.append((
+            name,
+            int(float(box.findtext("xmin"))),
+            int(float(box.findtext("ymin"))),
+            int(float(box.findtext("xmax"))),
+            int(float(box.findtext("ymax")))
+        ))
+    return boxes
+
+
+def iter_split(split, dataset_dir=DATASET_DIR, label="circle", load_images=True):
+    """
+    Перебирает кадры выборки ("train" / "val"): (имя файла, BGR-изображение, рамки).
+    Кадры без разметки отдаются с пустым списком рамок.
+    """
+    images_dir = os.path.join(dataset_dir, "images", split)
+    annotations_dir = os.path.join(dataset_dir, "annotations", f"{split}_xml")
+    for image_path in sorted(glob.glob(os.path.join(images_dir, "*.png"))):
+        name = os.path.splitext(os.path.basename(image_path))[0]
+        xml_path = os.path.join(annotations_dir, name + ".xml")
+        boxes = load_voc_boxes(xml_path, label) if os.path.exists(xml_path) else []
+        image = None
+        if load_images:
+            image = cv2.imread(image_path, cv2.IMREAD_COLOR)
+            if image is None:
+                logger.warning(f"Skipping unreadable image: {image_path}")
+                continue
+        yield os.path.basename(image_path), image, [b[1:] for b in boxes]
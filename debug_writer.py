@@ -0,0 +1,120 @@
+# debug_writer.py
+import os
+import threading
+import logging
+from collections import deque
+import cv2
+
+from metrics import timer, inc
+
+logger = logging.getLogger("DebugWriter")
+
+
+class DebugWriter:
+    """
+    Фоновая запись отладочных скриншотов. Отрисовка и кодирование выполняются в отдельном
+    потоке, очередь ограничена max_queue (при переполнении выбрасывается самый старый кадр),
+    запись прекращается по исчерпании бюджета диска на сессию.
+
+    Выборка: every_n — сохранять каждый N-й обычный шаг; events_only — только события
+    (итог калибровки, маршрут и т.п.), обычные шаги не сохраняются вовсе.
+    """
+
+    def __init__(self, session_dir, max_queue=8, every_n=1, events_only=False, image_format="png",
+                 jpeg_quality=85, png_compression=3, budget_mb=500):
+        self.session_dir = session_dir
+        self.every_n = max(1, every_n)
+        self.events_only = events_only
+        self.image_format = image_format.lower().lstrip(".")
+        if self.image_format in ("jpg", "jpeg"):
+            self.image_format = "jpg"
+            self._encode_params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+        else:
+            self.image_format = "png"
+            self._encode_params = [cv2.IMWRITE_PNG_COMPRESSION, png_compression]
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+
+        self.bytes_written = 0
+        self.written = 0
+        self.dropped = 0
+        self._step = 0
+        self._budget_exhausted = False
+        self._queue = deque(maxlen=max(1, max_queue))
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="DebugWriter", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_config(cls, session_dir, config):
+        return cls(
+            session_dir,
+            max_queue=config.get("debug_queue_size", 8),
+            every_n=config.get("debug_every_n", 1),
+            events_only=config.get("debug_events_only", False),
+            image_format=config.get("debug_format", "png"),
+            jpeg_quality=config.get("debug_jpeg_quality", 85),
+            png_compression=config.get("debug_png_compression", 3),
+            budget_mb=config.get("debug_budget_mb", 500)
+        )
+
+    def should_write(self, event=False):
+        """Решение о выборке принимается до копирования кадра, чтобы пропуск ничего не стоил"""
+        if self._budget_exhausted or self._closed:
+            return False
+        if event:
+            return True
+        if self.events_only:
+            return False
+        self._step += 1
+        return (self._step - 1) % self.every_n == 0
+
+    def submit(self, path, render, *args, **kwargs):
+        """Ставит в очередь отрисовку render(*args, **kwargs) -> BGR-изображение и запись в path"""
+        path = os.path.splitext(path)[0] + "." + self.image_format
+        with self._cond:
+            if len(self._queue) == self._queue.maxlen:
+                self.dropped += 1
+                inc("debug.dropped")
+                logger.debug("Debug queue full, dropping oldest screenshot")
+            self._queue.append((path, render, args, kwargs))
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                path, render, args, kwargs = self._queue.popleft()
+            try:
+                with timer("debug.write"):
+                    self._write(path, render(*args, **kwargs))
+            except Exception as e:
+                logger.error(f"Debug screenshot error: {e}")
+
+    def _write(self, path, img):
+        ok, encoded = cv2.imencode("." + self.image_format, img, self._encode_params)
+        if not ok:
+            logger.error(f"Failed to encode debug screenshot: {path}")
+            return
+        if self.bytes_written + encoded.nbytes > self.budget_bytes:
+            if not self._budget_exhausted:
+                self._budget_exhausted = True
+                logger.warning(f"Debug disk budget exhausted ({self.bytes_written // (1024 * 1024)} MB), "
+                               f"further screenshots are skipped")
+            return
+        with open(path, "wb") as f:
+            f.write(encoded.tobytes())
+        self.bytes_written += encoded.nbytes
+        self.written += 1
+        inc("debug.written")
+
+    def close(self, timeout=5.0):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
+        logger.info(f"Debug writer closed: {self.written} written, {self.dropped} dropped, "
+                    f"{self.bytes_written / (1024 * 1024):.1f} MB")
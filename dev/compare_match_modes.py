@@ -0,0 +1,120 @@
+"""
+Сравнение точности и скорости exhaustive- и pyramid-поиска шаблона на размеченных кадрах из "ai dev".
+
+Шаблон вырезается по рамке круга из первого размеченного кадра train-выборки
+(или берётся из --template). Запуск из корня репозитория:
+    python dev/compare_match_modes.py --split val --scales 2 4
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dataset import iter_split  # noqa: E402
+from vision_service import match_template  # noqa: E402
+
+
+def cut_template(split="train"):
+    for name, image, boxes in iter_split(split):
+        if boxes:
+            xmin, ymin, xmax, ymax = boxes[0]
+            print(f"Шаблон вырезан из {name}: {xmax - xmin}x{ymax - ymin}")
+            return cv2.cvtColor(image[ymin:ymax, xmin:xmax], cv2.COLOR_BGR2GRAY)
+    raise SystemExit("В выборке нет размеченных рамок для шаблона")
+
+
+def cluster(points, radius=20):
+    """Жадно схлопывает соседние совпадения в один центр (только для отчёта)"""
+    centers = []
+    for x, y in points:
+        if all((x - cx) ** 2 + (y - cy) ** 2 > radius ** 2 for cx, cy in centers):
+            centers.append((int(x), int(y)))
+    return centers
+
+
+def evaluate(mode, scale, frames, template, threshold, repeats):
+    th, tw = template.shape[:2]
+    timings = []
+    hits = 0
+    total_boxes = 0
+    detections = {}
+    for name, gray, boxes in frames:
+        start = time.perf_counter()
+        for _ in range(repeats):
+            matches, _ = match_template(gray, template, threshold, mode=mode, pyramid_scale=scale)
+        timings.append((time.perf_counter() - start) * 1000 / repeats)
+
+        centers = cluster(matches)
+        detections[name] = (centers, matches)
+        total_boxes += len(boxes)
+        for xmin, ymin, xmax, ymax in boxes:
+            if any(xmin <= x + tw // 2 <= xmax and ymin <= y + th // 2 <= ymax for x, y in centers):
+                hits += 1
+
+    return {
+        "mode": mode if mode == "exhaustive" else f"pyramid/{scale}",
+        "mean_ms": float(np.mean(timings)),
+        "p95_ms": float(np.percentile(timings, 95)),
+        "recall": hits / total_boxes if total_boxes else None,
+        "detections": sum(len(v[0]) for v in detections.values()),
+    }, detections
+
+
+def agreement(reference, candidate, radius=20):
+    """Доля всплесков exhaustive-режима, рядом с которыми сравниваемый режим тоже дал совпадение"""
+    total = matched = 0
+    for name, (ref_centers, _) in reference.items():
+        raw = candidate[name][1]
+        for x, y in ref_centers:
+            total += 1
+            if len(raw) and np.any(np.hypot(raw[:, 0] - x, raw[:, 1] - y) <= radius):
+                matched += 1
+    return matched / total if total else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exhaustive vs pyramid template matching")
+    parser.add_argument("--split", default="val")
+    parser.add_argument("--template", help="путь к шаблону (по умолчанию вырезается из train)")
+    parser.add_argument("--threshold", type=float, default=0.75)
+    parser.add_argument("--scales", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--json", help="сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    if args.template:
+        template = cv2.imread(args.template, cv2.IMREAD_GRAYSCALE)
+    else:
+        template = cut_template()
+
+    frames = [(name, cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), boxes)
+              for name, image, boxes in iter_split(args.split)]
+    print(f"Кадров: {len(frames)}, шаблон {template.shape[1]}x{template.shape[0]}, порог {args.threshold}")
+
+    baseline, reference = evaluate("exhaustive", 1, frames, template, args.threshold, args.repeats)
+    baseline["agreement"] = 1.0
+    results = [baseline]
+    for scale in args.scales:
+        result, found = evaluate("pyramid", scale, frames, template, args.threshold, args.repeats)
+        result["agreement"] = agreement(reference, found)
+        result["speedup"] = baseline["mean_ms"] / result["mean_ms"]
+        results.append(result)
+
+    for r in results:
+        recall = "n/a" if r["recall"] is None else f"{r['recall']:.2f}"
+        print(f"{r['mode']:>12}: {r['mean_ms']:7.1f} ms (p95 {r['p95_ms']:.1f}), recall {recall}, "
+              f"agreement {r['agreement']:.2f}, detections {r['detections']}"
+              + (f", x{r['speedup']:.1f}" if "speedup" in r else ""))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
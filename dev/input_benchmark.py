@@ -0,0 +1,69 @@
+"""
+Микробенчмарк бэкендов ввода: задержка одного события (p50 / p99) и пропускная способность
+при пакетной отправке сдвигов. Сдвиги чередуются (+1, 0) / (-1, 0), так что курсор
+возвращается на место. Бэкенды, недоступные на этой системе, пропускаются.
+Запуск из корня репозитория:
+    python dev/input_benchmark.py --backends pydirectinput sendinput recording null --events 2000
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from input_backends import BACKENDS, create_backend  # noqa: E402
+
+
+def single_event_latency(backend, events):
+    timings = np.empty(events)
+    for i in range(events):
+        dx = 1 if i % 2 == 0 else -1
+        start = time.perf_counter()
+        backend.move_relative(dx, 0)
+        timings[i] = time.perf_counter() - start
+    return timings * 1e6
+
+
+def batch_throughput(backend, events, batch_size):
+    batch = [(1 if i % 2 == 0 else -1, 0) for i in range(batch_size)]
+    batches = max(1, events // batch_size)
+    start = time.perf_counter()
+    for _ in range(batches):
+        backend.move_batch(batch)
+    elapsed = time.perf_counter() - start
+    return batches * batch_size / elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Input backend latency / throughput micro-benchmark")
+    parser.add_argument("--backends", nargs="+", choices=list(BACKENDS), default=list(BACKENDS))
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--batch", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--delay", type=float, default=3.0, help="пауза перед стартом для реальных бэкендов, с")
+    args = parser.parse_args(argv)
+
+    backends = []
+    for name in args.backends:
+        try:
+            kwargs = {"pause": 0.0} if name == "pydirectinput" else {}
+            backends.append(create_backend(name, **kwargs))
+        except Exception as e:
+            print(f"{name:>14}: недоступен ({e})")
+    if any(b.name in ("pydirectinput", "sendinput") for b in backends) and args.delay > 0:
+        print(f"Старт через {args.delay:.0f} с — курсор будет дёргаться на 1 px")
+        time.sleep(args.delay)
+
+    for backend in backends:
+        latency = single_event_latency(backend, args.events)
+        line = (f"{backend.name:>14}: event p50 {np.percentile(latency, 50):8.1f} us  "
+                f"p99 {np.percentile(latency, 99):8.1f} us")
+        for size in args.batch:
+            line += f"  batch {size}: {batch_throughput(backend, args.events, size):10.0f} ev/s"
+        print(line)
+        backend.close()
+
+
+if __name__ == "__main__":
+    main()
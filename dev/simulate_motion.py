@@ -0,0 +1,66 @@
+"""
+Прогон контроллера движения на записывающем бэкенде ввода (без дисплея и без игры):
+время установления и перерегулирование при разной чувствительности (gain)
+и запаздывании ввода (lag, в событиях).
+Запуск из корня репозитория:
+    python dev/simulate_motion.py --kp 0.35 --kd 0.1 --gain 1.0 1.5 --lag 0 2
+"""
+import os
+import sys
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from input_backends import RecordingBackend  # noqa: E402
+from motion_controller import MotionController  # noqa: E402
+
+
+def run(args, gain, lag):
+    mouse = RecordingBackend((960, 540), gain=gain, lag=lag)
+    controller = MotionController(mouse.move_relative, mouse.position, rate_hz=args.rate, kp=args.kp, ki=args.ki,
+                                  kd=args.kd, max_step=args.max_step, tolerance=args.tolerance,
+                                  move_batch=mouse.move_batch, substeps=args.substeps)
+    rng = random.Random(args.seed)
+    controller.start()
+    try:
+        unsettled = 0
+        for _ in range(args.targets):
+            controller.set_target((rng.randint(100, 1820), rng.randint(100, 980)))
+            if not controller.wait_settled(args.timeout).settled:
+                controller.cancel()
+                unsettled += 1
+    finally:
+        controller.stop()
+    return controller.stats(), unsettled, len(mouse.moves)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Motion controller simulation on the recording input backend")
+    parser.add_argument("--rate", type=float, default=250)
+    parser.add_argument("--kp", type=float, default=0.35)
+    parser.add_argument("--ki", type=float, default=0.0)
+    parser.add_argument("--kd", type=float, default=0.1)
+    parser.add_argument("--max-step", type=float, default=40)
+    parser.add_argument("--tolerance", type=float, default=2.0)
+    parser.add_argument("--substeps", type=int, default=1)
+    parser.add_argument("--gain", type=float, nargs="+", default=[1.0])
+    parser.add_argument("--lag", type=int, nargs="+", default=[0])
+    parser.add_argument("--targets", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    for gain in args.gain:
+        for lag in args.lag:
+            s, unsettled, moves = run(args, gain, lag)
+            if not s["moves"]:
+                print(f"gain {gain:4.2f} lag {lag}: ни одно движение не установилось")
+                continue
+            print(f"gain {gain:4.2f} lag {lag}: settle {s['mean_settle_ms']:6.1f} ms (max {s['max_settle_ms']:6.1f})  "
+                  f"overshoot {s['mean_overshoot_px']:5.1f} px (max {s['max_overshoot_px']:5.1f})  "
+                  f"unsettled {unsettled}  moves sent {moves}")
+
+
+if __name__ == "__main__":
+    main()
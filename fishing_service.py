@@ -1,29 +1,91 @@
-import time
 import logging
-import keyboard
-import pyautogui
-from input_service import press_key, move_mouse_relative, mouse_down_right, mouse_up_right, move_towards
-from config_service import load_config
+from input_service import (press_key, move_mouse_relative, move_mouse_batch, mouse_down_right, mouse_up_right,
+                           move_towards, cursor_position, set_input_backend)
+from input_backends import create_backend
+from config_service import get_config_store
+from vision_service import get_frame_source, match_template, suppress_peaks
+from capture_service import AdaptiveBand
+from template_store import TemplateStore
+from scheduler import Clock, TickScheduler
+from pipeline import FishingPipeline
+from tracker import TargetTracker
+from calibration import OnlineCalibration, load_profile, save_profile, CALIBRATION_FILE
+from motion_controller import MotionController
+from metrics import MetricsExporter, get_metrics, timed, observe, inc
+from color_detection import ColorDetector, round_blobs, splash_steps
+from frame_context import FrameContext, context_for
+from geometry import ScreenGeometry
 import cv2
 import numpy as np
 import os
 import math
+import threading
+from collections import deque
 from datetime import datetime
 
 logger = logging.getLogger("FishingService")
 
+# Обученный детектор круга: после находки ширины ищутся в этих пределах от ширины последнего круга
+LEARNED_WIDTH_SLACK = 1.3
+
 
 class FishingManager:
-    def __init__(self):
+    def __init__(self, frame_source=None, clock=None, input_backend=None, config=None, hotkeys=True):
         self.running = False
         self.paused = False
-        self.config = load_config()
-        self.move_mode = 'splash'
+        # Живой конфиг в памяти: изменения из GUI применяются без перезапуска сессии
+        self.config = config if config is not None else get_config_store()
+        self._unsubscribe_config = self.config.subscribe(self._on_config_change)
+        self.hotkeys = hotkeys
+        self._hotkeys = []
+        self.move_mode = self.config.get("move_mode", "splash")
         self.circle_range = (0, 0)
         self.circle_speed = 100
         self.circle_start_position = (0, 0)
         # Изменяем на вертикальные позиции
         self.circle_y_positions = []  # ТЕПЕРЬ ОТСЛЕЖИВАЕМ ВЕРТИКАЛЬНЫЕ ПОЗИЦИИ
+        self.circle_x_positions = []
+        self.calibration = None
+        self._calibration_frames = 0
+        self._last_calibration_apply = 0.0
+        self._calibration_defaults_warned = False
+        # Ширина последнего круга обученного детектора (None — искать во всём диапазоне ширин)
+        self._circle_width = None
+        # Свой контекст для кадра калибровки: контекст потока занят кадром поиска всплесков
+        self._calibration_context = FrameContext()
+        self.frame_source = frame_source
+        # Раскладка экрана снимается один раз на источник кадров (см. screen_geometry)
+        self.geometry = None
+        self._geometry_source = None
+        self.clock = clock if clock is not None else Clock()
+        self.input_backend = input_backend
+        if input_backend is not None:
+            set_input_backend(input_backend)
+        self.roi = AdaptiveBand()
+        self.templates = TemplateStore()
+        self.templates.register("splash")
+        # HSV-диапазоны (круг калибровки, цвет всплеска) с буферами масок под размер кадра
+        self.colors = ColorDetector.from_config(self.config)
+        self.last_splash_scores = []
+        self.debug_writer = None
+        self.loop_scheduler = None
+        self.parallel = None
+        self.motion = None
+        self.metrics_exporter = None
+        # Запись сессии (SessionRecorder или сборщик событий replay) и корень отладочных папок
+        self.recorder = None
+        self._owns_recorder = False
+        self.session_root = "debug_screenshots"
+        # Задержка «захват кадра -> отправка ввода» последних наведений, с
+        self.aim_latencies = deque(maxlen=500)
+        self.circle_tracker = TargetTracker("circle")
+        self.splash_tracker = TargetTracker("splash")
+        # Выход по клавише или сигналу: сессия останавливается штатно, процесс завершает владелец
+        # менеджера (GUI, headless.py) через on_exit, дождавшись wait_stopped
+        self.exit_requested = threading.Event()
+        self.on_exit = None
+        self._stopped = threading.Event()
+        self._stopped.set()
         logger.info("Fishing manager initialized")
 
     def toggle_pause(self):
@@ -37,72 +99,248 @@ class FishingManager:
         else:
             logger.warning(f"Invalid move mode attempted to set: {mode}")
 
-    def find_calibration_circle(self):
-        screenshot = pyautogui.screenshot()
-        frame = np.array(screenshot)
-        frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-        hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-
-        lower_color = np.array([79, 87, 52])
-        upper_color = np.array([107, 118, 56])
-
-        mask = cv2.inRange(hsv, lower_color, upper_color)
-
-        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
-        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
-        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
-
-        mask = cv2.GaussianBlur(mask, (5, 5), 0)
-
-        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    def ensure_frame_source(self):
+        """Общий источник кадров для монитора capture_monitor, если источник не передан явно"""
+        if self.frame_source is None:
+            self.frame_source = get_frame_source(self.config.get("capture_monitor", 1))
+        return self.frame_source
+
+    def screen_geometry(self):
+        """Раскладка экрана текущего источника кадров: снимается один раз, дальше только из кэша"""
+        source = self.ensure_frame_source()
+        if self.geometry is None or self._geometry_source is not source:
+            self.geometry = ScreenGeometry.detect(source, self.input_backend, self.config.get("input_scale", 0.0))
+            self._geometry_source = source
+        return self.geometry
+
+    def cursor_in_capture(self):
+        """Позиция курсора в пикселях захвата — в том же пространстве, что и найденные цели"""
+        return self.screen_geometry().to_capture(cursor_position())
+
+    def grab_frame(self, region=None):
+        """Один захват кадра на итерацию — дальше он передаётся всем потребителям"""
+        self.ensure_frame_source()
+        frame = self.frame_source.grab(region)
+        if frame is not None and self.recorder is not None:
+            self.recorder.record_frame(frame)
+        return frame
+
+    def grab_roi_frame(self):
+        """Захват только полосы области интереса (или всего экрана, если ROI не задана)"""
+        self.ensure_frame_source()
+        screen_width, screen_height = self.screen_geometry().size
+        return self.grab_frame(self.roi.region(screen_width, screen_height))
+
+    def grab_tracked_frame(self, tracker, fallback_region=None):
+        """Захват окна вокруг прогноза трека; без трека — fallback_region (или весь экран)"""
+        self.ensure_frame_source()
+        region = fallback_region
+        if self.config.get("tracking_enabled", True):
+            window = tracker.window(self.clock.now(), self.screen_geometry().size)
+            if window is not None:
+                region = window
+        return self.grab_frame(region)
+
+    def grab_search_frame(self):
+        """Кадр для поиска всплесков: окно трека цели, а если трек потерян — полоса ROI"""
+        self.ensure_frame_source()
+        screen_width, screen_height = self.screen_geometry().size
+        return self.grab_tracked_frame(self.splash_tracker, self.roi.region(screen_width, screen_height))
+
+    def configure_trackers(self, reset=True):
+        for tracker in (self.circle_tracker, self.splash_tracker):
+            tracker.min_half_size = self.config.get("track_window", 80)
+            tracker.max_misses = self.config.get("track_max_misses", 5)
+            if reset:
+                tracker.reset()
+
+    def start_recording(self, session_dir):
+        """
+        Запись сессии по record_session (или уже подставленный извне recorder — replay).
+        Ввод идёт через прокси, который пишет каждое событие в сессию.
+        """
+        if self.recorder is None and self.config.get("record_session", False):
+            from session_recorder import SessionRecorder
+            path = os.path.join(session_dir, "session.gfs")
+            self.recorder = SessionRecorder.from_config(path, self.config, self.clock.now)
+            self._owns_recorder = True
+        if self.recorder is None:
+            return
+        from session_recorder import RecordingInputProxy
+        self.ensure_frame_source()
+        self.recorder.record_event("meta", screen=list(self.screen_geometry().size),
+                                   cursor=list(self.cursor_in_capture()), config=self.config.snapshot())
+        set_input_backend(RecordingInputProxy(self.input_backend, self.recorder))
+
+    def stop_recording(self):
+        if self.recorder is None:
+            return
+        set_input_backend(self.input_backend)
+        if self._owns_recorder:
+            self.recorder.close()
+            self.recorder = None
+            self._owns_recorder = False
+
+    def register_hotkeys(self):
+        """(Пере)назначает клавиши паузы и экстренного выхода из текущего конфига"""
+        import keyboard
+        for hook in self._hotkeys:
+            keyboard.unhook(hook)
+        self._hotkeys = [
+            keyboard.on_press_key(self.config.get("exit_key", "q"), lambda _: self.force_exit()),
+            keyboard.on_press_key(self.config.get("pause_key", "p"), lambda _: self.toggle_pause()),
+        ]
+
+    def _on_config_change(self, key, value):
+        """Применяет изменённый ключ к идущей сессии; остальные ключи и так читаются при использовании"""
+        if key == "metrics_enabled":
+            get_metrics().enabled = value
+        elif key == "calibration_color_range":
+            self.colors.set_range("circle", *value)
+        elif key == "splash_color_range":
+            self.colors.set_range("splash", *value)
+        elif key == "splash_open_iterations":
+            splash = self.colors.ranges["splash"]
+            self.colors.set_range("splash", splash.lower, splash.upper, splash_steps(value))
+        elif key == "input_scale":
+            self.geometry = None
+        if not self.running:
+            return
+        if key in ("pause_key", "exit_key"):
+            self.register_hotkeys()
+        elif key.startswith("roi_"):
+            self.configure_roi()
+        elif key in ("track_window", "track_max_misses"):
+            self.configure_trackers(reset=False)
+        elif key == "loop_rate_hz" and self.loop_scheduler is not None:
+            self.loop_scheduler.set_rate(value)
+        elif (key == "speed" or key.startswith("motion_")) and self.motion is not None:
+            self.motion.configure(self.config)
+        else:
+            return
+        logger.info(f"Applied config change live: {key} = {value!r}")
 
+    def configure_input(self):
+        """Бэкенд ввода из конфига, если он не передан явно (тесты, replay)"""
+        if self.input_backend is not None:
+            return
+        name = self.config.get("input_backend", "pydirectinput")
+        kwargs = {"pause": self.config.get("input_pause", 0.0)} if name == "pydirectinput" else {}
+        self.input_backend = create_backend(name, **kwargs)
+        set_input_backend(self.input_backend)
+
+    def configure_roi(self):
+        self.roi.enabled = self.config.get("roi_enabled", True)
+        self.roi.margin = self.config.get("roi_margin", 60)
+        self.roi.widen_after = self.config.get("roi_widen_after", 5)
+        self.roi.widen_step = self.config.get("roi_widen_step", 120)
+
+    @timed("detect.calibration_circle")
+    def find_calibration_circle(self, frame=None):
+        if frame is None:
+            frame = self.grab_frame()
+        if frame is None:
+            return [], 0
+        # Кадр или его контекст: HSV считается один раз на кадр для всех детекторов
+        frame = context_for(frame)
         detected_circles = []
         average_radius = 0
 
-        for i, cnt in enumerate(contours):
-            ((x, y), radius) = cv2.minEnclosingCircle(cnt)
-            area = cv2.contourArea(cnt)
-            circle_area = math.pi * (radius ** 2)
-
-            if radius < 15 or radius > 100:
-                continue
-            if circle_area == 0:
-                continue
-
-            fill_ratio = area / circle_area
-            if fill_ratio < 0.6:
-                continue
-
-            detected_circles.append((int(x), int(y)))
+        for x, y, radius in self.circle_candidates(frame):
+            # Кадр может быть окном трека — переводим в координаты экрана
+            detected_circles.append((int(x) + frame.offset[0], int(y) + frame.offset[1]))
             average_radius += radius
 
         if detected_circles:
             average_radius /= len(detected_circles)
+        if self.recorder is not None:
+            self.recorder.record_event("circles", frame=frame.index, points=detected_circles, radius=average_radius)
         return detected_circles, average_radius
 
+    def circle_candidates(self, image):
+        """
+        Круги в кадре [(x, y, радиус)]: обученной моделью (circle_detector="learned") или по HSV-маске.
+        image — кадр BGR или FrameContext.
+        """
+        image = context_for(image)
+        if self.config.get("circle_detector", "hsv") == "learned":
+            from circle_detector import load_model, MODEL_FILE
+            model = load_model(self.config.get("circle_model_path", MODEL_FILE))
+            if model is not None:
+                return self.learned_circles(model, image)
+        # Маска цвета круга (открытие, закрытие, сглаживание) в буферах детектора
+        mask = self.colors.detect(image, ("circle",))["circle"]
+        return round_blobs(mask, min_radius=15, max_radius=100, min_fill=0.6)
+
+    def learned_circles(self, model, frame):
+        """
+        Круги обученной моделью [(x, y, радиус)] в координатах кадра. Цена модели — площадь кадра
+        на число масштабов, поэтому кадр обрезается до строк калиброванной полосы (splash_y_bounds),
+        а после находки ширины ищутся в пределах LEARNED_WIDTH_SLACK от ширины последнего круга:
+        масштабов меньше, и самый крупный из них — уже уменьшенный кадр. Промах возвращает поиск
+        ко всему диапазону circle_min_width..circle_max_width.
+        """
+        min_width = self.config.get("circle_min_width", 16)
+        max_width = self.config.get("circle_max_width", 80)
+        if self._circle_width is not None:
+            min_width = max(min_width, self._circle_width / LEARNED_WIDTH_SLACK)
+            max_width = min(max_width, self._circle_width * LEARNED_WIDTH_SLACK)
+        image = frame.image
+        top = 0
+        y_bounds = self.splash_y_bounds()
+        if y_bounds is not None:
+            # Запас в ширину круга: окно модели выше самого круга
+            pad = int(math.ceil(max_width))
+            top = max(0, y_bounds[0] - pad - frame.offset[1])
+            bottom = min(image.shape[0], y_bounds[1] + pad - frame.offset[1])
+            if bottom <= top:
+                return []
+            image = image[top:bottom]
+        detections = model.detect(image, min_width=min_width, max_width=max_width,
+                                  threshold=self.config.get("circle_model_threshold", 0.0))
+        # Детекции упорядочены по оценке — ширину задаёт лучшая
+        self._circle_width = detections[0][2] if detections else None
+        return [(x, y + top, w / 2) for x, y, w, h, _ in detections]
+
     def perform_calibration(self, min_samples, max_duration, session_dir, prefix=""):
         """Выполняет калибровку до сбора min_samples или истечения max_duration"""
         calibration_data = []
-        calibration_start = time.time()
+        calibration_start = self.clock.now()
         calibration_step = 0
+        ticker = TickScheduler(self.config.get("calibration_rate_hz", 10), self.clock,
+                               name=f"{prefix}calibration", report_interval=0)
 
         logger.info(f"Starting calibration cycle: {prefix} (min_samples={min_samples}, max_duration={max_duration})")
+        self.circle_tracker.reset()
         mouse_down_right()
-        time.sleep(0.2)
+        self.clock.sleep(self.config.get("mouse_settle_delay", 0.2))
 
-        while (time.time() - calibration_start < max_duration and
+        while (self.clock.now() - calibration_start < max_duration and
                len(calibration_data) < min_samples and
                self.running and not self.paused):
 
-            circles, circle_size = self.find_calibration_circle()
-            current_time = time.time() - calibration_start
-
-            if circles:
-                current_pos = pyautogui.position()
+            ticker.wait()
+            # Пока круг сопровождается, захватывается только окно вокруг его прогноза
+            frame = self.grab_tracked_frame(self.circle_tracker)
+            if frame is None:
+                continue
+            circles, circle_size = self.find_calibration_circle(frame)
+            # Время образца — момент захвата кадра, а не предполагаемый шаг цикла
+            current_time = frame.timestamp - calibration_start
+
+            closest_circle = self.circle_tracker.observe(circles, frame.timestamp)
+            new_track = circles and closest_circle is None
+            if new_track:
+                current_pos = self.cursor_in_capture()
                 closest_circle = min(
                     circles,
                     key=lambda p: math.sqrt((p[0] - current_pos[0]) ** 2 + (p[1] - current_pos[1]) ** 2)
                 )
+                self.circle_tracker.start(closest_circle, frame.timestamp)
+
+            if closest_circle is not None:
+                if self.calibration is not None:
+                    self.calibration.update(closest_circle, frame.timestamp, new_track=new_track)
 
                 calibration_data.append({
                     "time": current_time,
@@ -114,65 +352,227 @@ class FishingManager:
                 logger.debug(f"Calibration sample {len(calibration_data)} collected at {closest_circle}")
 
                 debug_path = os.path.join(session_dir, f"{prefix}calib_step_{calibration_step}.png")
-                self.make_debug_screenshot(debug_path, [], (0, 0), highlight_point=closest_circle)
+                self.make_debug_screenshot(debug_path, [], (0, 0), highlight_point=closest_circle, frame=frame)
                 calibration_step += 1
             else:
-                current_pos = pyautogui.position()
+                current_pos = self.cursor_in_capture()
                 self.circle_y_positions.append(current_pos[1])
 
-            time.sleep(0.1)
-
         mouse_up_right()
+        ticker.log_report()
         logger.info(f"Calibration cycle completed: {prefix}. Collected {len(calibration_data)} samples")
         return calibration_data
 
-    def find_splashes(self):
-        template_path = os.path.join("templates", "splash.png")
-        if not os.path.exists(template_path):
-            logger.error(f"Template splash.png not found at {template_path}")
-            return [], 0, 0
-
-        screenshot = pyautogui.screenshot()
-        screenshot_rgb = np.array(screenshot)
-        screenshot_gray = cv2.cvtColor(screenshot_rgb, cv2.COLOR_RGB2GRAY)
+    def run_blocking_calibration(self, session_dir, max_duration=20):
+        """
+        Прежняя калибровка перед рыбалкой: первичная, повторная и дополнительная серии.
+        max_duration — предел первичной и повторной серий, с; дополнительной — половина.
+        """
+        # Основная калибровка: продолжать до сбора 10 образцов или max_duration секунд
+        calibration_data = []
+        min_samples = 10
+
+        # Этап 1: Первичная калибровка
+        calibration_data += self.perform_calibration(min_samples, max_duration, session_dir, "primary_")
+
+        # Если не собрали достаточно образцов, попробуем еще раз
+        if len(calibration_data) < min_samples:
+            logger.warning(f"Primary calibration collected only {len(calibration_data)} samples, retrying...")
+            calibration_data += self.perform_calibration(min_samples - len(calibration_data),
+                                                         max_duration,
+                                                         session_dir,
+                                                         "retry_")
+
+        # Этап 2: Дополнительная калибровка после сбора основных данных
+        if calibration_data:
+            logger.info("Performing additional calibration")
+            additional_data = self.perform_calibration(5,  # Собрать еще 5 образцов
+                                                       max_duration / 2,
+                                                       session_dir,
+                                                       "additional_")
+            calibration_data += additional_data
+            logger.info(f"Additional calibration collected {len(additional_data)} samples")
+        else:
+            logger.error("No calibration data collected, skipping additional calibration")
+        logger.info(f"Total calibration samples: {len(calibration_data)}")
+        return calibration_data
 
-        template = cv2.imread(template_path, cv2.IMREAD_GRAYSCALE)
-        if template is None:
-            logger.error("Failed to load splash template image")
+    def create_calibration(self):
+        """Онлайн-оценка калибровки; с online_calibration — с профилем, сохранённым для этого разрешения"""
+        self.ensure_frame_source()
+        screen = self.screen_geometry().size
+        calibration = OnlineCalibration.from_config(screen[1], self.config)
+        if self.config.get("online_calibration", True):
+            load_profile(calibration, screen, self.config.get("calibration_file", CALIBRATION_FILE))
+        return calibration
+
+    def apply_calibration(self):
+        """Переносит текущую оценку в circle_range / circle_speed / circle_start_position и полосу ROI"""
+        screen_width, screen_height = self.screen_geometry().size
+        bounds = self.calibration.range() if self.calibration.ready else None
+        if bounds is None:
+            if not self._calibration_defaults_warned:
+                logger.warning("No calibration data collected - using defaults")
+                self._calibration_defaults_warned = True
+            bounds = (int(screen_height * 0.3), int(screen_height * 0.7))
+        changed = bounds != self.circle_range
+        self.circle_range = bounds
+        self.circle_speed = self.calibration.speed()
+        self.circle_start_position = (screen_width // 2, self.calibration.start_y())
+        # Полоса переустанавливается только при новом диапазоне: set_range сбрасывает расширение и промахи
+        if changed or self.roi.y_range != bounds:
+            self.roi.set_range(*bounds)
+        self._last_calibration_apply = self.clock.now()
+        if changed:
+            logger.info(f"Vertical movement range: Y={bounds[0]}-{bounds[1]}, "
+                        f"average vertical speed: {self.circle_speed:.1f} px/s, "
+                        f"typical start position: {self.circle_start_position}")
+
+    def update_calibration(self):
+        """
+        Онлайн-калибровка в основном цикле: каждую calibration_every_n-ю итерацию снимается свой кадр —
+        окно вокруг прогноза трека круга, без трека полоса ROI, — и в нём ищется круг. Кадр поиска
+        всплесков не подходит: его окно идёт за всплеском и круг туда попадает случайно.
+        Позиция круга уточняет оценку, а раз в calibration_apply_interval секунд оценка применяется.
+        """
+        if self.calibration is None or not self.config.get("online_calibration", True):
+            return
+        self._calibration_frames += 1
+        if (self._calibration_frames - 1) % self.config.get("calibration_every_n", 2):
+            return
+        screen_width, screen_height = self.screen_geometry().size
+        frame = self.grab_tracked_frame(self.circle_tracker, self.roi.region(screen_width, screen_height))
+        if frame is None:
+            return
+        # Буфер кадра закреплён на время поиска: поток захвата конвейера продолжает писать в кольцо
+        self.frame_source.pin(frame)
+        try:
+            circles, _ = self.find_calibration_circle(self._calibration_context.reset(frame))
+        finally:
+            self.frame_source.release(frame)
+        if self.circle_tracker.active:
+            position = self.circle_tracker.observe(circles, frame.timestamp)
+            if position is not None:
+                self.calibration.update(position, frame.timestamp)
+            elif not self.circle_tracker.active:
+                self.calibration.end_track()
+        elif circles:
+            # Новый трек — с верхнего (самого раннего на траектории) круга
+            position = min(circles, key=lambda p: p[1])
+            self.circle_tracker.start(position, frame.timestamp)
+            self.calibration.update(position, frame.timestamp, new_track=True)
+        if self.clock.now() - self._last_calibration_apply >= self.config.get("calibration_apply_interval", 5.0):
+            self.apply_calibration()
+
+    def splash_y_bounds(self):
+        """
+        Допустимый диапазон Y всплесков на экране: полоса ROI, которая сейчас захватывается
+        (диапазон круга плюс запас и расширение после промахов), без ROI — диапазон круга.
+        None — без ограничения (калибровки ещё нет).
+        """
+        bounds = self.roi.bounds(self.screen_geometry().size[1])
+        if bounds is not None:
+            return bounds
+        return self.circle_range if self.circle_range != (0, 0) else None
+
+    @timed("detect.splashes")
+    def find_splashes(self, frame=None):
+        self.ensure_frame_source()
+        # Шаблоны берутся из кэша в памяти, уже масштабированные под разрешение экрана
+        templates = self.templates.get("splash", self.screen_geometry().size)
+        if not templates:
             return [], 0, 0
 
-        w, h = template.shape[1], template.shape[0]
-        res = cv2.matchTemplate(screenshot_gray, template, cv2.TM_CCOEFF_NORMED)
-        threshold = 0.75
-        loc = np.where(res >= threshold)
-
-        points = []
-        for pt in zip(*loc[::-1]):
-            center_x = pt[0] + w // 2
-            center_y = pt[1] + h // 2
-            points.append((center_x, center_y))
-
-        filtered_points = []
-        for p in points:
-            if all(np.linalg.norm(np.array(p) - np.array(fp)) > 50 for fp in filtered_points):
-                filtered_points.append(p)
+        if frame is None:
+            frame = self.grab_frame()
+        if frame is None:
+            return [], 0, 0
+        frame = context_for(frame)
+        # С пулом процессов серое изображение строит каждый воркер для своей полосы
+        screenshot_gray = None if self.parallel is not None else frame.gray
+        frame_height, frame_width = frame.image.shape[:2]
+
+        w, h = templates[0].width, templates[0].height
+        threshold = self.config.get("match_threshold", 0.75)
+        min_distance = self.config.get("splash_min_distance", 50)
+        top_k = self.config.get("splash_top_k", 10)
+        match_mode = self.config.get("match_mode", "exhaustive")
+        pyramid_scale = self.config.get("pyramid_scale", 2)
+        # Кадр может быть полосой ROI — переводим точки в координаты экрана
+        offset_x, offset_y = frame.offset
+        # Допустимые Y центров (захватываемая полоса ROI, без неё — диапазон круга) ограничивают
+        # строки поиска до отбора top_k: сильные пики вне диапазона не вытесняют нужные
+        y_bounds = self.splash_y_bounds()
+        all_points = []
+        all_scores = []
+        for template in templates:
+            top, bottom = 0, frame_height
+            if y_bounds is not None:
+                half = template.height // 2
+                top = max(0, y_bounds[0] - half - offset_y)
+                bottom = min(frame_height, y_bounds[1] - half - offset_y + template.height)
+            if bottom - top < template.height or frame_width < template.width:
+                logger.debug(f"Capture region is smaller than template {template.name}")
+                continue
 
-        # Фильтрация по диапазону круга наведения
-        if hasattr(self, 'circle_range') and self.circle_range != (0, 0):
-            min_y, max_y = self.circle_range
-            filtered_points = [p for p in filtered_points if min_y <= p[1] <= max_y]
-            logger.debug(f"Filtered {len(filtered_points)} splashes within circle range")
+            if self.parallel is not None:
+                # Полосы кадра на воркерах пула — кадр передаётся через разделяемую память
+                points, scores = self.parallel.match_template_tiled(
+                    frame.image[top:bottom], template.image, threshold, mode=match_mode,
+                    pyramid_scale=pyramid_scale, min_distance=min_distance, top_k=top_k)
+            else:
+                points, scores = match_template(screenshot_gray[top:bottom], template.image, threshold,
+                                                mode=match_mode, pyramid_scale=pyramid_scale,
+                                                min_distance=min_distance, top_k=top_k)
+            if len(points):
+                centers = points + (template.width // 2 + offset_x, template.height // 2 + offset_y + top)
+                all_points.append(centers)
+                all_scores.append(scores)
+
+        # Пики разных вариантов шаблона тоже могут совпадать — общее подавление по всем
+        if all_points:
+            points, scores = suppress_peaks(np.concatenate(all_points), np.concatenate(all_scores),
+                                            min_distance, top_k)
+        else:
+            points, scores = np.empty((0, 2), dtype=np.int64), np.empty(0, dtype=np.float32)
+        filtered_points = [(int(x), int(y)) for x, y in points]
+        self.last_splash_scores = [float(score) for score in scores]
 
         logger.debug(f"Found {len(filtered_points)} splashes by template matching")
+        if self.recorder is not None:
+            self.recorder.record_event("splashes", frame=frame.index, points=filtered_points, size=[w, h],
+                                       scores=self.last_splash_scores)
         return filtered_points, w, h
 
     def make_debug_screenshot(self, path, splashes, splash_size, highlight_point=None, circle_range=None,
-                              route_positions=None):
-        screenshot = pyautogui.screenshot()
-        img = np.array(screenshot)
-        img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
+                              route_positions=None, frame=None, event=False):
+        """
+        Отладочный скриншот. Решение о выборке принимается сразу, а отрисовка и запись
+        уходят в фоновый DebugWriter, чтобы не тормозить поток наведения.
+        event=True — событие сессии, сохраняется независимо от выборки шагов.
+        """
+        if not self.config.get("debug_enabled", True):
+            return
+        writer = self.debug_writer
+        if writer is not None and not writer.should_write(event):
+            return
+        if frame is None:
+            frame = self.grab_frame()
+        if frame is None:
+            return
+        # Кадр общий для всех потребителей и будет перезаписан — рисуем на копии
+        img = self._full_screen_canvas(frame)
+        args = (img, self.cursor_in_capture(), list(splashes), splash_size, highlight_point, circle_range,
+                list(route_positions) if route_positions else None)
+
+        if writer is None:
+            cv2.imwrite(path, self._render_debug_image(*args))
+        else:
+            writer.submit(path, self._render_debug_image, *args)
 
-        mouse_pos = pyautogui.position()
+    @staticmethod
+    def _render_debug_image(img, mouse_pos, splashes, splash_size, highlight_point, circle_range,
+                            route_positions):
         cv2.circle(img, mouse_pos, 15, (0, 255, 0), 3)
 
         w, h = splash_size
@@ -231,21 +631,45 @@ class FishingManager:
                         (10, min_y - 10), cv2.FONT_HERSHEY_SIMPLEX,
                         0.7, (0, 255, 0), 2)
 
-        cv2.imwrite(path, img)
+        return img
+
+    def _full_screen_canvas(self, frame):
+        """Копия кадра в координатах экрана: полоса ROI вклеивается в чёрный холст по своему смещению"""
+        if frame.offset == (0, 0) or self.frame_source is None:
+            return frame.image.copy()
+        screen_width, screen_height = self.screen_geometry().size
+        frame_height, frame_width = frame.image.shape[:2]
+        canvas = np.zeros((screen_height, screen_width, 3), dtype=np.uint8)
+        x, y = frame.offset
+        canvas[y:y + frame_height, x:x + frame_width] = frame.image
+        return canvas
 
-    def save_route_visualization(self, session_dir):
+    def save_route_visualization(self, session_dir, frame=None):
         """Сохраняет скриншот с визуализацией всего маршрута круга (вертикального)"""
-        if not self.circle_y_positions:
+        if not self.circle_y_positions or not self.config.get("debug_enabled", True):
             return
 
-        screenshot = pyautogui.screenshot()
-        img = np.array(screenshot)
-        img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
+        if frame is None:
+            frame = self.grab_frame()
+        if frame is None:
+            return
+        img = self._full_screen_canvas(frame)
 
         # Определяем диапазон вертикального движения
         min_y = min(self.circle_y_positions)
         max_y = max(self.circle_y_positions)
-        avg_x = pyautogui.size().width // 2  # Центр экрана по горизонтали
+        path = os.path.join(session_dir, "circle_route_visualization.png")
+
+        if self.debug_writer is None:
+            cv2.imwrite(path, self._render_route_image(img, min_y, max_y))
+            logger.info(f"Vertical circle route visualization saved: {path}")
+        elif self.debug_writer.should_write(event=True):
+            self.debug_writer.submit(path, self._render_route_image, img, min_y, max_y)
+            logger.info(f"Vertical circle route visualization queued: {path}")
+
+    @staticmethod
+    def _render_route_image(img, min_y, max_y):
+        avg_x = img.shape[1] // 2  # Центр экрана по горизонтали
 
         # Создаем прозрачный слой
         overlay = img.copy()
@@ -276,12 +700,7 @@ class FishingManager:
 
         # Применяем прозрачность
         alpha = 0.25
-        img = cv2.addWeighted(overlay, alpha, img, 1 - alpha, 0)
-
-        # Сохраняем результат
-        path = os.path.join(session_dir, "circle_route_visualization.png")
-        cv2.imwrite(path, img)
-        logger.info(f"Vertical circle route visualization saved: {path}")
+        return cv2.addWeighted(overlay, alpha, img, 1 - alpha, 0)
 
     def start_fishing(self):
         if self.running:
@@ -291,20 +710,42 @@ class FishingManager:
         self.running = True
         self.paused = False
         self.circle_x_positions = []  # Сбрасываем историю позиций
-        self.config = load_config()
-        pause_key = self.config.get("pause_key", "p")
-        exit_key = self.config.get("exit_key", "q")
-        calibration_duration = self.config.get("calibration_duration", 10)
-
-        keyboard.on_press_key(exit_key, lambda _: self.force_exit())
-        keyboard.on_press_key(pause_key, lambda _: self.toggle_pause())
+        self._calibration_frames = 0
+        self._calibration_defaults_warned = False
+        self._circle_width = None
+        self.configure_input()
+        # Раскладка мониторов и масштаб ввода снимаются заново на каждую сессию — и только здесь
+        self.geometry = None
+        self.screen_geometry()
+        self.configure_roi()
+        self.configure_trackers()
+        if self.hotkeys:
+            self.register_hotkeys()
+        self.metrics_exporter = MetricsExporter(self.config)
+        self._stopped.clear()
 
         try:
-            session_dir = os.path.join("debug_screenshots", datetime.now().strftime("%Y%m%d_%H%M%S"))
+            session_dir = os.path.join(self.session_root, datetime.now().strftime("%Y%m%d_%H%M%S"))
             os.makedirs(session_dir, exist_ok=True)
+            self.start_recording(session_dir)
+            # Отладочные скриншоты, пул процессов и запись сессии подключаются только по конфигу
+            if self.config.get("debug_enabled", True):
+                from debug_writer import DebugWriter
+                self.debug_writer = DebugWriter.from_config(session_dir, self.config)
+            if self.config.get("parallel_workers", 0) > 0:
+                from parallel_detection import ParallelDetector
+                self.parallel = ParallelDetector(self.config["parallel_workers"])
+                self.parallel.warmup()
+            if self.config.get("motion_controller", True):
+                self.motion = MotionController.from_config(self.config, move_mouse_relative, cursor_position,
+                                                           self.clock, move_batch=move_mouse_batch)
+                self.motion.start()
 
             logger.info("Waiting 5 seconds before casting")
-            time.sleep(5)
+            self.clock.sleep(5)
+            if not self.running:
+                # Остановлено во время ожидания — удочку уже не достаём
+                return
 
             if not press_key(self.config['bind_key']):
                 logger.error("Failed to activate fishing rod")
@@ -312,71 +753,19 @@ class FishingManager:
                 return
 
             logger.info("Waiting 2 seconds after casting")
-            time.sleep(2)
-
-            # Основная калибровка: продолжать до сбора 10 образцов или 20 секунд
-            calibration_data = []
-            min_samples = 10
-            max_duration = 20
-
-            # Этап 1: Первичная калибровка
-            calibration_data += self.perform_calibration(min_samples, max_duration, session_dir, "primary_")
-
-            # Если не собрали достаточно образцов, попробуем еще раз
-            if len(calibration_data) < min_samples:
-                logger.warning(f"Primary calibration collected only {len(calibration_data)} samples, retrying...")
-                calibration_data += self.perform_calibration(min_samples - len(calibration_data),
-                                                             max_duration,
-                                                             session_dir,
-                                                             "retry_")
-
-            # Этап 2: Дополнительная калибровка после сбора основных данных
-            if calibration_data:
-                logger.info("Performing additional calibration")
-                additional_data = self.perform_calibration(5,  # Собрать еще 5 образцов
-                                                           10,  # максимум 10 секунд
-                                                           session_dir,
-                                                           "additional_")
-                calibration_data += additional_data
-                logger.info(f"Additional calibration collected {len(additional_data)} samples")
+            self.clock.sleep(2)
+
+            # Калибровка: сохранённый профиль этого разрешения позволяет начать сразу,
+            # иначе — блокирующая калибровка; дальше оценка уточняется по ходу рыбалки
+            self.calibration = self.create_calibration()
+            if self.calibration.ready:
+                logger.info("Using saved calibration profile, skipping the calibration phase")
             else:
-                logger.error("No calibration data collected, skipping additional calibration")
+                self.run_blocking_calibration(session_dir, self.config.get("calibration_duration", 20))
 
             # Сохраняем визуализацию маршрута
             self.save_route_visualization(session_dir)
-            logger.info(f"Total calibration samples: {len(calibration_data)}")
-
-            if calibration_data:
-                y_positions = [d['position'][1] for d in calibration_data]
-
-                if len(y_positions) > 1:
-                    y_diff = np.diff(y_positions)
-                    avg_vertical_speed = np.mean(np.abs(y_diff)) / 0.1
-                else:
-                    avg_vertical_speed = 100
-
-                min_y = int(min(y_positions)) - 50
-                max_y = int(max(y_positions)) + 50
-
-                self.circle_range = (min_y, max_y)
-                self.circle_speed = avg_vertical_speed
-
-                screen_width, screen_height = pyautogui.size()
-                start_y = np.mean([d['position'][1] for d in calibration_data[:5]]) if len(calibration_data) >= 5 else (
-                                                                                                                                   min_y + max_y) // 2
-                self.circle_start_position = (screen_width // 2, int(start_y))
-
-                logger.info(f"Vertical movement range: Y={min_y}-{max_y}")
-                logger.info(f"Average vertical speed: {avg_vertical_speed:.1f} px/s")
-                logger.info(f"Typical start position: {self.circle_start_position}")
-            else:
-                logger.warning("No calibration data collected - using defaults")
-                screen_width, screen_height = pyautogui.size()
-                min_y = int(screen_height * 0.3)
-                max_y = int(screen_height * 0.7)
-                self.circle_range = (min_y, max_y)
-                self.circle_speed = 100
-                self.circle_start_position = (screen_width // 2, screen_height // 2)
+            self.apply_calibration()
 
             # Сохраняем скриншот с диапазоном и маршрутом
             debug_path = os.path.join(session_dir, "step_0_after_calibration.png")
@@ -385,60 +774,17 @@ class FishingManager:
                 [],
                 (0, 0),
                 circle_range=self.circle_range,
-                route_positions=self.circle_x_positions
+                route_positions=self.circle_x_positions,
+                event=True
             )
 
             # Основной цикл поиска и наведения
-            speed = self.config.get('speed', 5)
-            max_step = 20 * speed
-            step_num = 1
-
-            while self.running:
-                if self.paused:
-                    time.sleep(0.1)
-                    continue
-
-                # Поиск всплесков БЕЗ удержания ПКМ
-                splashes, w, h = self.find_splashes()
-
-                if not splashes:
-                    logger.info("No splashes found, waiting...")
-                    time.sleep(0.5)
-                    continue
-
-                # Выбор цели
-                current_pos = pyautogui.position()
-                target = min(
-                    splashes,
-                    key=lambda p: (p[0] - current_pos[0]) ** 2 + (p[1] - current_pos[1]) ** 2
-                )
-                logger.info(f"New target splash at {target}")
-
-                # Наведение на цель
-                mouse_down_right()
-                time.sleep(0.2)
-
-                # Плавное движение к цели
-                reached = move_towards(target, max_step)
-
-                # Отладочный скриншот с маршрутом и диапазоном
-                debug_path = os.path.join(session_dir, f"step_{step_num}_move.png")
-                self.make_debug_screenshot(
-                    debug_path,
-                    splashes,
-                    (w, h),
-                    highlight_point=target,
-                    circle_range=self.circle_range,
-                    route_positions=self.circle_x_positions
-                )
-                step_num += 1
-
-                # Отпускание после достижения цели
-                mouse_up_right()
-                logger.info("Target reached, released RMB")
-
-                # Пауза между действиями
-                time.sleep(1)
+            # Частота цикла задаётся тиками (0 — максимальная, которую выдерживает железо)
+            self.loop_scheduler = TickScheduler(self.config.get("loop_rate_hz", 30), self.clock, name="fishing")
+            if self.config.get("pipeline_enabled", True):
+                FishingPipeline(self, session_dir).run()
+            else:
+                self.run_serial_loop(session_dir)
 
         except Exception as e:
             logger.critical(f"Fishing error: {e}")
@@ -446,17 +792,222 @@ class FishingManager:
             logger.error(traceback.format_exc())
 
         finally:
-            if pyautogui.mouseUp is not None:
-                mouse_up_right()
+            mouse_up_right()
             logger.info("Right mouse button released")
             self.running = False
+            if self.loop_scheduler is not None:
+                self.loop_scheduler.log_report()
+            self.log_aim_latency()
+            if self.calibration is not None and self.calibration.samples and self.config.get("online_calibration", True):
+                save_profile(self.calibration, self.screen_geometry().size,
+                             self.config.get("calibration_file", CALIBRATION_FILE))
+            if self.debug_writer is not None:
+                self.debug_writer.close()
+                self.debug_writer = None
+            if self.parallel is not None:
+                self.parallel.close()
+                self.parallel = None
+            if self.motion is not None:
+                self.motion.stop()
+                self.motion = None
+            if self.metrics_exporter is not None:
+                self.metrics_exporter.close()
+                self.metrics_exporter = None
+            self.stop_recording()
+            self._stopped.set()
             logger.info("Fishing sequence stopped")
 
+    def select_target(self, splashes, frame=None):
+        """
+        Цель на этом кадре: сглаженная позиция сопровождаемого всплеска, а если трека нет
+        или цель потеряна (больше track_max_misses промахов) — ближайший к курсору всплеск
+        (с него начинается новый трек). Пока трек жив, промах возвращает None: всплеск
+        вне окна сопровождения не перехватывает цель.
+        """
+        tracking = frame is not None and self.config.get("tracking_enabled", True)
+        if tracking:
+            target = self.splash_tracker.observe(splashes, frame.timestamp)
+            if target is not None or self.splash_tracker.active:
+                return target
+        if not splashes:
+            return None
+
+        current_pos = self.cursor_in_capture()
+        target = min(
+            splashes,
+            key=lambda p: (p[0] - current_pos[0]) ** 2 + (p[1] - current_pos[1]) ** 2
+        )
+        if tracking:
+            self.splash_tracker.start(target, frame.timestamp)
+        return target
+
+    def target_velocity(self):
+        """Скорость сопровождаемого всплеска (px/s) или (0, 0), если трека нет"""
+        track = self.splash_tracker.track
+        if track is None or not self.config.get("tracking_enabled", True):
+            return 0.0, 0.0
+        vx, vy = track.velocity
+        return float(vx), float(vy)
+
+    def target_track_id(self):
+        """Номер трека сопровождаемого всплеска или None, если трека нет"""
+        if not self.splash_tracker.active or not self.config.get("tracking_enabled", True):
+            return None
+        return self.splash_tracker.track_id
+
+    def compensate_latency(self, target, frame_timestamp, velocity, record=True):
+        """
+        Точка, в которой цель окажется к моменту отправки ввода: позиция с кадра плюс
+        скорость трека, умноженная на измеренную задержку от захвата кадра до этого момента.
+        record=False — задержка не идёт в статистику наведений (уточнение цели в ходе движения).
+        """
+        latency = self.clock.now() - frame_timestamp
+        if record:
+            self.aim_latencies.append(latency)
+            observe("aim.latency", latency)
+        if self.config.get("aim_mode", "predictive") != "predictive":
+            return target
+        lead = min(max(0.0, latency), self.config.get("aim_max_lead", 0.5))
+        predicted = (int(round(target[0] + velocity[0] * lead)), int(round(target[1] + velocity[1] * lead)))
+        logger.debug(f"Aim latency {latency * 1000:.1f} ms, target {target} -> {predicted}")
+        return predicted
+
+    def log_aim_latency(self):
+        if not self.aim_latencies:
+            return
+        latencies = np.array(self.aim_latencies) * 1000
+        logger.info(f"Aim latency over {len(latencies)} aims: mean {latencies.mean():.1f} ms, "
+                    f"p50 {np.percentile(latencies, 50):.1f} ms, p90 {np.percentile(latencies, 90):.1f} ms, "
+                    f"max {latencies.max():.1f} ms")
+
+    @timed("aim.total")
+    def aim_at(self, target, frame_timestamp=None, velocity=(0.0, 0.0), updates=None, track_id=None):
+        """
+        Зажимает ПКМ, ведёт курсор к цели и отпускает кнопку.
+        Если передана метка времени кадра, цель упреждается на задержку до отправки ввода (aim_mode).
+        updates — необязательный источник более свежих команд (target, frame_timestamp, velocity, track_id):
+        пока контроллер движения ведёт курсор, команды того же трека (track_id) уточняют цель,
+        команда другого трека начинает новое движение.
+        """
+        # Наведение на цель
+        mouse_down_right()
+        self.clock.sleep(self.config.get("mouse_settle_delay", 0.2))
+
+        # Упреждение считается непосредственно перед движением — после всех задержек
+        if frame_timestamp is not None:
+            target = self.compensate_latency(target, frame_timestamp, velocity)
+        if self.recorder is not None:
+            self.recorder.record_event("aim", target=list(target), frame_timestamp=frame_timestamp)
+
+        # Цели найдены в пикселях захвата, курсор живёт в координатах ввода
+        point = self.screen_geometry().to_input(target)
+        if self.motion is not None:
+            reached = self._drive_motion(point, updates, track_id)
+        else:
+            # Без контроллера — один шаг к цели, как раньше
+            reached = move_towards(point, 20 * self.config.get('speed', 5))
+
+        # Отпускание после достижения цели
+        mouse_up_right()
+        logger.info("Target reached, released RMB")
+
+        # Пауза между действиями (по умолчанию её нет — темп задаёт планировщик)
+        self.clock.sleep(self.config.get("target_cooldown", 0.0))
+        return reached
+
+    def _drive_motion(self, target, updates, track_id=None):
+        """
+        Ведёт курсор контроллером до установления или aim_timeout. True — цель достигнута.
+        target — в координатах ввода; уточнения из updates приходят в пикселях захвата.
+        """
+        timeout = self.config.get("aim_timeout", 1.0)
+        deadline = self.clock.now() + timeout
+        self.motion.set_target(target)
+        while True:
+            remaining = deadline - self.clock.now()
+            result = self.motion.wait_settled(min(remaining, 0.02) if updates is not None else remaining)
+            if result.settled:
+                return True
+            if remaining <= 0 or not self.running:
+                self.motion.cancel()
+                inc("aim.unsettled")
+                logger.debug(f"Motion to {result.target} not settled in {timeout:.2f} s")
+                return False
+            command = updates() if updates is not None else None
+            if command is not None:
+                # Задержка наведения уже учтена в aim_at — уточнения в статистику не идут
+                target = self.compensate_latency(command.target, command.frame_timestamp, command.velocity,
+                                                 record=False)
+                # Тот же трек — уточнение текущего движения; другой всплеск (или цель без трека) — новое
+                same_track = track_id is not None and command.track_id == track_id
+                if not same_track:
+                    logger.debug(f"Aim switched to track {command.track_id} at {target}")
+                    track_id = command.track_id
+                self.motion.set_target(self.geometry.to_input(target), new_move=not same_track)
+
+    def run_serial_loop(self, session_dir):
+        """Последовательный цикл: захват, поиск и наведение в одном потоке"""
+        step_num = 1
+
+        while self.running:
+            self.loop_scheduler.wait()
+            if self.paused:
+                self.clock.sleep(0.1)
+                continue
+
+            # Один захват на итерацию (окно трека или полоса ROI) — кадр делится между поиском и отладкой
+            frame = self.grab_search_frame()
+            if frame is None:
+                continue
+
+            # Поиск всплесков БЕЗ удержания ПКМ; серое и HSV кадра считаются один раз на итерацию
+            frame = context_for(frame)
+            splashes, w, h = self.find_splashes(frame)
+            self.roi.report(bool(splashes))
+            self.update_calibration()
+
+            # Выбор цели
+            target = self.select_target(splashes, frame)
+            if target is None:
+                logger.debug("No splashes found, waiting...")
+                continue
+            logger.info(f"New target splash at {target}")
+
+            # Отладочный скриншот с маршрутом и диапазоном
+            debug_path = os.path.join(session_dir, f"step_{step_num}_move.png")
+            self.make_debug_screenshot(
+                debug_path,
+                splashes,
+                (w, h),
+                highlight_point=target,
+                circle_range=self.circle_range,
+                route_positions=self.circle_x_positions,
+                frame=frame
+            )
+            step_num += 1
+
+            self.aim_at(target, frame.timestamp, self.target_velocity())
+
+    def close(self):
+        """Отписывает менеджер от конфига; вызывают владельцы, создающие менеджер на один прогон"""
+        self._unsubscribe_config()
+
     def stop_fishing(self):
         self.running = False
         logger.info("Fishing manually stopped")
 
+    def wait_stopped(self, timeout=None):
+        """Ждёт, пока start_fishing завершит очистку. True — сессия не идёт"""
+        return self._stopped.wait(timeout)
+
     def force_exit(self):
+        """
+        Экстренный выход (клавиша exit_key, SIGINT/SIGTERM): останавливает сессию и просит
+        владельца завершить процесс. ПКМ, профиль калибровки и запись сессии закрываются
+        в finally start_fishing, а не обрываются посреди записи.
+        """
         logger.warning("Emergency exit triggered!")
         self.stop_fishing()
-        os._exit(0)
\ No newline at end of file
+        self.exit_requested.set()
+        if self.on_exit is not None:
+            self.on_exit()
\ No newline at end of file
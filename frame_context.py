@@ -0,0 +1,123 @@
+# frame_context.py
+import threading
+from collections import OrderedDict
+import cv2
+import numpy as np
+
+from capture_service import Frame
+from metrics import inc
+
+# Размытие серого кадра перед HoughCircles (find_target_circle)
+BLUR_KERNEL = (9, 9)
+BLUR_SIGMA = 2
+
+# Сколько размеров кадра держать буферы (полоса ROI, окно трека, полный экран)
+MAX_SHAPES = 4
+
+_local = threading.local()
+
+
+class ShapeCache:
+    """
+    Наборы буферов по размеру кадра (высота, ширина): factory(key) создаёт набор при первом
+    кадре такого размера; держится не больше max_shapes размеров, дольше всех не нужный вытесняется.
+    """
+
+    def __init__(self, factory, max_shapes=MAX_SHAPES):
+        self.factory = factory
+        self.max_shapes = max_shapes
+        self._items = OrderedDict()
+
+    def get(self, shape):
+        key = tuple(shape[:2])
+        item = self._items.get(key)
+        if item is None:
+            item = self._items[key] = self.factory(key)
+            if len(self._items) > self.max_shapes:
+                self._items.popitem(last=False)
+        else:
+            self._items.move_to_end(key)
+        return item
+
+
+class FrameContext:
+    """
+    Производные представления одного кадра — серое, размытое серое (для HoughCircles), HSV.
+    Каждое считается при первом обращении и запоминается до reset() на следующий кадр, так что
+    детекторы одной итерации не повторяют одни и те же полнокадровые преобразования.
+    Результаты пишутся в буферы контекста под размер кадра (до MAX_SHAPES размеров):
+    массивы действительны до следующего reset() с кадром того же размера.
+    Повторяет интерфейс Frame (image, offset, timestamp, index), поэтому передаётся детекторам
+    вместо кадра. Не потокобезопасен: один контекст на поток (см. context_for).
+    """
+
+    def __init__(self, frame=None):
+        self._buffers = ShapeCache(lambda key: {})
+        self._ready = {}
+        self.source = None
+        self.image = None
+        self.offset = (0, 0)
+        self.timestamp = None
+        self.index = None
+        if frame is not None:
+            self.reset(frame)
+
+    def reset(self, frame):
+        """Новый кадр (Frame или BGR-массив): запомненные представления сбрасываются, буферы остаются"""
+        self.source = frame
+        if isinstance(frame, Frame):
+            self.image, self.offset, self.timestamp, self.index = frame.image, frame.offset, frame.timestamp, frame.index
+        else:
+            self.image, self.offset, self.timestamp, self.index = frame, (0, 0), None, None
+        self._ready.clear()
+        return self
+
+    @property
+    def shape(self):
+        return self.image.shape
+
+    def _buffer(self, name, channels=1):
+        key = self.image.shape[:2]
+        buffers = self._buffers.get(key)
+        buffer = buffers.get(name)
+        if buffer is None:
+            buffer = buffers[name] = np.empty(key if channels == 1 else key + (channels,), dtype=np.uint8)
+        return buffer
+
+    def _compute(self, name, build):
+        value = self._ready.get(name)
+        if value is None:
+            value = self._ready[name] = build()
+            inc(f"frame_context.{name}")
+        return value
+
+    @property
+    def gray(self):
+        return self._compute("gray", lambda: cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY,
+                                                          dst=self._buffer("gray")))
+
+    @property
+    def blurred(self):
+        return self._compute("blurred", lambda: cv2.GaussianBlur(self.gray, BLUR_KERNEL, BLUR_SIGMA,
+                                                                 dst=self._buffer("blurred")))
+
+    @property
+    def hsv(self):
+        return self._compute("hsv", lambda: cv2.cvtColor(self.image, cv2.COLOR_BGR2HSV,
+                                                         dst=self._buffer("hsv", 3)))
+
+
+def context_for(frame):
+    """
+    Контекст кадра в текущем потоке. Для одного и того же Frame возвращается тот же контекст
+    с уже посчитанными представлениями; голый массив всегда начинает контекст заново
+    (его содержимое могло измениться), но буферы переиспользуются.
+    """
+    if isinstance(frame, FrameContext):
+        return frame
+    context = getattr(_local, "context", None)
+    if context is None:
+        context = _local.context = FrameContext()
+    if context.source is not frame or not isinstance(frame, Frame):
+        context.reset(frame)
+    return context
@@ -0,0 +1,88 @@
+# geometry.py
+import logging
+
+logger = logging.getLogger("Geometry")
+
+# Масштабы ввода по осям, отличающиеся сильнее, — не DPI, а несовпадение областей (захват всех мониторов)
+UNIFORM_TOLERANCE = 0.02
+
+
+class Transform:
+    """
+    Перевод координат по осям: x' = x * sx + dx, y' = y * sy + dy — между пикселями
+    захватываемого монитора и координатами курсора. Обратный перевод считается заранее,
+    применение — без обращений к ОС.
+    """
+    __slots__ = ("sx", "sy", "dx", "dy")
+
+    def __init__(self, sx=1.0, sy=1.0, dx=0.0, dy=0.0):
+        self.sx = float(sx)
+        self.sy = float(sy)
+        self.dx = float(dx)
+        self.dy = float(dy)
+
+    def apply(self, point):
+        return point[0] * self.sx + self.dx, point[1] * self.sy + self.dy
+
+    def apply_int(self, point):
+        x, y = self.apply(point)
+        return int(round(x)), int(round(y))
+
+    def inverse(self):
+        return Transform(1.0 / self.sx, 1.0 / self.sy, -self.dx / self.sx, -self.dy / self.sy)
+
+    def __repr__(self):
+        return f"Transform(sx={self.sx:g}, sy={self.sy:g}, dx={self.dx:g}, dy={self.dy:g})"
+
+
+class ScreenGeometry:
+    """
+    Раскладка экрана, снятая один раз за сессию: размер и положение захватываемого монитора
+    на виртуальном рабочем столе и масштаб координат ввода относительно пикселей захвата
+    (DPI-масштабирование Windows). Детекция работает в пикселях захвата, в координаты курсора
+    точка переводится только на границе с вводом — готовыми Transform.
+    """
+
+    def __init__(self, size, origin=(0, 0), input_scale=(1.0, 1.0)):
+        self.size = (int(size[0]), int(size[1]))
+        self.origin = (int(origin[0]), int(origin[1]))
+        self.input_scale = (float(input_scale[0]), float(input_scale[1]))
+        sx, sy = self.input_scale
+        self.capture_to_input = Transform(sx, sy, self.origin[0] * sx, self.origin[1] * sy)
+        self.input_to_capture = self.capture_to_input.inverse()
+
+    @classmethod
+    def detect(cls, frame_source, input_backend=None, input_scale=0.0):
+        """
+        Снимает раскладку с источника кадров и бэкенда ввода. input_scale > 0 задаёт масштаб
+        ввода явно; 0 — оценка по размеру экрана бэкенда ввода (только для монитора в начале
+        координат — главного, размер экрана ввода относится к нему).
+        """
+        size = frame_source.size()
+        origin = frame_source.origin()
+        scale = (input_scale, input_scale) if input_scale > 0 else (1.0, 1.0)
+        if input_scale <= 0 and input_backend is not None and origin == (0, 0):
+            try:
+                input_size = input_backend.screen_size()
+            except Exception as e:
+                logger.warning(f"Input screen size unavailable ({e}), assuming 1:1 input coordinates")
+                input_size = None
+            if input_size and input_size[0] > 0 and input_size[1] > 0:
+                sx, sy = input_size[0] / size[0], input_size[1] / size[1]
+                if abs(sx - sy) <= UNIFORM_TOLERANCE:
+                    scale = (sx, sy)
+                else:
+                    logger.warning(f"Input screen {tuple(input_size)} does not match capture {size}, "
+                                   f"assuming 1:1 input coordinates")
+        geometry = cls(size, origin, scale)
+        logger.info(f"Screen geometry: capture {geometry.size} at {geometry.origin}, "
+                    f"input scale {geometry.input_scale[0]:g}x{geometry.input_scale[1]:g}")
+        return geometry
+
+    def to_input(self, point):
+        """Точка в пикселях захвата -> координаты курсора"""
+        return self.capture_to_input.apply_int(point)
+
+    def to_capture(self, point):
+        """Координаты курсора -> пиксели захвата"""
+        return self.input_to_capture.apply_int(point)
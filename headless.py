@@ -0,0 +1,138 @@
+"""
+Запуск рыбалки без GUI — для машин без присмотра. FishingManager создаётся напрямую,
+без Tk и модальных диалогов: режим движения и остальные настройки берутся из файла конфига
+и флагов командной строки.
+
+    python headless.py
+    python headless.py --config box1.json --mode left --duration 3600
+    python headless.py --set debug_enabled=false --set input_backend=sendinput --no-hotkeys
+
+Модули подключаются лениво: Tk не загружается вовсе, pyautogui — только бэкендом ввода
+pydirectinput, отладочные скриншоты, пул процессов и запись сессии — только если их включает
+конфиг. SIGINT/SIGTERM (и клавиша выхода) останавливают сессию штатно: ПКМ отпускается,
+профиль калибровки и запись сессии сохраняются. Повторный сигнал прерывает ожидание сразу.
+"""
+import sys
+import time
+import signal
+import logging
+import argparse
+import threading
+
+from config_service import CONFIG_FILE, ConfigStore, parse_overrides
+
+logger = logging.getLogger("Headless")
+
+# Сколько ждать штатной остановки сессии после сигнала, с
+EXIT_TIMEOUT = 15.0
+# Шаг ожидания в главном потоке: между шагами Python обрабатывает сигналы (в том числе на Windows)
+WAIT_STEP = 0.5
+
+
+class Runner:
+    """Сессия рыбалки в рабочем потоке; главный поток ждёт её и принимает сигналы"""
+
+    def __init__(self, manager, duration=0.0):
+        self.manager = manager
+        self.duration = duration
+        self._signals = 0
+        self._thread = None
+        self.failed = False
+
+    def install_signal_handlers(self):
+        for name in ("SIGINT", "SIGTERM", "SIGBREAK"):
+            sig = getattr(signal, name, None)
+            if sig is not None:
+                signal.signal(sig, self._on_signal)
+
+    def _on_signal(self, signum, frame):
+        self._signals += 1
+        if self._signals == 1:
+            logger.warning(f"Received {signal.Signals(signum).name}, stopping fishing session")
+            self.manager.force_exit()
+        else:
+            logger.warning(f"Received {signal.Signals(signum).name} again, not waiting for cleanup")
+            raise KeyboardInterrupt
+
+    def _session(self):
+        try:
+            self.manager.start_fishing()
+        except Exception as e:
+            # Ошибки внутри сессии start_fishing логирует сам; сюда доходят только ошибки подготовки
+            logger.critical(f"Fishing session failed to start: {e}")
+            self.manager.running = False
+            self.failed = True
+
+    def run(self):
+        """0 — сессия остановлена штатно, 1 — не запустилась, очистка не уложилась в EXIT_TIMEOUT или прервана"""
+        self._thread = threading.Thread(target=self._session, name="Fishing", daemon=True)
+        self._thread.start()
+        started = time.monotonic()
+        stop_deadline = None
+        try:
+            while self._thread.is_alive():
+                self._thread.join(WAIT_STEP)
+                now = time.monotonic()
+                if self.duration and stop_deadline is None and now - started >= self.duration:
+                    logger.info(f"Duration limit of {self.duration:g} s reached, stopping fishing session")
+                    self.manager.stop_fishing()
+                if stop_deadline is None and not self.manager.running:
+                    stop_deadline = now + EXIT_TIMEOUT
+                if stop_deadline is not None and now >= stop_deadline and self._thread.is_alive():
+                    logger.error(f"Fishing session did not stop within {EXIT_TIMEOUT:g} s, exiting anyway")
+                    return 1
+        except KeyboardInterrupt:
+            return 1
+        return 1 if self.failed else 0
+
+
+def load_store(path, overrides):
+    """
+    Конфиг из файла; с переопределениями — копия в памяти, чтобы флаги этого запуска
+    не попали в файл (изменения из --set живут только до выхода).
+    """
+    store = ConfigStore(path)
+    if not overrides:
+        return store
+    return ConfigStore(path=None, initial={**store.snapshot(), **overrides})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the fishing bot without the GUI")
+    parser.add_argument("--config", default=CONFIG_FILE, help=f"файл конфига (по умолчанию {CONFIG_FILE})")
+    parser.add_argument("--mode", choices=("splash", "left", "right"),
+                        help="режим движения (по умолчанию move_mode из конфига)")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+                        help="переопределить ключ конфига на этот запуск (значение в JSON: 0.8, true, sendinput)")
+    parser.add_argument("--duration", type=float, default=0.0,
+                        help="остановить сессию через столько секунд (0 — до сигнала или клавиши выхода)")
+    parser.add_argument("--no-hotkeys", action="store_true",
+                        help="не перехватывать клавиши паузы и выхода (только сигналы)")
+    args = parser.parse_args(argv)
+
+    from logger import setup_logging
+    setup_logging()
+
+    try:
+        config = load_store(args.config, parse_overrides(args.set))
+    except ValueError as e:
+        logger.error(str(e))
+        return 2
+
+    # Импорт после разбора аргументов: --help и ошибки флагов не ждут OpenCV
+    from fishing_service import FishingManager
+    manager = FishingManager(config=config, hotkeys=not args.no_hotkeys)
+    manager.set_move_mode(args.mode or config.get("move_mode", "splash"))
+
+    runner = Runner(manager, args.duration)
+    runner.install_signal_handlers()
+    logger.info(f"Headless fishing started (config {args.config}, mode {manager.move_mode})")
+    code = runner.run()
+    manager.close()
+    config.flush()
+    logger.info("Headless fishing finished")
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
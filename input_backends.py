@@ -0,0 +1,266 @@
+# input_backends.py
+import sys
+import time
+import logging
+import threading
+
+logger = logging.getLogger("InputBackends")
+
+
+class InputBackend:
+    """
+    Интерфейс ввода: позиция курсора, кнопки мыши, относительные сдвиги и клавиши.
+    move_batch отправляет несколько сдвигов разом — реализации с пакетным вводом
+    делают это одним системным вызовом, остальные просто по очереди.
+    """
+    name = "base"
+
+    def position(self):
+        raise NotImplementedError
+
+    def screen_size(self):
+        raise NotImplementedError
+
+    def mouse_down(self, button="right"):
+        raise NotImplementedError
+
+    def mouse_up(self, button="right"):
+        raise NotImplementedError
+
+    def move_relative(self, dx, dy):
+        raise NotImplementedError
+
+    def move_batch(self, moves):
+        for dx, dy in moves:
+            self.move_relative(dx, dy)
+
+    def press_key(self, key):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class PyDirectInputBackend(InputBackend):
+    """
+    pydirectinput для мыши, pyautogui для позиции курсора и клавиш (как было в input_service).
+    Обе библиотеки по умолчанию спят PAUSE секунд после каждого вызова — здесь пауза задаётся явно.
+    """
+    name = "pydirectinput"
+
+    def __init__(self, pause=0.0):
+        import pyautogui
+        import pydirectinput
+        pyautogui.PAUSE = pause
+        pydirectinput.PAUSE = pause
+        self._pyautogui = pyautogui
+        self._pydirectinput = pydirectinput
+
+    def position(self):
+        return self._pyautogui.position()
+
+    def screen_size(self):
+        return self._pyautogui.size()
+
+    def mouse_down(self, button="right"):
+        self._pydirectinput.mouseDown(button=button)
+
+    def mouse_up(self, button="right"):
+        self._pydirectinput.mouseUp(button=button)
+
+    def move_relative(self, dx, dy):
+        self._pydirectinput.moveRel(dx, dy)
+
+    def press_key(self, key):
+        self._pyautogui.press(key)
+
+
+class SendInputBackend(InputBackend):
+    """
+    Прямой WinAPI SendInput через ctypes (см. dev/mouse_emulation.py), без пауз библиотек.
+    move_batch собирает все сдвиги в один массив INPUT и отправляет их одним вызовом.
+    Только Windows.
+    """
+    name = "sendinput"
+
+    INPUT_MOUSE = 0
+    INPUT_KEYBOARD = 1
+    MOUSEEVENTF_MOVE = 0x0001
+    MOUSE_BUTTON_FLAGS = {
+        "left": (0x0002, 0x0004),
+        "right": (0x0008, 0x0010),
+        "middle": (0x0020, 0x0040),
+    }
+    KEYEVENTF_KEYUP = 0x0002
+    KEYEVENTF_SCANCODE = 0x0008
+    MAPVK_VK_TO_VSC = 0
+    NAMED_KEYS = {"space": 0x20, "enter": 0x0D, "esc": 0x1B, "tab": 0x09, "shift": 0x10, "ctrl": 0x11}
+
+    def __init__(self):
+        if sys.platform != "win32":
+            raise OSError("SendInput backend is only available on Windows")
+        import ctypes
+        from ctypes import wintypes
+
+        class MouseInput(ctypes.Structure):
+            _fields_ = [("dx", ctypes.c_long), ("dy", ctypes.c_long), ("mouseData", wintypes.DWORD),
+                        ("dwFlags", wintypes.DWORD), ("time", wintypes.DWORD), ("dwExtraInfo", ctypes.c_size_t)]
+
+        class KeybdInput(ctypes.Structure):
+            _fields_ = [("wVk", wintypes.WORD), ("wScan", wintypes.WORD), ("dwFlags", wintypes.DWORD),
+                        ("time", wintypes.DWORD), ("dwExtraInfo", ctypes.c_size_t)]
+
+        class InputUnion(ctypes.Union):
+            _fields_ = [("mi", MouseInput), ("ki", KeybdInput)]
+
+        class Input(ctypes.Structure):
+            _fields_ = [("type", wintypes.DWORD), ("ii", InputUnion)]
+
+        self._ctypes = ctypes
+        self._wintypes = wintypes
+        self._user32 = ctypes.windll.user32
+        self._Input = Input
+        self._input_size = ctypes.sizeof(Input)
+        # Массивы INPUT переиспользуются по размеру пакета; заполнение и отправка — под блокировкой,
+        # так как кнопки (поток наведения) и сдвиги (поток контроллера движения) делят один массив
+        self._arrays = {}
+        self._lock = threading.Lock()
+
+    def _buffer(self, count):
+        array = self._arrays.get(count)
+        if array is None:
+            array = (self._Input * count)()
+            self._arrays[count] = array
+        return array
+
+    def _send(self, array, count):
+        sent = self._user32.SendInput(count, array, self._input_size)
+        if sent != count:
+            logger.warning(f"SendInput accepted {sent} of {count} events")
+
+    def _send_mouse(self, flags, dx=0, dy=0):
+        with self._lock:
+            array = self._buffer(1)
+            event = array[0]
+            event.type = self.INPUT_MOUSE
+            event.ii.mi.dx, event.ii.mi.dy, event.ii.mi.dwFlags = dx, dy, flags
+            self._send(array, 1)
+
+    def position(self):
+        point = self._wintypes.POINT()
+        self._user32.GetCursorPos(self._ctypes.byref(point))
+        return point.x, point.y
+
+    def screen_size(self):
+        return self._user32.GetSystemMetrics(0), self._user32.GetSystemMetrics(1)
+
+    def mouse_down(self, button="right"):
+        self._send_mouse(self.MOUSE_BUTTON_FLAGS[button][0])
+
+    def mouse_up(self, button="right"):
+        self._send_mouse(self.MOUSE_BUTTON_FLAGS[button][1])
+
+    def move_relative(self, dx, dy):
+        self._send_mouse(self.MOUSEEVENTF_MOVE, int(dx), int(dy))
+
+    def move_batch(self, moves):
+        count = len(moves)
+        if not count:
+            return
+        with self._lock:
+            array = self._buffer(count)
+            for event, (dx, dy) in zip(array, moves):
+                event.type = self.INPUT_MOUSE
+                event.ii.mi.dx, event.ii.mi.dy, event.ii.mi.dwFlags = int(dx), int(dy), self.MOUSEEVENTF_MOVE
+            self._send(array, count)
+
+    def press_key(self, key):
+        vk = self.NAMED_KEYS.get(key)
+        if vk is None:
+            vk = self._user32.VkKeyScanW(ord(key)) & 0xFF
+        scan = self._user32.MapVirtualKeyW(vk, self.MAPVK_VK_TO_VSC)
+        with self._lock:
+            array = self._buffer(2)
+            for event, flags in zip(array, (self.KEYEVENTF_SCANCODE, self.KEYEVENTF_SCANCODE | self.KEYEVENTF_KEYUP)):
+                event.type = self.INPUT_KEYBOARD
+                event.ii.ki.wVk, event.ii.ki.wScan, event.ii.ki.dwFlags = 0, scan, flags
+            self._send(array, 2)
+
+
+class RecordingBackend(InputBackend):
+    """
+    Ввод без системы: хранит позицию курсора и состояние кнопок, применяет сдвиги и записывает
+    все события (время, тип, аргументы). Работает на любой ОС — для проверки логики управления
+    без игры. gain и lag имитируют чувствительность игры и запаздывание применения сдвигов (в событиях).
+    """
+    name = "recording"
+
+    def __init__(self, position=(960, 540), screen=(1920, 1080), gain=1.0, lag=0, record=True, clock=None):
+        self.x, self.y = position
+        self.screen = screen
+        self.gain = gain
+        self.lag = lag
+        self.record = record
+        self.clock = clock or time.perf_counter
+        self.events = []
+        self.buttons = set()
+        self._pending = []
+
+    def _log(self, kind, *args):
+        if self.record:
+            self.events.append((self.clock(), kind, args))
+
+    @property
+    def moves(self):
+        return [args for _, kind, args in self.events if kind == "move"]
+
+    def position(self):
+        return int(round(self.x)), int(round(self.y))
+
+    def screen_size(self):
+        return self.screen
+
+    def mouse_down(self, button="right"):
+        self.buttons.add(button)
+        self._log("down", button)
+
+    def mouse_up(self, button="right"):
+        self.buttons.discard(button)
+        self._log("up", button)
+
+    def move_relative(self, dx, dy):
+        self._log("move", dx, dy)
+        self._pending.append((dx, dy))
+        if len(self._pending) > self.lag:
+            pdx, pdy = self._pending.pop(0)
+            self.x = min(max(0, self.x + pdx * self.gain), self.screen[0] - 1)
+            self.y = min(max(0, self.y + pdy * self.gain), self.screen[1] - 1)
+
+    def press_key(self, key):
+        self._log("key", key)
+
+
+class NullBackend(RecordingBackend):
+    """Ввод, который никуда не идёт и ничего не записывает (курсор при этом «двигается»)"""
+    name = "null"
+
+    def __init__(self, **kwargs):
+        super().__init__(record=False, **kwargs)
+
+
+BACKENDS = {
+    "pydirectinput": PyDirectInputBackend,
+    "sendinput": SendInputBackend,
+    "recording": RecordingBackend,
+    "null": NullBackend,
+}
+
+
+def create_backend(name, **kwargs):
+    try:
+        backend_cls = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown input backend: {name} (available: {', '.join(BACKENDS)})")
+    backend = backend_cls(**kwargs)
+    logger.info(f"Input backend: {backend.name}")
+    return backend
@@ -1,45 +1,75 @@
-import keyboard
-import mouse
-import time
 import logging
-import random
-import pyautogui
-import pydirectinput
 import math
 
+from input_backends import create_backend
+from metrics import timed
+
+# Бэкенд ввода создаётся при первом обращении: pyautogui и pydirectinput требуют дисплей
+# (pydirectinput — ещё и Windows), а модуль подключается и в headless-прогонах (benchmark.py)
+
 logger = logging.getLogger("InputService")
 
+_backend = None
+
+
+def get_input_backend():
+    global _backend
+    if _backend is None:
+        _backend = create_backend("pydirectinput")
+    return _backend
+
+
+def set_input_backend(backend):
+    """Подменяет бэкенд ввода (SendInput, запись для тестов и replay)"""
+    global _backend
+    _backend = backend
 
+
+def cursor_position():
+    return get_input_backend().position()
+
+
+@timed("input.press_key")
 def press_key(key):
-    pyautogui.press(key)
+    get_input_backend().press_key(key)
     logger.debug(f"Pressed key: {key}")
     return True
 
 
+@timed("input.mouse_down")
 def mouse_down_right():
-    pydirectinput.mouseDown(button='right')
+    get_input_backend().mouse_down("right")
     logger.debug("Right mouse button down")
 
 
+@timed("input.mouse_up")
 def mouse_up_right():
-    pydirectinput.mouseUp(button='right')
+    get_input_backend().mouse_up("right")
     logger.debug("Right mouse button up")
 
 
+@timed("input.move")
 def move_mouse_relative(dx, dy):
     """
-    Используем pydirectinput для относительного движения мыши.
+    Относительное движение мыши через текущий бэкенд ввода.
     """
-    pydirectinput.moveRel(dx, dy)
+    get_input_backend().move_relative(dx, dy)
     logger.debug(f"Mouse moved relative: dx={dx}, dy={dy}")
 
 
+@timed("input.move_batch")
+def move_mouse_batch(moves):
+    """Несколько относительных сдвигов одним пакетом (одним SendInput, если бэкенд умеет)"""
+    get_input_backend().move_batch(moves)
+    logger.debug(f"Mouse moved in batch of {len(moves)}")
+
+
 def move_towards(target, max_step=25):
     """
     Двигает курсор к указанной точке target (x, y), пошагово, используя move_mouse_relative.
     Возвращает True, если достигнута цель.
     """
-    current_x, current_y = pyautogui.position()
+    current_x, current_y = cursor_position()
     target_x, target_y = target
     dx = target_x - current_x
     dy = target_y - current_y
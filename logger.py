@@ -1,23 +1,32 @@
 # logger.py
+import atexit
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+import threading
+from collections import deque
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 from datetime import datetime
 
 LOG_DIR = "logs"
 if not os.path.exists(LOG_DIR):
     os.makedirs(LOG_DIR)
 
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+_listener = None
+
 
 def setup_logging():
+    """
+    Логгеры пишут только в очередь (QueueHandler), файл и консоль обслуживает отдельный
+    поток QueueListener — рабочие потоки не ждут диска. Дополнительные приёмники
+    (окно логов GUI) подключаются через add_handler.
+    """
+    global _listener
     # Формат логов
-    log_format = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
     date_format = "%Y-%m-%d %H:%M:%S"
 
-    # Базовый логгер
-    root_logger = logging.getLogger()
-    root_logger.setLevel(logging.DEBUG)
-
     # Файловый логгер с ротацией
     log_filename = datetime.now().strftime("%Y%m%d_%H%M%S") + ".log"
     file_handler = RotatingFileHandler(
@@ -25,15 +34,82 @@ def setup_logging():
         maxBytes=5 * 1024 * 1024,  # 5 MB
         backupCount=3
     )
-    file_handler.setFormatter(logging.Formatter(log_format, datefmt=date_format))
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT, datefmt=date_format))
     file_handler.setLevel(logging.DEBUG)
 
     # Консольный логгер
     console_handler = logging.StreamHandler()
-    console_handler.setFormatter(logging.Formatter(log_format, datefmt=date_format))
+    console_handler.setFormatter(logging.Formatter(LOG_FORMAT, datefmt=date_format))
     console_handler.setLevel(logging.INFO)
 
-    root_logger.addHandler(file_handler)
-    root_logger.addHandler(console_handler)
+    # Базовый логгер: только постановка записи в очередь
+    log_queue = queue.SimpleQueue()
+    root_logger = logging.getLogger()
+    root_logger.setLevel(logging.DEBUG)
+    root_logger.addHandler(QueueHandler(log_queue))
+
+    _listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+    logging.info("Logging system initialized")
+
+
+def add_handler(handler):
+    """Подключает приёмник к потоку логирования (или к корневому логгеру, если очереди нет)"""
+    if _listener is None:
+        logging.getLogger().addHandler(handler)
+    else:
+        _listener.handlers = _listener.handlers + (handler,)
+
+
+def shutdown_logging():
+    """Дописывает оставшиеся в очереди записи и останавливает поток"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class BatchingSink(logging.Handler):
+    """
+    Приёмник для окна логов: записи копятся в буфере, интерфейс сам забирает их пачкой
+    (drain) по таймеру. Подряд идущие одинаковые сообщения схлопываются в одну строку
+    со счётчиком повторов; за один drain отдаётся не больше max_lines строк, а при
+    переполнении буфера старые строки отбрасываются с пометкой о пропуске.
+    """
+
+    def __init__(self, level=logging.INFO, max_buffer=500):
+        super().__init__(level)
+        self.setFormatter(logging.Formatter(LOG_FORMAT, datefmt="%H:%M:%S"))
+        self._buffer = deque()
+        self._max_buffer = max_buffer
+        self._buffer_lock = threading.Lock()
+        self.skipped = 0
+
+    def emit(self, record):
+        try:
+            key = (record.name, record.levelno, record.getMessage())
+            with self._buffer_lock:
+                if self._buffer and self._buffer[-1][0] == key:
+                    self._buffer[-1][2] += 1
+                    return
+                text = self.format(record)
+                if len(self._buffer) >= self._max_buffer:
+                    self._buffer.popleft()
+                    self.skipped += 1
+                self._buffer.append([key, text, 1])
+        except Exception:
+            self.handleError(record)
 
-    logging.info("Logging system initialized")
\ No newline at end of file
+    def drain(self, max_lines):
+        """Строки для вывода (не больше max_lines); остальное остаётся до следующего раза"""
+        lines = []
+        with self._buffer_lock:
+            if self.skipped:
+                lines.append(f"... {self.skipped} log lines skipped")
+                self.skipped = 0
+            while self._buffer and len(lines) < max_lines:
+                _, text, count = self._buffer.popleft()
+                lines.append(text if count == 1 else f"{text} (x{count})")
+        return lines
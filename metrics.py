@@ -0,0 +1,275 @@
+# metrics.py
+import os
+import json
+import time
+import bisect
+import logging
+import tempfile
+import threading
+import functools
+
+logger = logging.getLogger("Metrics")
+
+# Границы корзин гистограммы, с: логарифмическая сетка от 10 мкс до 10 с (~12% на корзину)
+_BUCKETS = [1e-5 * 1.12 ** i for i in range(123)]
+
+
+class Histogram:
+    """
+    Гистограмма длительностей на фиксированных логарифмических корзинах: запись — bisect
+    и пара сложений, перцентили считаются по корзинам (точность ~12%).
+    Обновляется без блокировок — при гонке потоков изредка теряется отдельный замер.
+    """
+    __slots__ = ("counts", "count", "total", "min", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        # min/max до count: снимок из другого потока видит count > 0 только с заполненными границами
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        self.counts[bisect.bisect_left(_BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def percentile(self, p):
+        if not self.count:
+            return None
+        rank = p / 100.0 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                upper = _BUCKETS[i] if i < len(_BUCKETS) else self.max
+                return min(upper, self.max)
+        return self.max
+
+    def snapshot(self):
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1000,
+            "p50_ms": self.percentile(50) * 1000,
+            "p90_ms": self.percentile(90) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+            "min_ms": self.min * 1000,
+            "max_ms": self.max * 1000,
+        }
+
+
+class _Timer:
+    __slots__ = ("registry", "name", "start")
+
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+    """
+    Реестр гистограмм длительностей и счётчиков. Выключенный реестр (enabled=False) ничего
+    не записывает: timer() отдаёт общий пустой контекст, observe/inc выходят на первой проверке.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.histograms = {}
+        self.counters = {}
+        self.started = time.time()
+
+    def timer(self, name):
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def observe(self, name, seconds):
+        if not self.enabled:
+            return
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms.setdefault(name, Histogram())
+        histogram.observe(seconds)
+
+    def inc(self, name, value=1):
+        if not self.enabled:
+            return
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def reset(self):
+        self.histograms = {}
+        self.counters = {}
+        self.started = time.time()
+
+    def snapshot(self):
+        return {
+            "timestamp": time.time(),
+            "uptime_s": time.time() - self.started,
+            "enabled": self.enabled,
+            "timings": {name: h.snapshot() for name, h in sorted(self.histograms.items())},
+            "counters": dict(sorted(self.counters.items())),
+        }
+
+
+_metrics = Metrics()
+
+
+def get_metrics():
+    return _metrics
+
+
+def timer(name):
+    """with timer("capture.grab"): ... — замер блока в глобальном реестре"""
+    return _metrics.timer(name)
+
+
+def inc(name, value=1):
+    _metrics.inc(name, value)
+
+
+def observe(name, seconds):
+    _metrics.observe(name, seconds)
+
+
+def timed(name):
+    """Декоратор: замер каждого вызова функции. Выключенный реестр стоит одной проверки флага"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _metrics.enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _metrics.observe(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+class SnapshotWriter:
+    """Фоновый поток: раз в interval секунд атомарно пишет снимок метрик в JSON-файл"""
+
+    def __init__(self, path, interval=5.0, metrics=None):
+        self.path = path
+        self.interval = interval
+        self.metrics = metrics or _metrics
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="MetricsSnapshot", daemon=True)
+        self._thread.start()
+        logger.info(f"Metrics snapshots every {interval:.0f} s -> {path}")
+
+    def write(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".metrics_", suffix=".tmp", dir=directory)
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.metrics.snapshot(), f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.write()
+            except Exception as e:
+                logger.error(f"Metrics snapshot error: {e}")
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        try:
+            self.write()
+        except Exception as e:
+            logger.error(f"Metrics snapshot error: {e}")
+
+
+class MetricsServer:
+    """Локальный HTTP-эндпоинт: GET /metrics -> JSON-снимок (только 127.0.0.1)"""
+
+    def __init__(self, port, metrics=None, host="127.0.0.1"):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        registry = metrics or _metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") not in ("", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = json.dumps(registry.snapshot(), indent=2).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, name="MetricsHTTP", daemon=True)
+        self._thread.start()
+        logger.info(f"Metrics endpoint: http://{host}:{self._server.server_address[1]}/metrics")
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class MetricsExporter:
+    """Снимки в файл и HTTP-эндпоинт по ключам конфига metrics_*"""
+
+    def __init__(self, config):
+        _metrics.enabled = config.get("metrics_enabled", True)
+        self.snapshots = None
+        self.server = None
+        if not _metrics.enabled:
+            return
+        path = config.get("metrics_snapshot_path", os.path.join("logs", "metrics.json"))
+        if path:
+            self.snapshots = SnapshotWriter(path, config.get("metrics_snapshot_interval", 5.0))
+        port = config.get("metrics_http_port", 0)
+        if port:
+            try:
+                self.server = MetricsServer(port)
+            except OSError as e:
+                logger.error(f"Metrics endpoint on port {port} failed: {e}")
+
+    def close(self):
+        if self.snapshots is not None:
+            self.snapshots.close()
+            self.snapshots = None
+        if self.server is not None:
+            self.server.close()
+            self.server = None
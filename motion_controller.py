@@ -0,0 +1,272 @@
+# motion_controller.py
+import math
+import threading
+import logging
+
+from scheduler import TickScheduler
+from metrics import observe
+
+logger = logging.getLogger("MotionController")
+
+
+class MoveResult:
+    """Итог одного наведения: время установления (с), перерегулирование (px), тики и отправленные сдвиги"""
+    __slots__ = ("target", "settled", "settle_time", "overshoot", "ticks", "moves", "final_error")
+
+    def __init__(self, target):
+        self.target = target
+        self.settled = False
+        self.settle_time = None
+        self.overshoot = 0.0
+        self.ticks = 0
+        self.moves = 0
+        self.final_error = None
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def split_move(dx, dy, parts):
+    """Разбивает целочисленный сдвиг на parts целых частей с той же суммой"""
+    moves = []
+    done_x = done_y = 0
+    for i in range(1, parts + 1):
+        x, y = dx * i // parts, dy * i // parts
+        if x != done_x or y != done_y:
+            moves.append((x - done_x, y - done_y))
+        done_x, done_y = x, y
+    return moves
+
+
+class MotionController:
+    """
+    Замкнутый контур наведения курсора в отдельном потоке с фиксированной частотой rate_hz.
+    Цель задаётся асинхронно (set_target); на каждом тике PID по вектору ошибки даёт один
+    относительный сдвиг, ограниченный max_step. Позиция курсора читается в начале движения
+    и раз в resync_every тиков, между чтениями — счисление по отправленным сдвигам.
+    Дробные части сдвигов накапливаются, поэтому малые коэффициенты не «застревают» на нуле.
+    С substeps > 1 сдвиг тика дробится на мелкие части и уходит одним пакетом (move_batch) —
+    движение выглядит плавнее, а системный вызов остаётся один на тик.
+
+    Наведение завершено, когда ошибка не больше tolerance settle_ticks тиков подряд.
+    По каждому наведению сохраняется MoveResult (время установления и перерегулирование).
+    """
+
+    def __init__(self, move, position, rate_hz=250, kp=0.35, ki=0.0, kd=0.1, max_step=40,
+                 tolerance=2.0, settle_ticks=3, resync_every=25, clock=None, history=200,
+                 move_batch=None, substeps=1):
+        self.move = move
+        self.position = position
+        self.move_batch = move_batch
+        self.substeps = substeps
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.max_step = max_step
+        self.tolerance = tolerance
+        self.settle_ticks = settle_ticks
+        self.resync_every = resync_every
+        self.history = history
+        self.scheduler = TickScheduler(rate_hz, clock, name="motion")
+        self.clock = self.scheduler.clock
+        self.results = []
+
+        self._cond = threading.Condition()
+        self._target = None
+        self._new_move = False
+        self._result = None
+        self._running = False
+        self._thread = None
+
+    @classmethod
+    def from_config(cls, config, move, position, clock=None, move_batch=None):
+        controller = cls(move, position, clock=clock, move_batch=move_batch)
+        controller.configure(config)
+        return controller
+
+    def configure(self, config):
+        """Параметры из конфига; можно вызывать на ходу — контур читает их на каждом тике"""
+        self.substeps = config.get("motion_substeps", 1)
+        self.kp = config.get("motion_kp", 0.35)
+        self.ki = config.get("motion_ki", 0.0)
+        self.kd = config.get("motion_kd", 0.1)
+        # speed из GUI масштабирует предельный шаг: 5 — номинальная скорость
+        self.max_step = config.get("motion_max_step", 40) * config.get("speed", 5) / 5
+        self.tolerance = config.get("motion_tolerance", 2.0)
+        self.scheduler.set_rate(config.get("motion_rate_hz", 250))
+
+    # --- Управление потоком ---
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name="MotionController", daemon=True)
+        self._thread.start()
+        logger.info(f"Motion controller started at {self.scheduler.rate_hz} Hz")
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._target = None
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.log_report()
+
+    # --- Цель ---
+
+    def set_target(self, target, new_move=True):
+        """
+        Новая цель. new_move=False — уточнение цели текущего движения (время установления
+        и перерегулирование продолжают считаться от его начала).
+        """
+        with self._cond:
+            self._target = (float(target[0]), float(target[1]))
+            if new_move or self._result is None or self._result.settled:
+                self._new_move = True
+                self._result = MoveResult(target)
+            else:
+                self._result.target = target
+            self._cond.notify_all()
+            return self._result
+
+    def cancel(self):
+        with self._cond:
+            self._target = None
+            self._cond.notify_all()
+
+    def wait_settled(self, timeout=None):
+        """Ждёт установления текущего движения. Возвращает его MoveResult (settled=False по таймауту)"""
+        with self._cond:
+            result = self._result
+            if result is not None and not result.settled:
+                self._cond.wait_for(lambda: result.settled or self._result is not result
+                                    or not self._running or self._target is None, timeout)
+            return result
+
+    # --- Контур ---
+
+    def _loop(self):
+        self.scheduler.reset()
+        while True:
+            with self._cond:
+                while self._running and self._target is None:
+                    self._cond.wait()
+                    self.scheduler.reset()
+                if not self._running:
+                    return
+                target = self._target
+                result = self._result
+                new_move = self._new_move
+                self._new_move = False
+
+            self.scheduler.wait()
+            if new_move:
+                self._begin(result)
+            self._tick(target, result)
+
+    def _begin(self, result):
+        self._x, self._y = self.position()
+        self._start_time = self.clock.now()
+        self._integral = [0.0, 0.0]
+        self._prev_error = None
+        self._carry = [0.0, 0.0]
+        self._in_tolerance = 0
+        self._since_resync = 0
+        dx, dy = result.target[0] - self._x, result.target[1] - self._y
+        norm = math.hypot(dx, dy)
+        self._direction = (dx / norm, dy / norm) if norm > 0 else (0.0, 0.0)
+
+    def _tick(self, target, result):
+        self._since_resync += 1
+        if self.resync_every and self._since_resync >= self.resync_every:
+            self._x, self._y = self.position()
+            self._since_resync = 0
+
+        ex, ey = target[0] - self._x, target[1] - self._y
+        error = math.hypot(ex, ey)
+        result.ticks += 1
+
+        # Перерегулирование — насколько курсор ушёл за цель вдоль исходного направления движения
+        overshoot = -(ex * self._direction[0] + ey * self._direction[1])
+        if overshoot > result.overshoot:
+            result.overshoot = overshoot
+
+        if error <= self.tolerance:
+            self._in_tolerance += 1
+            if self._in_tolerance >= self.settle_ticks:
+                self._finish(target, result, error)
+                return
+        else:
+            self._in_tolerance = 0
+
+        self._integral[0] += ex
+        self._integral[1] += ey
+        if self._prev_error is None:
+            dex = dey = 0.0
+        else:
+            dex, dey = ex - self._prev_error[0], ey - self._prev_error[1]
+        self._prev_error = (ex, ey)
+
+        ux = self.kp * ex + self.ki * self._integral[0] + self.kd * dex
+        uy = self.kp * ey + self.ki * self._integral[1] + self.kd * dey
+        magnitude = math.hypot(ux, uy)
+        if magnitude > self.max_step:
+            ux, uy = ux * self.max_step / magnitude, uy * self.max_step / magnitude
+            # Насыщение — интеграл не накапливается (anti-windup)
+            self._integral[0] -= ex
+            self._integral[1] -= ey
+
+        ux += self._carry[0]
+        uy += self._carry[1]
+        step_x, step_y = int(round(ux)), int(round(uy))
+        self._carry = [ux - step_x, uy - step_y]
+        if step_x or step_y:
+            if self.move_batch is not None and self.substeps > 1:
+                self.move_batch(split_move(step_x, step_y, self.substeps))
+            else:
+                self.move(step_x, step_y)
+            result.moves += 1
+            self._x += step_x
+            self._y += step_y
+
+    def _finish(self, target, result, error):
+        with self._cond:
+            # Цель могли сменить, пока шёл тик — тогда движение продолжается
+            if self._result is not result or self._target is not target:
+                return
+            result.settled = True
+            result.settle_time = self.clock.now() - self._start_time
+            result.final_error = error
+            self._target = None
+            self.results.append(result)
+            del self.results[:-self.history]
+            self._cond.notify_all()
+        observe("motion.settle", result.settle_time)
+        logger.debug(f"Settled at {result.target} in {result.settle_time * 1000:.1f} ms, "
+                     f"overshoot {result.overshoot:.1f} px, {result.moves} moves")
+
+    # --- Метрики ---
+
+    def stats(self):
+        settled = [r for r in self.results if r.settled]
+        if not settled:
+            return {"moves": 0}
+        times = sorted(r.settle_time for r in settled)
+        return {
+            "moves": len(settled),
+            "mean_settle_ms": sum(times) / len(times) * 1000,
+            "max_settle_ms": times[-1] * 1000,
+            "mean_overshoot_px": sum(r.overshoot for r in settled) / len(settled),
+            "max_overshoot_px": max(r.overshoot for r in settled),
+        }
+
+    def log_report(self):
+        s = self.stats()
+        if not s["moves"]:
+            return
+        logger.info(f"Motion: {s['moves']} moves, settle {s['mean_settle_ms']:.1f} ms "
+                    f"(max {s['max_settle_ms']:.1f}), overshoot {s['mean_overshoot_px']:.1f} px "
+                    f"(max {s['max_overshoot_px']:.1f})")
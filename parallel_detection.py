@@ -0,0 +1,143 @@
+# parallel_detection.py
+import os
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import cv2
+import numpy as np
+
+from frame_context import context_for
+from vision_service import find_splash, find_target_circle, match_template, suppress_peaks
+
+logger = logging.getLogger("ParallelDetection")
+
+# Максимальный кадр, под который выделяется разделяемая память (4K BGR)
+MAX_FRAME_SHAPE = (2160, 3840, 3)
+
+# --- Состояние процесса-воркера ---
+_worker_buffers = {}
+
+
+def _attach_shared(name, own_tracker):
+    try:
+        # Python 3.13+: воркер не должен удалять сегмент при выходе
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        # При spawn у воркера свой resource_tracker, который удалил бы сегмент владельца;
+        # при fork трекер общий с родителем и снимать регистрацию нельзя
+        if own_tracker and os.name == "posix":
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+def _worker_init(names, own_tracker):
+    cv2.setNumThreads(1)  # параллелизм даёт пул, внутренние потоки OpenCV только мешают
+    for slot, name in enumerate(names):
+        _worker_buffers[slot] = _attach_shared(name, own_tracker)
+
+
+def _frame_view(slot, shape):
+    size = shape[0] * shape[1] * shape[2]
+    return np.ndarray(shape, dtype=np.uint8, buffer=_worker_buffers[slot].buf[:size])
+
+
+def _run_job(slot, shape, tile, detector, params):
+    """Выполняется в воркере: детектор над тайлом кадра из разделяемой памяти"""
+    y0, y1, x0, x1 = tile
+    image = _frame_view(slot, shape)[y0:y1, x0:x1]
+
+    if detector == "template":
+        # Серое представление тайла в буфере контекста воркера — без нового массива на каждый кадр
+        points, scores = match_template(context_for(image), params["template"], params["threshold"],
+                                        mode=params.get("mode", "exhaustive"),
+                                        pyramid_scale=params.get("pyramid_scale", 2),
+                                        min_distance=params.get("min_distance", 50),
+                                        top_k=params.get("top_k", 20))
+        return points + (x0, y0), scores
+    if detector == "target_circle":
+        circle = find_target_circle(np.ascontiguousarray(image), params)
+        return None if circle is None else (int(circle[0]) + x0, int(circle[1]) + y0, int(circle[2]))
+    if detector == "splash_color":
+        center = find_splash(np.ascontiguousarray(image), params)
+        return None if center is None else (center[0] + x0, center[1] + y0)
+    raise ValueError(f"Unknown detector: {detector}")
+
+
+def split_rows(height, tiles, overlap):
+    """Горизонтальные полосы с перекрытием overlap, чтобы совпадения на стыках не терялись"""
+    step = int(np.ceil(height / tiles))
+    bounds = []
+    for i in range(tiles):
+        y0 = i * step
+        if y0 >= height:
+            break
+        bounds.append((y0, min(height, y0 + step + overlap)))
+    return bounds
+
+
+class ParallelDetector:
+    """
+    Пул процессов для тяжёлых детекторов (HoughCircles, полнокадровый matchTemplate).
+    Кадр один раз копируется в разделяемую память, воркеры читают его по имени сегмента —
+    full-HD массивы не сериализуются. Можно параллелить разные детекторы на одном кадре
+    (detect) или тайлы одного кадра (match_template_tiled).
+    """
+
+    def __init__(self, workers=None, max_frame_shape=MAX_FRAME_SHAPE):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_frame_shape = max_frame_shape
+        size = int(np.prod(max_frame_shape))
+        # Один сегмент: вызовы синхронные, следующий кадр пишется только после ответа воркеров
+        self._shm = shared_memory.SharedMemory(create=True, size=size)
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_worker_init,
+                                         initargs=([self._shm.name],
+                                                   multiprocessing.get_start_method() != "fork"))
+        logger.info(f"Parallel detector started with {self.workers} workers")
+
+    def _publish(self, image):
+        if image.size > self._shm.size:
+            raise ValueError(f"Frame {image.shape} exceeds shared buffer {self.max_frame_shape}")
+        view = np.ndarray(image.shape, dtype=np.uint8, buffer=self._shm.buf[:image.size])
+        np.copyto(view, image)
+        return tuple(image.shape)
+
+    def warmup(self):
+        """Поднимает все процессы пула заранее, чтобы первый кадр не платил за старт"""
+        self._publish(np.zeros((8, 8, 3), dtype=np.uint8))
+        list(self._pool.map(_run_job, [0] * self.workers, [(8, 8, 3)] * self.workers,
+                            [(0, 8, 0, 8)] * self.workers, ["splash_color"] * self.workers,
+                            [[[0, 0, 0], [0, 0, 0]]] * self.workers))
+
+    def detect(self, image, jobs):
+        """Несколько детекторов над одним кадром параллельно. jobs: [(detector, params)]"""
+        shape = self._publish(image)
+        tile = (0, shape[0], 0, shape[1])
+        futures = [self._pool.submit(_run_job, 0, shape, tile, detector, params) for detector, params in jobs]
+        return [f.result() for f in futures]
+
+    def match_template_tiled(self, image, template, threshold, tiles=None, **params):
+        """matchTemplate по полосам кадра на всех воркерах; пики полос объединяются подавлением"""
+        shape = self._publish(image)
+        tiles = tiles or self.workers
+        overlap = template.shape[0] - 1
+        params = dict(params, template=template, threshold=threshold)
+        futures = [
+            self._pool.submit(_run_job, 0, shape, (y0, y1, 0, shape[1]), "template", params)
+            for y0, y1 in split_rows(shape[0], tiles, overlap)
+        ]
+        results = [f.result() for f in futures]
+        points = [p for p, _ in results if len(p)]
+        if not points:
+            return np.empty((0, 2), dtype=np.int64), np.empty(0, dtype=np.float32)
+        scores = [s for p, s in results if len(p)]
+        return suppress_peaks(np.concatenate(points), np.concatenate(scores),
+                              params.get("min_distance", 50), params.get("top_k", 20))
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+        self._shm.close()
+        self._shm.unlink()
+        logger.info("Parallel detector stopped")
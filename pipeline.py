@@ -0,0 +1,185 @@
+# pipeline.py
+import os
+import threading
+import logging
+
+from frame_context import context_for
+from metrics import observe
+
+logger = logging.getLogger("Pipeline")
+
+
+class LatestValue:
+    """
+    Очередь из одного элемента между стадиями: новое значение вытесняет непрочитанное старое,
+    поэтому потребитель всегда получает самое свежее. put() возвращает вытесненное значение.
+    """
+
+    def __init__(self):
+        self._value = None
+        self._has_value = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self.dropped = 0
+
+    def put(self, value):
+        with self._cond:
+            displaced = self._value if self._has_value else None
+            if self._has_value:
+                self.dropped += 1
+            self._value = value
+            self._has_value = True
+            self._cond.notify()
+            return displaced
+
+    def get(self, timeout=None):
+        """Самое свежее значение или None по таймауту / после close()"""
+        with self._cond:
+            if not self._has_value and not self._closed:
+                self._cond.wait(timeout)
+            if not self._has_value:
+                return None
+            value = self._value
+            self._value = None
+            self._has_value = False
+            return value
+
+    def take_nowait(self):
+        with self._cond:
+            value = self._value if self._has_value else None
+            self._value = None
+            self._has_value = False
+            return value
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class AimCommand:
+    __slots__ = ("target", "frame_timestamp", "velocity", "splashes", "splash_size", "track_id")
+
+    def __init__(self, target, frame_timestamp, velocity, splashes, splash_size, track_id=None):
+        self.target = target
+        self.frame_timestamp = frame_timestamp
+        # Скорость цели снимается в потоке детекции, пока трек не обновился следующим кадром
+        self.velocity = velocity
+        self.splashes = splashes
+        self.splash_size = splash_size
+        # Трек всплеска, к которому относится цель (None — без сопровождения)
+        self.track_id = track_id
+
+
+class FishingPipeline:
+    """
+    Конвейер из трёх потоков: захват -> детекция -> ввод. Между стадиями — LatestValue,
+    так что детекция работает по самому свежему кадру, а команды ввода никогда не ждут скриншота.
+
+    Кадры передаются без копирования: захват закрепляет буфер кадра (FrameSource.pin) до того,
+    как отдать его дальше, а детекция освобождает его после обработки, поэтому кольцо буферов
+    не перезапишет кадр, пока он в работе.
+    """
+
+    def __init__(self, manager, session_dir, get_timeout=0.2):
+        self.manager = manager
+        self.session_dir = session_dir
+        self.get_timeout = get_timeout
+        self.frames = LatestValue()
+        self.commands = LatestValue()
+        self.detections = 0
+        self.actions = 0
+        self._step = 1
+        self._threads = []
+
+    def run(self):
+        """Запускает стадии и ждёт их завершения (manager.running = False)"""
+        stages = (("Capture", self._capture_loop), ("Detect", self._detect_loop), ("Actuator", self._actuator_loop))
+        self._threads = [threading.Thread(target=self._guard, args=(fn,), name=f"Fishing{name}", daemon=True)
+                         for name, fn in stages]
+        logger.info("Starting capture / detect / act pipeline")
+        for thread in self._threads:
+            thread.start()
+        for thread in self._threads:
+            thread.join()
+        logger.info(f"Pipeline stopped: {self.detections} frames detected, {self.actions} aims, "
+                    f"{self.frames.dropped} frames and {self.commands.dropped} commands superseded")
+
+    def _guard(self, loop):
+        try:
+            loop()
+        except Exception as e:
+            logger.critical(f"Pipeline stage error: {e}")
+            import traceback
+            logger.error(traceback.format_exc())
+            self.manager.running = False
+        finally:
+            self.frames.close()
+            self.commands.close()
+
+    def _capture_loop(self):
+        manager = self.manager
+        scheduler = manager.loop_scheduler
+        while manager.running:
+            scheduler.wait()
+            if manager.paused:
+                manager.clock.sleep(0.1)
+                continue
+            frame = manager.grab_search_frame()
+            if frame is None:
+                continue
+            manager.frame_source.pin(frame)
+            manager.frame_source.release(self.frames.put(frame))
+        manager.frame_source.release(self.frames.take_nowait())
+
+    def _detect_loop(self):
+        manager = self.manager
+        while manager.running:
+            frame = self.frames.get(self.get_timeout)
+            if frame is None:
+                continue
+            try:
+                self._detect(frame)
+            finally:
+                manager.frame_source.release(frame)
+
+    def _detect(self, frame):
+        manager = self.manager
+        # Возраст кадра к началу детекции — сколько он ждал в слоте
+        observe("pipeline.frame_age", manager.clock.now() - frame.timestamp)
+        # Серое и HSV кадра считаются один раз на поиск всплесков, выбор цели и отладку
+        frame = context_for(frame)
+        splashes, w, h = manager.find_splashes(frame)
+        manager.roi.report(bool(splashes))
+        manager.update_calibration()
+        self.detections += 1
+        target = manager.select_target(splashes, frame)
+        if target is None:
+            logger.debug("No splashes found, waiting...")
+            return
+        self.commands.put(AimCommand(target, frame.timestamp, manager.target_velocity(), splashes, (w, h),
+                                     manager.target_track_id()))
+
+        # Отладочный кадр копируется здесь, пока буфер ещё закреплён
+        debug_path = os.path.join(self.session_dir, f"step_{self._step}_move.png")
+        manager.make_debug_screenshot(
+            debug_path,
+            splashes,
+            (w, h),
+            highlight_point=target,
+            circle_range=manager.circle_range,
+            route_positions=manager.circle_x_positions,
+            frame=frame
+        )
+        self._step += 1
+
+    def _actuator_loop(self):
+        manager = self.manager
+        while manager.running:
+            command = self.commands.get(self.get_timeout)
+            if command is None or manager.paused:
+                continue
+            logger.info(f"New target splash at {command.target}")
+            manager.aim_at(command.target, command.frame_timestamp, command.velocity,
+                           updates=self.commands.take_nowait, track_id=command.track_id)
+            self.actions += 1
@@ -0,0 +1,258 @@
+"""
+Детерминированный повтор записанной сессии (session.gfs, см. SessionRecorder) через FishingManager
+без игры и дисплея: поддельные часы (sleep мгновенный), кадры из файла и записывающий бэкенд ввода.
+Так изменения настроек проверяются на реальных сессиях за секунды:
+
+    python replay.py debug_screenshots/20250530_231500/session.gfs
+    python replay.py session.gfs --set match_mode=pyramid --set match_threshold=0.8 --json replay.json
+
+Для детерминизма повтор идёт по последовательному циклу (pipeline_enabled и motion_controller
+выключаются): все стадии работают в одном потоке по одним часам.
+"""
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import numpy as np
+
+from capture_service import FrameSource
+from config_service import ConfigStore, parse_overrides
+from input_backends import RecordingBackend
+from session_recorder import read_session
+
+logger = logging.getLogger("Replay")
+
+# Время после последнего кадра, после которого повтор завершается, с
+END_SLACK = 1.0
+# Захватов за одно виртуальное время (кадр поиска и кадр калибровки итерации), после которых время сдвигается
+GRABS_PER_TICK = 2
+
+# Настройки, без которых повтор не детерминирован или оставляет следы на диске
+REPLAY_OVERRIDES = {
+    "pipeline_enabled": False,
+    "motion_controller": False,
+    "parallel_workers": 0,
+    "debug_enabled": False,
+    "record_session": False,
+    "metrics_snapshot_path": "",
+    "metrics_http_port": 0,
+    "calibration_file": "",
+}
+
+
+class ReplayClock:
+    """
+    Виртуальное время: now() стоит на месте, sleep() мгновенно сдвигает его вперёд.
+    Циклы без паузы (loop_rate_hz=0) двигает захват — см. ReplayBackend.grab.
+    """
+
+    def __init__(self, start=0.0):
+        self.t = start
+
+    def now(self):
+        return self.t
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.t += seconds
+
+    def advance_to(self, t):
+        self.t = max(self.t, t)
+
+
+class ReplayBackend:
+    """
+    Бэкенд захвата из записанных кадров. Записаны могли быть только области (ROI, окно трека),
+    поэтому кадры накладываются на полноэкранный холст по своим смещениям, а запрос
+    любой области вырезается из холста — таким, каким экран был к текущему виртуальному времени.
+    """
+
+    def __init__(self, frames, screen_size, clock, on_end=None):
+        self.frames = frames
+        self.clock = clock
+        self.on_end = on_end
+        width, height = screen_size
+        self.canvas = np.zeros((height, width, 3), dtype=np.uint8)
+        self.position = 0
+        self.ended = False
+        self._last_grab = None
+        self._grabs_at_time = 0
+
+    def size(self):
+        return self.canvas.shape[1], self.canvas.shape[0]
+
+    def _advance(self, now):
+        while self.position < len(self.frames) and self.frames[self.position].timestamp <= now:
+            recorded = self.frames[self.position]
+            image = recorded.decode()
+            left, top = recorded.offset
+            h = min(image.shape[0], self.canvas.shape[0] - top)
+            w = min(image.shape[1], self.canvas.shape[1] - left)
+            self.canvas[top:top + h, left:left + w] = image[:h, :w]
+            self.position += 1
+
+    def grab(self, region=None):
+        now = self.clock.now()
+        if self._last_grab is not None and now <= self._last_grab:
+            self._grabs_at_time += 1
+        else:
+            self._grabs_at_time = 1
+        if self._grabs_at_time > GRABS_PER_TICK:
+            # Время не сдвинулось за итерацию (цикл без паузы): следующий захват
+            # видит следующий записанный кадр, после последнего — конец сессии
+            if self.position < len(self.frames):
+                self.clock.advance_to(self.frames[self.position].timestamp)
+            else:
+                self.clock.advance_to(self.frames[-1].timestamp + 2 * END_SLACK)
+            now = self.clock.now()
+            self._grabs_at_time = 1
+        self._last_grab = now
+        self._advance(now)
+        if self.position == len(self.frames) and (not self.frames or now > self.frames[-1].timestamp + END_SLACK):
+            if not self.ended:
+                self.ended = True
+                logger.info("Replay reached the end of the session")
+                if self.on_end is not None:
+                    self.on_end()
+            return None
+        if region:
+            left, top, width, height = region
+            return self.canvas[top:top + height, left:left + width]
+        return self.canvas
+
+    def close(self):
+        pass
+
+
+class EventLog:
+    """Сборщик событий повтора с интерфейсом SessionRecorder (кадры не хранятся)"""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.events = []
+        self.frames = 0
+
+    def record_frame(self, frame):
+        self.frames += 1
+
+    def record_event(self, event_type, **data):
+        data["type"] = event_type
+        data["t"] = self.clock()
+        self.events.append(data)
+
+    def close(self):
+        pass
+
+
+def summarize_events(events):
+    detections = [e for e in events if e["type"] == "splashes"]
+    circles = [e for e in events if e["type"] == "circles"]
+    inputs = {}
+    for e in events:
+        if e["type"] == "input":
+            inputs[e["action"]] = inputs.get(e["action"], 0) + 1
+    return {
+        "splash_frames": len(detections),
+        "splash_hits": sum(1 for e in detections if e["points"]),
+        "circle_frames": len(circles),
+        "circle_hits": sum(1 for e in circles if e["points"]),
+        "aims": sum(1 for e in events if e["type"] == "aim"),
+        "inputs": inputs,
+    }
+
+
+def compare_aims(recorded, replayed, window=0.1):
+    """Для каждого записанного наведения — ближайшее по времени повторное (в пределах window, с)"""
+    replayed_aims = [e for e in replayed if e["type"] == "aim"]
+    distances = []
+    for aim in (e for e in recorded if e["type"] == "aim"):
+        nearest = min(replayed_aims, key=lambda r: abs(r["t"] - aim["t"]), default=None)
+        if nearest is not None and abs(nearest["t"] - aim["t"]) <= window:
+            distances.append(float(np.hypot(nearest["target"][0] - aim["target"][0],
+                                            nearest["target"][1] - aim["target"][1])))
+    return {
+        "matched_aims": len(distances),
+        "mean_aim_distance_px": float(np.mean(distances)) if distances else None,
+        "max_aim_distance_px": float(np.max(distances)) if distances else None,
+    }
+
+
+def run_replay(path, overrides=None):
+    """Повторяет сессию с настройками записи, поверх которых применены overrides. Возвращает отчёт"""
+    from fishing_service import FishingManager
+
+    frames, events = read_session(path)
+    meta = next((e for e in events if e["type"] == "meta"), None)
+    if meta is None or not frames:
+        raise ValueError(f"Session {path} has no metadata or frames")
+
+    values = dict(meta.get("config", {}))
+    values.update(overrides or {})
+    values.update(REPLAY_OVERRIDES)
+    config = ConfigStore(path=None, initial=values)
+
+    clock = ReplayClock(meta["t"])
+    backend = ReplayBackend(frames, meta["screen"], clock)
+    source = FrameSource(backend, ring_size=4, clock=clock.now)
+    input_backend = RecordingBackend(tuple(meta.get("cursor", (0, 0))), tuple(meta["screen"]), clock=clock.now)
+    manager = FishingManager(frame_source=source, clock=clock, input_backend=input_backend,
+                             config=config, hotkeys=False)
+    backend.on_end = manager.stop_fishing
+    manager.recorder = EventLog(clock.now)
+
+    with tempfile.TemporaryDirectory() as session_root:
+        manager.session_root = session_root
+        started = time.perf_counter()
+        manager.start_fishing()
+        wall = time.perf_counter() - started
+    manager.close()
+
+    virtual = clock.now() - meta["t"]
+    report = {
+        "session": path,
+        "overrides": overrides or {},
+        "frames_recorded": len(frames),
+        "frames_grabbed": manager.recorder.frames,
+        "virtual_s": virtual,
+        "wall_s": wall,
+        "speedup": virtual / wall if wall > 0 else None,
+        "recorded": summarize_events(events),
+        "replayed": summarize_events(manager.recorder.events),
+    }
+    report.update(compare_aims(events, manager.recorder.events))
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Deterministic replay of a recorded fishing session")
+    parser.add_argument("session", help="файл session.gfs")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+                        help="переопределить ключ конфига (значение в JSON: 0.8, true, \"pyramid\")")
+    parser.add_argument("--json", help="сохранить отчёт в JSON")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    report = run_replay(args.session, parse_overrides(args.set))
+
+    print(f"Replayed {report['frames_recorded']} recorded frames: {report['virtual_s']:.1f} s of session "
+          f"in {report['wall_s']:.2f} s (x{report['speedup']:.1f})")
+    for name in ("recorded", "replayed"):
+        s = report[name]
+        print(f"{name:>9}: splashes {s['splash_hits']}/{s['splash_frames']} frames, "
+              f"circles {s['circle_hits']}/{s['circle_frames']}, aims {s['aims']}, inputs {s['inputs']}")
+    if report["matched_aims"]:
+        print(f"Aims matched in time: {report['matched_aims']}, distance mean "
+              f"{report['mean_aim_distance_px']:.1f} px, max {report['max_aim_distance_px']:.1f} px")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=4)
+        print(f"Report saved: {args.json}")
+    return report
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
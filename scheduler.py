@@ -0,0 +1,100 @@
+# scheduler.py
+import time
+import math
+import logging
+
+logger = logging.getLogger("Scheduler")
+
+
+class Clock:
+    """Монотонные часы цикла. Отдельный объект, чтобы replay мог подменить время"""
+
+    def now(self):
+        return time.perf_counter()
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+
+class TickScheduler:
+    """
+    Планировщик тиков по монотонным часам с целевой частотой rate_hz (0 — без ограничения).
+    Опоздавший тик не «догоняется» серией коротких — отсчёт начинается заново от текущего
+    момента, а опоздание учитывается как overrun. Статистика: интервалы между тиками
+    (среднее и джиттер — стандартное отклонение), число и максимум перерасхода.
+    """
+
+    def __init__(self, rate_hz, clock=None, name="loop", report_interval=30.0):
+        self.clock = clock if clock is not None else Clock()
+        self.name = name
+        self.report_interval = report_interval
+        self.set_rate(rate_hz)
+        self.reset()
+
+    def set_rate(self, rate_hz):
+        self.rate_hz = rate_hz
+        self.period = 1.0 / rate_hz if rate_hz and rate_hz > 0 else 0.0
+
+    def reset(self):
+        self.ticks = 0
+        self.overruns = 0
+        self.max_overrun = 0.0
+        self._interval_mean = 0.0
+        self._interval_m2 = 0.0
+        self._last_tick = None
+        self._deadline = None
+        self._last_report = self.clock.now()
+
+    def wait(self):
+        """Ждёт начала следующего тика. Возвращает время от предыдущего тика (с)"""
+        now = self.clock.now()
+        if self._deadline is None:
+            self._deadline = now
+        else:
+            self._deadline += self.period
+            late = now - self._deadline
+            if late > 0 and self.period > 0:
+                self.overruns += 1
+                self.max_overrun = max(self.max_overrun, late)
+                self._deadline = now
+            elif late < 0:
+                self.clock.sleep(-late)
+                now = self.clock.now()
+
+        interval = 0.0 if self._last_tick is None else now - self._last_tick
+        if self._last_tick is not None:
+            self._record_interval(interval)
+        self._last_tick = now
+        self.ticks += 1
+
+        if self.report_interval and now - self._last_report >= self.report_interval:
+            self._last_report = now
+            self.log_report()
+        return interval
+
+    def _record_interval(self, interval):
+        # Онлайн-среднее и дисперсия (Уэлфорд) — без хранения истории
+        count = self.ticks
+        delta = interval - self._interval_mean
+        self._interval_mean += delta / count
+        self._interval_m2 += delta * (interval - self._interval_mean)
+
+    def stats(self):
+        intervals = max(0, self.ticks - 1)
+        jitter = math.sqrt(self._interval_m2 / intervals) if intervals > 1 else 0.0
+        return {
+            "ticks": self.ticks,
+            "target_hz": self.rate_hz,
+            "actual_hz": 1.0 / self._interval_mean if self._interval_mean > 0 else 0.0,
+            "mean_interval_ms": self._interval_mean * 1000,
+            "jitter_ms": jitter * 1000,
+            "overruns": self.overruns,
+            "max_overrun_ms": self.max_overrun * 1000,
+        }
+
+    def log_report(self):
+        s = self.stats()
+        logger.info(f"[{self.name}] {s['ticks']} ticks, {s['actual_hz']:.1f}/{s['target_hz'] or 'max'} Hz, "
+                    f"jitter {s['jitter_ms']:.1f} ms, overruns {s['overruns']} "
+                    f"(max {s['max_overrun_ms']:.1f} ms)")
@@ -0,0 +1,219 @@
+# session_recorder.py
+import json
+import struct
+import threading
+import logging
+from collections import deque
+import cv2
+import numpy as np
+
+from input_backends import InputBackend
+from metrics import inc
+
+logger = logging.getLogger("SessionRecorder")
+
+# Файл сессии: заголовок MAGIC, затем записи подряд:
+#   <kind: u8><length: u32><timestamp: f64><payload>
+# kind=FRAME: <index: u32><left: u16><top: u16> + кадр, сжатый cv2.imencode
+# kind=EVENT: JSON (UTF-8) — метаданные, выходы детекторов, события ввода
+MAGIC = b"GFSESS1\n"
+FRAME = 1
+EVENT = 2
+_RECORD = struct.Struct("<BId")
+_FRAME = struct.Struct("<IHH")
+SESSION_EXTENSION = ".gfs"
+
+
+def _jsonable(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _jsonable(v) for k, v in value.items()}
+    return value
+
+
+class SessionRecorder:
+    """
+    Запись сессии в один файл: кадры (JPEG/PNG, каждый every_n-й), их метки времени и смещения,
+    выходы детекторов и события ввода. Сжатие и запись — в фоновом потоке; кадр копируется
+    из кольца буферов при постановке в очередь. При переполнении очереди старые кадры
+    отбрасываются (события — никогда).
+    """
+
+    def __init__(self, path, clock, every_n=1, image_format="jpg", jpeg_quality=90, max_queue=16):
+        self.path = path
+        self.clock = clock
+        self.every_n = max(1, every_n)
+        self.image_format = "jpg" if image_format in ("jpg", "jpeg") else "png"
+        self._encode_params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality] if self.image_format == "jpg" else []
+        self._file = open(path, "wb")
+        self._file.write(MAGIC)
+        self._queue = deque()
+        self._max_frames = max_queue
+        self._queued_frames = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._frame_counter = 0
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.events_written = 0
+        self._thread = threading.Thread(target=self._run, name="SessionRecorder", daemon=True)
+        self._thread.start()
+        logger.info(f"Recording session to {path} (every {self.every_n} frame(s), {self.image_format})")
+
+    @classmethod
+    def from_config(cls, path, config, clock):
+        return cls(path, clock,
+                   every_n=config.get("record_every_n", 1),
+                   image_format=config.get("record_format", "jpg"),
+                   jpeg_quality=config.get("record_jpeg_quality", 90))
+
+    def record_frame(self, frame):
+        self._frame_counter += 1
+        if (self._frame_counter - 1) % self.every_n:
+            return
+        item = (FRAME, frame.timestamp, (frame.index, frame.offset, frame.image.copy()))
+        with self._cond:
+            if self._closed:
+                return
+            if self._queued_frames >= self._max_frames:
+                # Вытесняем самый старый кадр, события остаются
+                for i, queued in enumerate(self._queue):
+                    if queued[0] == FRAME:
+                        del self._queue[i]
+                        break
+                self._queued_frames -= 1
+                self.frames_dropped += 1
+                inc("record.frames_dropped")
+            self._queue.append(item)
+            self._queued_frames += 1
+            self._cond.notify()
+
+    def record_event(self, event_type, **data):
+        data["type"] = event_type
+        item = (EVENT, self.clock(), data)
+        with self._cond:
+            if self._closed:
+                return
+            self._queue.append(item)
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                kind, timestamp, payload = self._queue.popleft()
+                if kind == FRAME:
+                    self._queued_frames -= 1
+            try:
+                if kind == FRAME:
+                    self._write_frame(timestamp, *payload)
+                else:
+                    self._write(EVENT, timestamp, json.dumps(_jsonable(payload)).encode("utf-8"))
+                    self.events_written += 1
+            except Exception as e:
+                logger.error(f"Session record error: {e}")
+
+    def _write_frame(self, timestamp, index, offset, image):
+        ok, encoded = cv2.imencode("." + self.image_format, image, self._encode_params)
+        if not ok:
+            logger.error("Failed to encode session frame")
+            return
+        self._write(FRAME, timestamp, _FRAME.pack(index, offset[0], offset[1]) + encoded.tobytes())
+        self.frames_written += 1
+
+    def _write(self, kind, timestamp, payload):
+        self._file.write(_RECORD.pack(kind, len(payload), timestamp))
+        self._file.write(payload)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        self._file.close()
+        logger.info(f"Session recorded: {self.frames_written} frames ({self.frames_dropped} dropped), "
+                    f"{self.events_written} events -> {self.path}")
+
+
+class RecordedFrame:
+    __slots__ = ("timestamp", "index", "offset", "data")
+
+    def __init__(self, timestamp, index, offset, data):
+        self.timestamp = timestamp
+        self.index = index
+        self.offset = offset
+        self.data = data
+
+    def decode(self):
+        return cv2.imdecode(np.frombuffer(self.data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def read_session(path):
+    """Читает файл сессии: (кадры RecordedFrame в порядке записи, события dict с ключом "t")"""
+    frames, events = [], []
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"Not a session file: {path}")
+        while True:
+            header = f.read(_RECORD.size)
+            if len(header) < _RECORD.size:
+                break
+            kind, length, timestamp = _RECORD.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                logger.warning(f"Session file {path} is truncated")
+                break
+            if kind == FRAME:
+                index, left, top = _FRAME.unpack_from(payload)
+                frames.append(RecordedFrame(timestamp, index, (left, top), payload[_FRAME.size:]))
+            elif kind == EVENT:
+                event = json.loads(payload.decode("utf-8"))
+                event["t"] = timestamp
+                events.append(event)
+    return frames, events
+
+
+class RecordingInputProxy(InputBackend):
+    """Бэкенд-обёртка: передаёт вызовы настоящему бэкенду и пишет их в сессию"""
+
+    def __init__(self, backend, recorder):
+        self.backend = backend
+        self.recorder = recorder
+        self.name = backend.name
+
+    def position(self):
+        return self.backend.position()
+
+    def screen_size(self):
+        return self.backend.screen_size()
+
+    def mouse_down(self, button="right"):
+        self.recorder.record_event("input", action="down", button=button)
+        self.backend.mouse_down(button)
+
+    def mouse_up(self, button="right"):
+        self.recorder.record_event("input", action="up", button=button)
+        self.backend.mouse_up(button)
+
+    def move_relative(self, dx, dy):
+        self.recorder.record_event("input", action="move", dx=dx, dy=dy)
+        self.backend.move_relative(dx, dy)
+
+    def move_batch(self, moves):
+        self.recorder.record_event("input", action="move_batch", moves=list(moves))
+        self.backend.move_batch(moves)
+
+    def press_key(self, key):
+        self.recorder.record_event("input", action="key", key=key)
+        self.backend.press_key(key)
+
+    def close(self):
+        self.backend.close()
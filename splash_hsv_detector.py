@@ -3,9 +3,12 @@ import numpy as np
 import mss
 import json
 from datetime import datetime
+from color_detection import ColorDetector, ColorRange, SPLASH_STEPS, SAVED_RANGES_FILE, load_saved_ranges
 
 hsv_frame = None
 saved_colors = []
+# Один перевод кадра в HSV на все сохранённые диапазоны, буферы масок переиспользуются
+colors = ColorDetector(load_saved_ranges(SAVED_RANGES_FILE))
 
 def list_monitors():
     with mss.mss() as sct:
@@ -51,9 +54,10 @@ def mouse_callback(event, x, y, flags, param):
             "upper": upper.tolist()
         })
         save_to_file(saved_colors)
+        colors.add(ColorRange(f"saved_{len(colors.ranges)}", lower, upper, SPLASH_STEPS))
 
 def save_to_file(data):
-    with open("saved_hsv_ranges.json", "w", encoding="utf-8") as f:
+    with open(SAVED_RANGES_FILE, "w", encoding="utf-8") as f:
         json.dump(data, f, indent=4, ensure_ascii=False)
 
 def start_hsv_picker(monitor):
@@ -61,14 +65,24 @@ def start_hsv_picker(monitor):
     with mss.mss() as sct:
         cv2.namedWindow("Экран")
         cv2.setMouseCallback("Экран", mouse_callback)
+        preview = None
 
         while True:
             img = sct.grab(monitor)
             frame = np.array(img)
             frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
-            hsv_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+            masks = colors.detect(frame)
+            hsv_frame = masks.hsv
 
             cv2.imshow("Экран", frame)
+            # Предпросмотр: объединение масок всех сохранённых диапазонов
+            if colors.ranges:
+                if preview is None or preview.shape != frame.shape[:2]:
+                    preview = np.empty(frame.shape[:2], dtype=np.uint8)
+                preview.fill(0)
+                for name, mask in masks.items():
+                    cv2.bitwise_or(preview, mask, dst=preview)
+                cv2.imshow("Маска", preview)
             if cv2.waitKey(1) & 0xFF == ord('q'):
                 break
 
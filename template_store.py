@@ -0,0 +1,114 @@
+# template_store.py
+import os
+import glob
+import time
+import threading
+import logging
+import cv2
+
+logger = logging.getLogger("TemplateStore")
+
+TEMPLATES_DIR = "templates"
+# Разрешение, под которое нарезаны исходные шаблоны
+BASE_RESOLUTION = (1920, 1080)
+# Разрешения, для которых масштабированные шаблоны готовятся заранее
+PRESCALED_RESOLUTIONS = ((1920, 1080), (2560, 1440), (3840, 2160))
+
+
+class Template:
+    __slots__ = ("name", "image", "width", "height")
+
+    def __init__(self, name, image):
+        self.name = name
+        self.image = image
+        self.height, self.width = image.shape[:2]
+
+
+class TemplateStore:
+    """
+    Кэш шаблонов в памяти. Группа (например "splash") — это все файлы по маске,
+    т.е. несколько вариантов всплеска. Шаблоны читаются с диска один раз, масштабируются
+    под разрешение экрана и перечитываются только при изменении mtime файла
+    (проверка не чаще раза в check_interval секунд).
+    """
+
+    def __init__(self, directory=TEMPLATES_DIR, base_resolution=BASE_RESOLUTION,
+                 resolutions=PRESCALED_RESOLUTIONS, check_interval=2.0):
+        self.directory = directory
+        self.base_resolution = base_resolution
+        self.resolutions = resolutions
+        self.check_interval = check_interval
+        self._patterns = {}
+        self._sources = {}   # group -> {path: (mtime, grayscale image)}
+        self._scaled = {}    # (group, height) -> [Template]
+        self._last_check = {}
+        self._lock = threading.Lock()
+
+    def register(self, group, pattern=None):
+        """Регистрирует группу шаблонов по маске файлов (по умолчанию <group>*.png)"""
+        self._patterns[group] = pattern or f"{group}*.png"
+        with self._lock:
+            self._reload(group)
+
+    def _reload(self, group):
+        paths = sorted(glob.glob(os.path.join(self.directory, self._patterns[group])))
+        current = self._sources.get(group, {})
+        sources = {}
+        changed = group not in self._sources or set(paths) != set(current)
+
+        for path in paths:
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                continue
+            cached = current.get(path)
+            if cached is not None and cached[0] == mtime:
+                sources[path] = cached
+                continue
+            image = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+            if image is None:
+                logger.error(f"Failed to load template image: {path}")
+                continue
+            sources[path] = (mtime, image)
+            changed = True
+            logger.info(f"Template loaded: {path} ({image.shape[1]}x{image.shape[0]})")
+
+        self._last_check[group] = time.monotonic()
+        if not changed:
+            return
+
+        self._sources[group] = sources
+        for key in [k for k in self._scaled if k[0] == group]:
+            del self._scaled[key]
+        if not sources:
+            logger.error(f"No templates found for '{group}' in {self.directory}")
+            return
+        for _, height in self.resolutions:
+            self._build_scaled(group, height)
+
+    def _build_scaled(self, group, screen_height):
+        scale = screen_height / self.base_resolution[1]
+        templates = []
+        for path, (_, image) in self._sources.get(group, {}).items():
+            if abs(scale - 1.0) > 1e-3:
+                size = (max(1, round(image.shape[1] * scale)), max(1, round(image.shape[0] * scale)))
+                interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+                image = cv2.resize(image, size, interpolation=interpolation)
+            templates.append(Template(os.path.basename(path), image))
+        self._scaled[(group, screen_height)] = templates
+        return templates
+
+    def get(self, group, screen_size=None):
+        """Варианты шаблона группы под разрешение screen_size (ширина, высота)"""
+        if group not in self._patterns:
+            self.register(group)
+
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_check.get(group, 0) >= self.check_interval:
+                self._reload(group)
+            screen_height = screen_size[1] if screen_size else self.base_resolution[1]
+            templates = self._scaled.get((group, screen_height))
+            if templates is None:
+                templates = self._build_scaled(group, screen_height)
+            return templates
@@ -0,0 +1,141 @@
+# tracker.py
+import math
+import logging
+import numpy as np
+
+logger = logging.getLogger("Tracker")
+
+_H = np.array([[1.0, 0.0, 0.0, 0.0],
+               [0.0, 1.0, 0.0, 0.0]])
+
+
+class KalmanTrack:
+    """
+    Фильтр Калмана с моделью постоянной скорости. Состояние [x, y, vx, vy] в пикселях экрана,
+    время — метки захвата кадров в секундах. process_noise — дисперсия ускорения (px/s²)²,
+    measurement_noise — дисперсия ошибки детекции (px²).
+    """
+
+    def __init__(self, position, timestamp, process_noise=4.0e5, measurement_noise=9.0):
+        self.state = np.array([position[0], position[1], 0.0, 0.0], dtype=np.float64)
+        # Скорость в начале неизвестна — большая неопределённость
+        self.covariance = np.diag([measurement_noise, measurement_noise, 1.0e6, 1.0e6])
+        self.timestamp = timestamp
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.hits = 1
+        self.misses = 0
+
+    def _transition(self, dt):
+        F = np.eye(4)
+        F[0, 2] = F[1, 3] = dt
+        q = self.process_noise
+        dt2, dt3, dt4 = dt * dt, dt ** 3, dt ** 4
+        Q = q * np.array([[dt4 / 4, 0, dt3 / 2, 0],
+                          [0, dt4 / 4, 0, dt3 / 2],
+                          [dt3 / 2, 0, dt2, 0],
+                          [0, dt3 / 2, 0, dt2]])
+        return F, Q
+
+    def predict(self, timestamp):
+        """Прогноз (состояние, ковариация) на момент timestamp без изменения трека"""
+        dt = max(0.0, timestamp - self.timestamp)
+        F, Q = self._transition(dt)
+        return F @ self.state, F @ self.covariance @ F.T + Q
+
+    def predicted_position(self, timestamp):
+        state, _ = self.predict(timestamp)
+        return state[0], state[1]
+
+    def update(self, position, timestamp):
+        state, covariance = self.predict(timestamp)
+        innovation = np.asarray(position, dtype=np.float64) - _H @ state
+        S = _H @ covariance @ _H.T + np.eye(2) * self.measurement_noise
+        K = covariance @ _H.T @ np.linalg.inv(S)
+        self.state = state + K @ innovation
+        self.covariance = (np.eye(4) - K @ _H) @ covariance
+        self.timestamp = timestamp
+        self.hits += 1
+        self.misses = 0
+
+    @property
+    def position(self):
+        return self.state[0], self.state[1]
+
+    @property
+    def velocity(self):
+        return self.state[2], self.state[3]
+
+    def position_sigma(self, timestamp):
+        _, covariance = self.predict(timestamp)
+        return math.sqrt(max(covariance[0, 0], covariance[1, 1]))
+
+
+class TargetTracker:
+    """
+    Сопровождение одной цели (круг калибровки или выбранный всплеск) между кадрами.
+    Детекция ищется в небольшом окне вокруг прогноза; после max_misses промахов подряд
+    трек считается потерянным и поиск возвращается к полному кадру (или полосе ROI).
+    """
+
+    def __init__(self, name, min_half_size=80, max_misses=5, gate_sigmas=4.0, min_gate=40, **kalman):
+        self.name = name
+        self.min_half_size = min_half_size
+        self.max_misses = max_misses
+        self.gate_sigmas = gate_sigmas
+        self.min_gate = min_gate
+        self.kalman = kalman
+        self.track = None
+        # Номер текущего трека: растёт с каждым start(), по нему отличают уточнение цели от новой
+        self.track_id = 0
+
+    @property
+    def active(self):
+        return self.track is not None
+
+    def reset(self):
+        self.track = None
+
+    def start(self, position, timestamp):
+        self.track = KalmanTrack(position, timestamp, **self.kalman)
+        self.track_id += 1
+        logger.debug(f"[{self.name}] track {self.track_id} started at {position}")
+
+    def window(self, timestamp, screen_size):
+        """Окно поиска (left, top, width, height) вокруг прогноза или None, если трека нет"""
+        # Окно запрашивает поток захвата, а трек обновляет поток детекции — работаем с локальной ссылкой
+        track = self.track
+        if track is None:
+            return None
+        x, y = track.predicted_position(timestamp)
+        half = int(self.min_half_size + 3 * track.position_sigma(timestamp))
+        screen_width, screen_height = screen_size
+        left = int(min(max(0, x - half), screen_width - 1))
+        top = int(min(max(0, y - half), screen_height - 1))
+        right = int(min(screen_width, max(left + 1, x + half)))
+        bottom = int(min(screen_height, max(top + 1, y + half)))
+        if right - left >= screen_width and bottom - top >= screen_height:
+            return None
+        return left, top, right - left, bottom - top
+
+    def observe(self, detections, timestamp):
+        """
+        Сопоставляет детекции с прогнозом и обновляет трек.
+        Возвращает сглаженную позицию цели или None, если цель в этом кадре не найдена.
+        """
+        if self.track is None:
+            return None
+        if detections:
+            px, py = self.track.predicted_position(timestamp)
+            nearest = min(detections, key=lambda p: (p[0] - px) ** 2 + (p[1] - py) ** 2)
+            gate = max(self.min_gate, self.gate_sigmas * self.track.position_sigma(timestamp))
+            if math.hypot(nearest[0] - px, nearest[1] - py) <= gate:
+                self.track.update(nearest, timestamp)
+                x, y = self.track.position
+                return int(round(x)), int(round(y))
+
+        self.track.misses += 1
+        if self.track.misses > self.max_misses:
+            logger.debug(f"[{self.name}] track lost after {self.track.misses} misses")
+            self.track = None
+        return None
@@ -0,0 +1,296 @@
+"""
+Подбор параметров детекторов: перебор сетки значений в пуле процессов по размеченным кадрам
+"ai dev" (точность — F1 по рамкам класса "circle", как в benchmark.py) и записанным сессиям
+(разметки нет — только задержка и доля кадров с детекцией). Итог — Парето-фронт
+«точность / задержка на кадр»; выбранная точка записывается прямо в fishing_config.json.
+Для детекторов всплеска (splash_color, template) в разметке нет их класса: размеченные кадры
+дают им только задержку, точность — доля кадров сессий с детекцией, а --write без --source
+отклоняется.
+
+    python tune.py target_circle --split val
+    python tune.py splash_color --split val --source debug_screenshots/20250530_231500/session.gfs
+    python tune.py template --max-ms 8 --write       # лучшая точка фронта не медленнее 8 мс
+    python tune.py calibration_circle --pick 2 --write
+
+Каждый воркер загружает кадры один раз и держит FrameContext каждого кадра (серое, размытое,
+HSV) для всех своих испытаний. Стоимость подготовки замеряется при первом вычислении и
+прибавляется к задержке каждого испытания — так задержка сравнима с детектором, который
+сам готовит кадр.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+import cv2
+from benchmark import LABELED, load_split, load_session, load_directory, load_benchmark_template, score_frame
+from color_detection import ColorDetector, CIRCLE_STEPS, largest_blob, round_blobs, splash_steps
+from config_service import ConfigStore, CONFIG_FILE
+from frame_context import FrameContext
+from vision_service import find_target_circle, match_template
+
+logger = logging.getLogger("Tune")
+
+# Сетки параметров по детекторам: имя параметра -> значения (точка сетки -> ключи конфига в to_config)
+SPACES = {
+    "target_circle": {
+        "dp": (1, 1.5, 2),
+        "minDist": (50, 100),
+        "param1": (50, 100),
+        "param2": (20, 30, 40),
+        "radius": ((5, 60), (10, 100)),
+    },
+    "calibration_circle": {
+        "hue": ((79, 107), (70, 115), (85, 100)),
+        "saturation": ((87, 118), (60, 150), (40, 200)),
+        "value": ((52, 56), (40, 80), (30, 150)),
+    },
+    "splash_color": {
+        "hue": ((90, 120), (85, 125), (95, 115)),
+        "saturation": ((150, 255), (100, 255), (200, 255)),
+        "value": ((50, 255), (120, 255)),
+        "iterations": (0, 1, 2, 3),
+    },
+    "template": {
+        "match_threshold": (0.6, 0.65, 0.7, 0.75, 0.8, 0.85, 0.9),
+        "match_mode": ("exhaustive", "pyramid"),
+    },
+}
+
+# Ключи конфига, которые задаёт каждый детектор (текущие значения — базовая точка сравнения)
+CONFIG_KEYS = {
+    "target_circle": ("circle_params",),
+    "calibration_circle": ("calibration_color_range",),
+    "splash_color": ("splash_color_range", "splash_open_iterations"),
+    "template": ("match_threshold", "match_mode", "pyramid_scale"),
+}
+
+# Какое представление FrameContext нужно детектору
+PREPARED = {"target_circle": "blurred", "calibration_circle": "hsv", "splash_color": "hsv", "template": "gray"}
+
+
+def _hsv_bounds(hue, saturation, value):
+    return [[hue[0], saturation[0], value[0]], [hue[1], saturation[1], value[1]]]
+
+
+def to_config(detector, point):
+    """Точка сетки -> значения ключей конфига"""
+    if detector == "target_circle":
+        params = {key: point[key] for key in ("dp", "minDist", "param1", "param2")}
+        params["minRadius"], params["maxRadius"] = point["radius"]
+        return {"circle_params": params}
+    if detector == "calibration_circle":
+        return {"calibration_color_range": _hsv_bounds(point["hue"], point["saturation"], point["value"])}
+    if detector == "splash_color":
+        return {"splash_color_range": _hsv_bounds(point["hue"], point["saturation"], point["value"]),
+                "splash_open_iterations": point["iterations"]}
+    return dict(point)
+
+
+def grid(detector, config):
+    """Все точки сетки детектора поверх текущих значений его ключей"""
+    space = SPACES[detector]
+    current = {key: config.get(key) for key in CONFIG_KEYS[detector]}
+    for values in itertools.product(*space.values()):
+        yield {**current, **to_config(detector, dict(zip(space, values)))}
+
+
+# --- Состояние процесса-воркера ---
+_frames = []       # (FrameContext кадра, рамки или None для сессий)
+_prepare_ms = {}   # (индекс кадра, представление) -> мс на первое вычисление
+_template = None
+_colors = None
+_warmed = set()  # детекторы, уже прогнанные воркером без замера
+
+
+def _worker_init(sources, session_frames):
+    global _template, _colors
+    cv2.setNumThreads(1)  # параллелизм даёт пул, задержка испытания — на одном потоке
+    frames = []
+    for kind, path in sources:
+        if kind == "split":
+            frames += load_split(path)
+        elif kind == "session":
+            frames += load_session(path, session_frames)
+        else:
+            frames += load_directory(path)
+    _frames[:] = [(FrameContext(frame), boxes) for frame, boxes in frames]
+    _template = load_benchmark_template(frames) if frames else None
+    _colors = ColorDetector()
+
+
+def _prepare(index, kind):
+    """Контекст кадра с уже посчитанным представлением kind и стоимость его первого вычисления"""
+    context = _frames[index][0]
+    key = (index, kind)
+    if key not in _prepare_ms:
+        start = time.perf_counter()
+        getattr(context, kind)
+        _prepare_ms[key] = (time.perf_counter() - start) * 1000
+    return context, _prepare_ms[key]
+
+
+def _detect(detector, values, context):
+    """Рамки (xmin, ymin, xmax, ymax) или точки (x, y) детектора с параметрами values"""
+    if detector == "target_circle":
+        circle = find_target_circle(context, values["circle_params"])
+        if circle is None:
+            return []
+        x, y, r = (int(v) for v in circle)
+        return [(x - r, y - r, x + r, y + r)]
+    if detector == "calibration_circle":
+        _colors.set_range("circle", *values["calibration_color_range"], CIRCLE_STEPS)
+        mask = _colors.detect(context, ("circle",))["circle"]
+        return [(int(x - r), int(y - r), int(x + r), int(y + r))
+                for x, y, r in round_blobs(mask, min_radius=15, max_radius=100, min_fill=0.6)]
+    if detector == "splash_color":
+        _colors.set_range("splash", *values["splash_color_range"], splash_steps(values["splash_open_iterations"]))
+        center = largest_blob(_colors.detect(context, ("splash",))["splash"], min_area=50)
+        return [center] if center is not None else []
+    th, tw = _template.shape[:2]
+    points, _ = match_template(context, _template, values["match_threshold"], mode=values["match_mode"],
+                               pyramid_scale=values["pyramid_scale"])
+    return [(int(x), int(y), int(x) + tw, int(y) + th) for x, y in points]
+
+
+def run_trial(detector, values):
+    """Одно испытание в воркере: точность по размеченным кадрам (для LABELED) и сессиям, задержка по всем"""
+    if detector not in _warmed:
+        # Первый прогон платит за буферы масок и инициализацию OpenCV — в замер не идёт
+        for index in range(len(_frames)):
+            _detect(detector, values, _prepare(index, PREPARED[detector])[0])
+        _warmed.add(detector)
+    stats = {"detections": 0, "ground_truth": 0, "true_positives": 0, "iou": []}
+    timings = []
+    session_frames = session_hits = 0
+    for index, (_, boxes) in enumerate(_frames):
+        context, prepare_ms = _prepare(index, PREPARED[detector])
+        start = time.perf_counter()
+        detections = _detect(detector, values, context)
+        timings.append(prepare_ms + (time.perf_counter() - start) * 1000)
+        if boxes is None:
+            session_frames += 1
+            session_hits += bool(detections)
+        elif detector in LABELED:
+            score_frame(detections, boxes, stats)
+
+    tp = stats["true_positives"]
+    precision = tp / stats["detections"] if stats["detections"] else 0.0
+    recall = tp / stats["ground_truth"] if stats["ground_truth"] else None
+    f1 = None
+    if recall is not None:
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    hit_rate = session_hits / session_frames if session_frames else None
+    return {
+        "values": values,
+        # Без размеченных кадров точность — доля кадров сессий с детекцией
+        "accuracy": f1 if f1 is not None else hit_rate or 0.0,
+        "f1": f1,
+        "precision": precision if recall is not None else None,
+        "recall": recall,
+        "session_hit_rate": hit_rate,
+        "mean_ms": float(np.mean(timings)) if timings else 0.0,
+        "p90_ms": float(np.percentile(timings, 90)) if timings else 0.0,
+    }
+
+
+def sweep(detector, trials, sources, workers=None, session_frames=200):
+    """Испытания в пуле процессов; каждый воркер загружает кадры и кэш подготовки один раз"""
+    workers = workers or os.cpu_count() or 1
+    chunk = max(1, len(trials) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_worker_init,
+                             initargs=(sources, session_frames)) as pool:
+        return list(pool.map(run_trial, [detector] * len(trials), trials, chunksize=chunk))
+
+
+def pareto_front(results):
+    """Недоминируемые точки: никакая другая не точнее и не быстрее одновременно. По возрастанию задержки"""
+    front = []
+    for result in sorted(results, key=lambda r: (r["mean_ms"], -r["accuracy"])):
+        if not front or result["accuracy"] > front[-1]["accuracy"]:
+            front.append(result)
+    return front
+
+
+def choose(front, pick=None, max_ms=None):
+    """Точка фронта по номеру, иначе самая точная в пределах max_ms (по умолчанию — самая точная)"""
+    if pick is not None:
+        return front[pick] if 0 <= pick < len(front) else None
+    candidates = [r for r in front if max_ms is None or r["mean_ms"] <= max_ms]
+    return candidates[-1] if candidates else None
+
+
+def print_front(front, baseline, chosen):
+    fmt = lambda v: "  n/a" if v is None else f"{v:5.2f}"
+    print(f"\n{'#':>3}  {'acc':>5}  {'P':>5}  {'R':>5}  {'mean ms':>8}  {'p90 ms':>7}  {'hits':>5}  values")
+    rows = [(str(i), r) for i, r in enumerate(front)] + [("cur", baseline)]
+    for label, r in rows:
+        mark = ">" if r is chosen else " "
+        print(f"{mark}{label:>3}  {r['accuracy']:5.2f}  {fmt(r['precision'])}  {fmt(r['recall'])}  "
+              f"{r['mean_ms']:8.2f}  {r['p90_ms']:7.2f}  {fmt(r['session_hit_rate'])}  "
+              f"{json.dumps(r['values'], separators=(',', ':'))}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parallel parameter sweep for detectors with a Pareto front")
+    parser.add_argument("detector", choices=tuple(SPACES))
+    parser.add_argument("--split", action="append", choices=("train", "val"),
+                        help="размеченная выборка из 'ai dev' (можно несколько раз)")
+    parser.add_argument("--source", action="append", default=[],
+                        help="session.gfs или папка с записанными кадрами без разметки (можно несколько раз)")
+    parser.add_argument("--session-frames", type=int, default=200, help="кадров из каждой сессии (равномерно)")
+    parser.add_argument("--workers", type=int, default=None, help="процессов пула (по умолчанию — число ядер)")
+    parser.add_argument("--pick", type=int, help="номер точки фронта для записи")
+    parser.add_argument("--max-ms", type=float, help="самая точная точка фронта не медленнее этого")
+    parser.add_argument("--write", action="store_true", help="записать выбранную точку в конфиг")
+    parser.add_argument("--config", default=CONFIG_FILE)
+    parser.add_argument("--json", help="сохранить все испытания и фронт в JSON")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    splits = args.split or ([] if args.source else ["val"])
+    sources = [("split", split) for split in splits]
+    sources += [("session" if path.endswith(".gfs") else "directory", path) for path in args.source]
+
+    config = ConfigStore(args.config, save_delay=0)
+    baseline_values = {key: config.get(key) for key in CONFIG_KEYS[args.detector]}
+    trials = [baseline_values] + list(grid(args.detector, config))
+    logger.info(f"{len(trials)} trials for {args.detector} over {sources}")
+
+    started = time.perf_counter()
+    results = sweep(args.detector, trials, sources, args.workers, args.session_frames)
+    baseline, results = results[0], results[1:]
+    front = pareto_front(results)
+    chosen = choose(front, args.pick, args.max_ms)
+    print(f"{len(results)} trials of {args.detector} in {time.perf_counter() - started:.1f} s, "
+          f"{len(front)} on the Pareto front")
+    print_front(front, baseline, chosen)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"detector": args.detector, "sources": sources, "baseline": baseline,
+                       "front": front, "trials": results}, f, indent=4)
+        print(f"\nReport saved: {args.json}")
+    if args.write:
+        if args.detector not in LABELED and not args.source:
+            print(f"\nNo ground truth for {args.detector} in the labeled splits: pass --source sessions "
+                  f"to write a point, config not changed")
+        elif chosen is None:
+            print("\nNo point matches --pick / --max-ms, config not changed")
+        else:
+            config.update(chosen["values"])
+            config.flush()
+            print(f"\nWritten to {args.config}: {json.dumps(chosen['values'])}")
+    return front, chosen
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
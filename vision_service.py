@@ -1,56 +1,65 @@
 # vision_service.py
 import cv2
 import numpy as np
-import mss
 import logging
+import threading
+from capture_service import FrameSource, MssBackend
+from color_detection import ColorDetector, ColorRange, largest_blob, splash_steps
+from frame_context import FrameContext, context_for
+from metrics import timed
 
 logger = logging.getLogger("VisionService")
 
+_frame_source = None
+# Цветовой детектор с буферами на поток (find_splash зовут и конвейер, и воркеры, и бенчмарк)
+_local = threading.local()
+
+
+def get_frame_source(monitor_index=1):
+    """
+    Общий долгоживущий источник кадров (создаётся при первом обращении).
+    monitor_index — индекс монитора mss (0 — все мониторы), учитывается только при создании.
+    """
+    global _frame_source
+    if _frame_source is None:
+        _frame_source = FrameSource(MssBackend(monitor_index))
+    return _frame_source
+
+
+def set_frame_source(source):
+    global _frame_source
+    _frame_source = source
+
 
 def capture_screen(region=None):
-    try:
-        with mss.mss() as sct:
-            monitor = sct.monitors[1]
-            if region:
-                monitor = {
-                    "top": region[1],
-                    "left": region[0],
-                    "width": region[2],
-                    "height": region[3],
-                    "mon": 1
-                }
-
-            img = np.array(sct.grab(monitor))
-            return cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
-    except Exception as e:
-        logger.error(f"Screen capture error: {e}")
+    frame = get_frame_source().grab(region)
+    if frame is None:
         return None
+    return frame.image
+
+
+def _splash_colors(color_range, iterations):
+    colors = getattr(_local, "colors", None)
+    if colors is None:
+        colors = _local.colors = ColorDetector([ColorRange("splash", color_range[0], color_range[1],
+                                                           splash_steps(iterations))])
+    else:
+        colors.set_range("splash", color_range[0], color_range[1], splash_steps(iterations))
+    return colors
 
 
-def find_splash(screen, color_range):
+@timed("vision.find_splash")
+def find_splash(screen, color_range, iterations=2):
+    """Центр самого большого пятна цвета всплеска; screen — кадр BGR или FrameContext"""
     if screen is None:
         return None
 
     try:
-        hsv = cv2.cvtColor(screen, cv2.COLOR_BGR2HSV)
-        lower = np.array(color_range[0])
-        upper = np.array(color_range[1])
-        mask = cv2.inRange(hsv, lower, upper)
-
-        # Улучшение обнаружения
-        mask = cv2.erode(mask, None, iterations=2)
-        mask = cv2.dilate(mask, None, iterations=2)
-
-        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        if not contours:
-            return None
-
-        largest = max(contours, key=cv2.contourArea)
-        if cv2.contourArea(largest) < 50:
+        # Маска с улучшением обнаружения (erode/dilate) в переиспользуемых буферах
+        mask = _splash_colors(color_range, iterations).detect(screen, ("splash",))["splash"]
+        center = largest_blob(mask, min_area=50)
+        if center is None:
             return None
-
-        x, y, w, h = cv2.boundingRect(largest)
-        center = (x + w // 2, y + h // 2)
         logger.debug(f"Splash detected at {center}")
         return center
     except Exception as e:
@@ -58,13 +67,14 @@ def find_splash(screen, color_range):
         return None
 
 
+@timed("vision.find_target_circle")
 def find_target_circle(screen, params):
+    """Круг HoughCircles (x, y, r) или None; screen — кадр BGR или FrameContext (размытие из кэша кадра)"""
     if screen is None:
         return None
 
     try:
-        gray = cv2.cvtColor(screen, cv2.COLOR_BGR2GRAY)
-        gray = cv2.GaussianBlur(gray, (9, 9), 2)
+        gray = context_for(screen).blurred
 
         circles = cv2.HoughCircles(
             gray,
@@ -81,4 +91,126 @@ def find_target_circle(screen, params):
         return (circle[0], circle[1], circle[2])
     except Exception as e:
         logger.error(f"Circle detection error: {e}")
-        return None
\ No newline at end of file
+        return None
+
+
+# Минимальный размер шаблона на грубом уровне пирамиды — меньше уже теряется форма всплеска
+MIN_PYRAMID_TEMPLATE_SIZE = 8
+# Сколько кандидатов-максимумов на один итоговый пик допускается до жадного подавления
+CANDIDATES_PER_PEAK = 8
+
+
+def _empty_peaks():
+    return np.empty((0, 2), dtype=np.int64), np.empty(0, dtype=np.float32)
+
+
+def suppress_peaks(points, scores, min_distance=50, top_k=20):
+    """
+    Жадное подавление немаксимумов: точки по убыванию оценки, соседи ближе min_distance
+    отбрасываются. На вход подаётся уже ограниченное число кандидатов, поэтому цикл короткий.
+    """
+    if not len(points):
+        return _empty_peaks()
+    order = np.argsort(-scores, kind="stable")
+    points = points[order]
+    scores = scores[order]
+
+    min_dist_sq = min_distance * min_distance
+    suppressed = np.zeros(len(points), dtype=bool)
+    keep = []
+    for i in range(len(points)):
+        if suppressed[i]:
+            continue
+        keep.append(i)
+        if len(keep) >= top_k:
+            break
+        diff = points[i + 1:] - points[i]
+        suppressed[i + 1:] |= np.einsum("ij,ij->i", diff, diff) <= min_dist_sq
+    return points[keep], scores[keep]
+
+
+def extract_peaks(res, threshold, min_distance=50, top_k=20, offset=(0, 0)):
+    """
+    Пики карты совпадений: локальные максимумы (через dilate) выше порога, не более
+    top_k * CANDIDATES_PER_PEAK лучших кандидатов, затем suppress_peaks.
+    Стоимость ограничена размером карты, а не числом пикселей над порогом.
+    Возвращает (точки (N, 2) x, y + offset, оценки (N,)) по убыванию оценки.
+    """
+    radius = max(1, min(min_distance // 2, 15))
+    local_max = cv2.dilate(res, np.ones((2 * radius + 1, 2 * radius + 1), np.uint8))
+    flat = np.flatnonzero((res >= threshold) & (res >= local_max))
+    if not len(flat):
+        return _empty_peaks()
+
+    scores = res.ravel()[flat]
+    limit = top_k * CANDIDATES_PER_PEAK
+    if len(flat) > limit:
+        best = np.argpartition(scores, -limit)[-limit:]
+        flat = flat[best]
+        scores = scores[best]
+
+    ys, xs = np.divmod(flat, res.shape[1])
+    points = np.stack((xs + offset[0], ys + offset[1]), axis=1)
+    return suppress_peaks(points, scores, min_distance, top_k)
+
+
+@timed("vision.match_template")
+def match_template(gray, template, threshold, mode="exhaustive", pyramid_scale=2, coarse_slack=0.1,
+                   min_distance=50, top_k=20):
+    """
+    Поиск шаблона в кадре (оба изображения в градациях серого).
+    gray может быть FrameContext — тогда берётся его серое представление.
+    Возвращает (точки (N, 2) левых верхних углов x, y; оценки TM_CCOEFF_NORMED) —
+    не более top_k пиков не ближе min_distance друг к другу, по убыванию оценки.
+
+    mode="exhaustive" — matchTemplate по всему кадру в полном разрешении.
+    mode="pyramid" — сначала поиск на кадре, уменьшенном в pyramid_scale раз, с порогом,
+    ослабленным на coarse_slack, затем уточнение в полном разрешении только вокруг найденных пиков.
+    """
+    if isinstance(gray, FrameContext):
+        gray = gray.gray
+    th, tw = template.shape[:2]
+    if gray.shape[0] < th or gray.shape[1] < tw:
+        return _empty_peaks()
+
+    if mode == "pyramid" and min(th, tw) // pyramid_scale >= MIN_PYRAMID_TEMPLATE_SIZE:
+        return _match_pyramid(gray, template, threshold, pyramid_scale, coarse_slack, min_distance, top_k)
+
+    res = cv2.matchTemplate(gray, template, cv2.TM_CCOEFF_NORMED)
+    return extract_peaks(res, threshold, min_distance, top_k)
+
+
+def _match_pyramid(gray, template, threshold, scale, coarse_slack, min_distance, top_k):
+    th, tw = template.shape[:2]
+    height, width = gray.shape[:2]
+    small = cv2.resize(gray, (width // scale, height // scale), interpolation=cv2.INTER_AREA)
+    small_template = cv2.resize(template, (tw // scale, th // scale), interpolation=cv2.INTER_AREA)
+
+    coarse = cv2.matchTemplate(small, small_template, cv2.TM_CCOEFF_NORMED)
+    # Кандидатов на грубом уровне берём с запасом: часть отсеется при уточнении
+    coarse_points, _ = extract_peaks(coarse, threshold - coarse_slack,
+                                     max(1, min_distance // (2 * scale)), top_k * CANDIDATES_PER_PEAK)
+
+    points = []
+    scores = []
+    pad = 2 * scale
+    for cx, cy in coarse_points:
+        # Окно уточнения в полном разрешении вокруг пика грубого уровня
+        x0 = max(0, cx * scale - pad)
+        y0 = max(0, cy * scale - pad)
+        x1 = min(width - tw, cx * scale + pad)
+        y1 = min(height - th, cy * scale + pad)
+        if x1 < x0 or y1 < y0:
+            continue
+        window = gray[y0:y1 + th, x0:x1 + tw]
+        res = cv2.matchTemplate(window, template, cv2.TM_CCOEFF_NORMED)
+        # Лучшая точка окна — окно меньше min_distance, больше одного пика в нём не бывает
+        _, best, _, (bx, by) = cv2.minMaxLoc(res)
+        if best >= threshold:
+            points.append((bx + x0, by + y0))
+            scores.append(best)
+
+    if not points:
+        return _empty_peaks()
+    return suppress_peaks(np.array(points, dtype=np.int64), np.array(scores, dtype=np.float32),
+                          min_distance, top_k)